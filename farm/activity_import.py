@@ -0,0 +1,320 @@
+import csv
+import io
+import json
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from . import crop_types
+from .forms import (
+    ActivityLogForm, PreparationLogForm, PlantingLogForm,
+    MaintenanceLogForm, HarvestingLogForm
+)
+from .models import (
+    Crop, Field, ActivityLog, PreparationLog, PlantingLog,
+    MaintenanceLog, HarvestingLog, CropMaintenanceSummary, FarmAnalyticsSnapshot, FarmCropVersion
+)
+from .dashboard import dashboard_cache
+from .signals import bump_crop_inputs
+
+class ActivityImportError(ValueError):
+    """Raised when an import file cannot be read at all"""
+
+class PreloadedChoiceField(forms.Field):
+    """Resolves a submitted key from a dict of preloaded objects instead of querying per row"""
+    default_error_messages = {
+        'invalid_choice': forms.ModelChoiceField.default_error_messages['invalid_choice'],
+    }
+
+    def __init__(self, choices_by_key, **kwargs):
+        super().__init__(**kwargs)
+        self.choices_by_key = choices_by_key
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.choices_by_key[str(value).strip()]
+        except KeyError:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
+class ImportFormMixin:
+    """
+    Runs a specialized log form against the importer's preloaded lookups.
+
+    The related field or crop is resolved from a dict, and the per-row
+    database checks of the model (foreign key existence, uniqueness) are
+    skipped since the importer enforces them for the whole file.
+    """
+    choice_field_name = None
+
+    def __init__(self, *args, choices=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields[self.choice_field_name] = PreloadedChoiceField(choices)
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        exclude.add(self.choice_field_name)
+        return exclude
+
+    def validate_unique(self):
+        pass
+
+class PreparationImportForm(ImportFormMixin, PreparationLogForm):
+    choice_field_name = 'field'
+
+class PlantingImportForm(ImportFormMixin, PlantingLogForm):
+    choice_field_name = 'field'
+
+class MaintenanceImportForm(ImportFormMixin, MaintenanceLogForm):
+    choice_field_name = 'crop'
+
+class HarvestingImportForm(ImportFormMixin, HarvestingLogForm):
+    choice_field_name = 'crop'
+
+IMPORT_FORMS = {
+    'preparation': PreparationImportForm,
+    'planting': PlantingImportForm,
+    'maintenance': MaintenanceImportForm,
+    'harvesting': HarvestingImportForm,
+}
+
+def parse_activity_file(file, file_format):
+    """
+    Read the rows of a CSV or JSON import file.
+
+    CSV files need a header row; JSON files hold a list of objects, or an
+    object with an "activities" list.
+
+    Returns: List of row dicts with lower-cased keys
+    """
+    content = file.read()
+    if isinstance(content, bytes):
+        try:
+            content = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ActivityImportError("The file must be UTF-8 encoded")
+
+    if file_format == 'csv':
+        rows = list(csv.DictReader(io.StringIO(content)))
+    elif file_format == 'json':
+        try:
+            rows = json.loads(content)
+        except ValueError as e:
+            raise ActivityImportError(f"Invalid JSON: {e}")
+        if isinstance(rows, dict):
+            rows = rows.get('activities')
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ActivityImportError("JSON imports must be a list of activity objects")
+    else:
+        raise ActivityImportError(f"Unsupported import format: {file_format}")
+
+    return [
+        {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+        for row in rows
+    ]
+
+class ActivityImporter:
+    """
+    Bulk import of activity logs into a farm.
+
+    Each row holds the fields of the activity log form and of the
+    specialized form of its activity type. `field` is a field id or an
+    unambiguous field name; `crop` is the id of an active crop or the
+    `ref` given to a planting row earlier in the same file, so a season
+    can be planted, maintained and harvested in one import.
+
+    Rows are validated with the regular activity forms and written with
+    bulk_create, one transaction per chunk. Invalid rows are reported and
+    skipped without aborting the rest of the file.
+    """
+
+    def __init__(self, farm, chunk_size=None):
+        self.farm = farm
+        self.chunk_size = chunk_size or getattr(settings, 'ACTIVITY_IMPORT_CHUNK_SIZE', 500)
+        self._load_lookups()
+
+    def _load_lookups(self):
+        """Preload the fields and active crops rows may refer to"""
+        fields = list(Field.objects.filter(farm=self.farm))
+        self.fields_by_key = {str(field.field_id): field for field in fields}
+        names = [field.name for field in fields]
+        for field in fields:
+            if names.count(field.name) == 1:
+                self.fields_by_key.setdefault(field.name, field)
+
+        self.crops_by_key = {
+            str(crop.crop_id): crop
+            for crop in Crop.objects.filter(field__farm=self.farm, is_harvested=False)
+        }
+
+    def import_rows(self, rows):
+        """
+        Import parsed rows.
+
+        Returns: Dictionary with the number of rows, created activities,
+        created crops and a list of {'row', 'errors'} entries for the rows
+        that were skipped
+        """
+        result = {'rows': len(rows), 'created': 0, 'crops_created': 0, 'errors': []}
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = list(enumerate(rows[start:start + self.chunk_size], start=start + 1))
+            self._import_chunk(chunk, result)
+        return result
+
+    def _import_chunk(self, chunk, result):
+        # The crops rows could refer to before this chunk, kept in case it is rolled back
+        crops_by_key = dict(self.crops_by_key)
+        plans = []
+        for number, row in chunk:
+            plan = self._plan_row(row)
+            if 'errors' in plan:
+                result['errors'].append({'row': number, 'errors': plan['errors']})
+            else:
+                plans.append((number, plan))
+
+        if not plans:
+            return
+
+        try:
+            with transaction.atomic():
+                crops_created = self._write(plan for _, plan in plans)
+        except DatabaseError as e:
+            # The chunk was rolled back: forget the crops it planted and undo
+            # the harvests it planned, keeping the crops of earlier chunks
+            self.crops_by_key = crops_by_key
+            kept = {id(crop) for crop in crops_by_key.values()}
+            for _, plan in plans:
+                crop = plan['harvested_crop']
+                if crop is not None and id(crop) in kept:
+                    crop.refresh_from_db(fields=['is_harvested', 'harvest_date', 'inputs_updated_at'])
+            for number, _ in plans:
+                result['errors'].append({'row': number, 'errors': {'__all__': [f"Could not be saved: {e}"]}})
+            result['errors'].sort(key=lambda error: error['row'])
+            return
+
+        result['created'] += len(plans)
+        result['crops_created'] += crops_created
+
+    def _plan_row(self, row):
+        """Validate a row and build the unsaved objects it creates"""
+        data = {key: '' if value is None else value for key, value in row.items()}
+        activity_type = str(data.get('activity_type', '')).strip()
+        data['activity_type'] = activity_type
+
+        activity_form = ActivityLogForm(data)
+        activity_valid = activity_form.is_valid()
+
+        specialized_form = None
+        form_class = IMPORT_FORMS.get(activity_type)
+        if form_class is not None:
+            choices = self.fields_by_key if form_class.choice_field_name == 'field' else self.crops_by_key
+            initial = {}
+            if activity_valid:
+                initial['activity_timestamp'] = activity_form.cleaned_data['timestamp']
+            specialized_form = form_class(data, choices=choices, initial=initial)
+
+        specialized_valid = specialized_form is None or specialized_form.is_valid()
+        if activity_type == 'planting' and activity_valid and specialized_valid:
+            # The form only checks this for existing logs; imported rows carry their own date
+            expected_harvest_date = specialized_form.cleaned_data.get('expected_harvest_date')
+            if expected_harvest_date and expected_harvest_date <= activity_form.cleaned_data['timestamp'].date():
+                specialized_form.add_error('expected_harvest_date', "Expected harvest date must be after planting date")
+                specialized_valid = False
+
+        ref = str(data.get('ref', '')).strip()
+        if activity_type == 'planting' and ref and ref in self.crops_by_key:
+            return {'errors': {'ref': [f"The crop reference {ref} is already used"]}}
+
+        if not (activity_valid and specialized_valid):
+            errors = {key: list(messages) for key, messages in activity_form.errors.items()}
+            if specialized_form is not None:
+                for key, messages in specialized_form.errors.items():
+                    errors.setdefault(key, []).extend(messages)
+            return {'errors': errors}
+
+        activity = activity_form.save(commit=False)
+        activity.farm = self.farm
+        plan = {'activity': activity, 'log': None, 'new_crop': None, 'harvested_crop': None}
+        if specialized_form is None:
+            return plan
+
+        log = specialized_form.save(commit=False)
+        log.activity_log = activity
+        plan['log'] = log
+        cleaned_data = specialized_form.cleaned_data
+
+        if activity_type == 'planting':
+            crop = Crop(
+                field=cleaned_data['field'],
+                crop_type=cleaned_data['crop_type'],
+                planting_date=activity.timestamp.date(),
+                expected_harvest_date=cleaned_data['expected_harvest_date'],
+                seed_variety=cleaned_data['seed_variety'],
+                planting_activity=log,
+                # bulk_create skips Crop.save(), which fills this in
+                crop_key=crop_types.crop_key(cleaned_data['crop_type'])
+            )
+            plan['new_crop'] = crop
+            if ref:
+                self.crops_by_key[ref] = crop
+        elif activity_type == 'harvesting':
+            crop = cleaned_data['crop']
+            crop.is_harvested = True
+            crop.harvest_date = activity.timestamp.date()
+            plan['harvested_crop'] = crop
+            # A harvested crop can no longer be maintained or harvested
+            for key in [key for key, value in self.crops_by_key.items() if value is crop]:
+                del self.crops_by_key[key]
+
+        return plan
+
+    def _write(self, plans):
+        """
+        Insert the planned objects of a chunk and apply the side effects the
+        per-object signals and save() would have had.
+
+        Returns: Number of crops created
+        """
+        plans = list(plans)
+        new_crops = [plan['new_crop'] for plan in plans if plan['new_crop'] is not None]
+        new_crop_ids = {crop.pk for crop in new_crops}
+        harvested_crops = [
+            plan['harvested_crop'] for plan in plans
+            if plan['harvested_crop'] is not None and plan['harvested_crop'].pk not in new_crop_ids
+        ]
+        logs_by_model = {}
+        for plan in plans:
+            if plan['log'] is not None:
+                logs_by_model.setdefault(type(plan['log']), []).append(plan['log'])
+
+        ActivityLog.objects.bulk_create([plan['activity'] for plan in plans], batch_size=self.chunk_size)
+        for model in (PreparationLog, PlantingLog):
+            model.objects.bulk_create(logs_by_model.get(model, []), batch_size=self.chunk_size)
+        # Crops reference their planting log and are referenced by maintenance and harvest logs
+        Crop.objects.bulk_create(new_crops, batch_size=self.chunk_size)
+        for model in (MaintenanceLog, HarvestingLog):
+            model.objects.bulk_create(logs_by_model.get(model, []), batch_size=self.chunk_size)
+
+        now = timezone.now()
+        for crop in harvested_crops:
+            crop.inputs_updated_at = now
+        Crop.objects.bulk_update(
+            harvested_crops, ['is_harvested', 'harvest_date', 'inputs_updated_at'], batch_size=self.chunk_size
+        )
+
+        maintained_crop_ids = {log.crop_id for log in logs_by_model.get(MaintenanceLog, [])}
+        if maintained_crop_ids:
+            CropMaintenanceSummary.rebuild(Crop.objects.filter(pk__in=maintained_crop_ids))
+            bump_crop_inputs(pk__in=maintained_crop_ids)
+        FarmAnalyticsSnapshot.mark_dirty(farm_id=self.farm.pk)
+        dashboard_cache.invalidate(self.farm.farmer_id)
+        if new_crops or harvested_crops:
+            FarmCropVersion.bump(
+                self.farm.pk, Crop.objects.filter(pk__in=[crop.pk for crop in new_crops + harvested_crops])
+            )
+
+        return len(new_crops)
@@ -0,0 +1,142 @@
+import base64
+import binascii
+import datetime
+import uuid
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .reports import FarmReportLoader
+
+class ActivityLogListing:
+    """
+    Filtered, keyset paginated listing of a farm's activity logs.
+
+    Activities are ordered newest first on (timestamp, log_id), and a page
+    is fetched by seeking past the cursor of the previous page's edge row
+    rather than with an OFFSET, so the (farm, timestamp, log_id) index
+    serves every page at the same cost however deep the user pages.
+    """
+
+    # Specialized logs are joined into the page query
+    RELATED = (
+        'preparationlog__field',
+        'plantinglog__field',
+        'plantinglog__crop',
+        'maintenancelog__crop',
+        'harvestinglog__crop'
+    )
+
+    @classmethod
+    def page_size(cls):
+        """Activities per page (ACTIVITY_LOG_PAGE_SIZE, default 25)"""
+        return getattr(settings, 'ACTIVITY_LOG_PAGE_SIZE', 25)
+
+    @classmethod
+    def filter(cls, activities, activity_type=None, date_from=None, date_to=None, field=None, crop=None):
+        """
+        Narrow an activity queryset by type, date range, field or crop.
+
+        A field matches the activities logged on it directly (preparation,
+        planting) and those of the crops grown on it (maintenance, harvest).
+        """
+        if activity_type:
+            activities = activities.filter(activity_type=activity_type)
+        # Bounds on the column itself rather than its date, so the index serves the range
+        if date_from:
+            activities = activities.filter(timestamp__gte=cls.start_of_day(date_from))
+        if date_to:
+            activities = activities.filter(timestamp__lt=cls.start_of_day(date_to + datetime.timedelta(days=1)))
+        if field:
+            activities = activities.filter(
+                Q(preparationlog__field=field) |
+                Q(plantinglog__field=field) |
+                Q(maintenancelog__crop__field=field) |
+                Q(harvestinglog__crop__field=field)
+            )
+        if crop:
+            activities = activities.filter(
+                Q(plantinglog__crop=crop) |
+                Q(maintenancelog__crop=crop) |
+                Q(harvestinglog__crop=crop)
+            )
+        return activities
+
+    @classmethod
+    def start_of_day(cls, date):
+        """Midnight of a date in the current time zone, as the timestamp__date lookup reads dates"""
+        start = datetime.datetime.combine(date, datetime.time.min)
+        if settings.USE_TZ:
+            start = timezone.make_aware(start)
+        return start
+
+    @classmethod
+    def page(cls, activities, after=None, before=None, page_size=None):
+        """
+        Fetch one page of activities.
+
+        Args:
+            activities: Filtered ActivityLog queryset
+            after: Cursor of the last row of the previous page, to page forward
+            before: Cursor of the first row of the next page, to page back
+            page_size: Defaults to page_size()
+
+        Returns: Dictionary with activities, next_cursor and previous_cursor
+        (None where there is no such page)
+        """
+        page_size = page_size or cls.page_size()
+        activities = activities.select_related(*cls.RELATED)
+
+        after = cls.decode_cursor(after)
+        before = cls.decode_cursor(before) if after is None else None
+
+        if before is not None:
+            timestamp, log_id = before
+            rows = list(activities.filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, log_id__gt=log_id)
+            ).order_by('timestamp', 'log_id')[:page_size + 1])
+            has_previous = len(rows) > page_size
+            rows = rows[:page_size][::-1]
+            has_next = True
+        else:
+            if after is not None:
+                timestamp, log_id = after
+                activities = activities.filter(
+                    Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, log_id__lt=log_id)
+                )
+            rows = list(activities.order_by('-timestamp', '-log_id')[:page_size + 1])
+            has_next = len(rows) > page_size
+            rows = rows[:page_size]
+            has_previous = after is not None
+
+        for activity in rows:
+            activity.detail = FarmReportLoader.activity_detail(activity)
+
+        return {
+            'activities': rows,
+            'next_cursor': cls.encode_cursor(rows[-1]) if rows and has_next else None,
+            'previous_cursor': cls.encode_cursor(rows[0]) if rows and has_previous else None,
+        }
+
+    @classmethod
+    def encode_cursor(cls, activity):
+        """Opaque cursor of an activity's position in the listing"""
+        raw = f"{activity.timestamp.isoformat()}|{activity.log_id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @classmethod
+    def decode_cursor(cls, cursor):
+        """
+        Decode a cursor back into its (timestamp, log_id) pair.
+
+        Returns: The pair, or None for a missing or malformed cursor
+        """
+        if not cursor:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            timestamp, log_id = raw.split('|')
+            return datetime.datetime.fromisoformat(timestamp), uuid.UUID(log_id)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
@@ -1,7 +1,9 @@
 from django.contrib import admin
 from .models import (
     Farm, FarmCondition, Field, Crop, ActivityLog, ActivityLogField,
-    PreparationLog, PlantingLog, MaintenanceLog, HarvestingLog
+    PreparationLog, PlantingLog, MaintenanceLog, HarvestingLog,
+    CropMaintenanceSummary, FarmAnalyticsSnapshot, FarmCropVersion, FarmPortfolioJob, FarmReportJob,
+    FarmConditionReading, FarmConditionRollup, SensorToken, PredictionParameterSet
 )
 
 class FarmConditionInline(admin.StackedInline):
@@ -32,8 +34,8 @@ class FieldAdmin(admin.ModelAdmin):
 
 @admin.register(Crop)
 class CropAdmin(admin.ModelAdmin):
-    list_display = ('crop_type', 'field', 'planting_date', 'expected_harvest_date', 'is_harvested')
-    list_filter = ('planting_date', 'expected_harvest_date', 'is_harvested')
+    list_display = ('crop_type', 'field', 'planting_date', 'expected_harvest_date', 'predicted_harvest_date', 'is_harvested')
+    list_filter = ('planting_date', 'expected_harvest_date', 'predicted_harvest_date', 'is_harvested')
     search_fields = ('crop_type', 'field__name', 'field__farm__name')
 
 class ActivityLogFieldInline(admin.TabularInline):
@@ -59,6 +61,64 @@ class PlantingLogAdmin(admin.ModelAdmin):
 class MaintenanceLogAdmin(admin.ModelAdmin):
     list_display = ('activity_log', 'crop', 'pesticide_applied', 'irrigation_amount', 'fertilizer_applied')
 
+@admin.register(CropMaintenanceSummary)
+class CropMaintenanceSummaryAdmin(admin.ModelAdmin):
+    list_display = ('crop', 'maintenance_count', 'total_fertilizer', 'total_irrigation', 'total_pesticide', 'last_maintenance_at')
+
+@admin.register(FarmAnalyticsSnapshot)
+class FarmAnalyticsSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('farm', 'data_version', 'is_dirty', 'dirtied_at', 'refreshed_at')
+    list_filter = ('is_dirty',)
+
+@admin.register(FarmCropVersion)
+class FarmCropVersionAdmin(admin.ModelAdmin):
+    list_display = ('farm', 'version', 'removed_version')
+
 @admin.register(HarvestingLog)
 class HarvestingLogAdmin(admin.ModelAdmin):
-    list_display = ('activity_log', 'crop', 'yield_amount', 'harvest_quality')
\ No newline at end of file
+    list_display = ('activity_log', 'crop', 'yield_amount', 'harvest_quality')
+
+@admin.register(FarmReportJob)
+class FarmReportJobAdmin(admin.ModelAdmin):
+    list_display = ('farm', 'data_version', 'status', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('farm__name',)
+
+@admin.register(FarmPortfolioJob)
+class FarmPortfolioJobAdmin(admin.ModelAdmin):
+    list_display = ('farmer', 'status', 'created_at', 'finished_at')
+    list_filter = ('status',)
+
+@admin.register(FarmConditionReading)
+class FarmConditionReadingAdmin(admin.ModelAdmin):
+    list_display = ('farm', 'recorded_at', 'soil_ph', 'soil_moisture', 'rainfall', 'max_daily_temp', 'day_length')
+    list_filter = ('recorded_at',)
+    search_fields = ('farm__name',)
+
+@admin.register(FarmConditionRollup)
+class FarmConditionRollupAdmin(admin.ModelAdmin):
+    list_display = ('farm', 'resolution', 'period_start', 'sample_count')
+    list_filter = ('resolution',)
+    search_fields = ('farm__name',)
+
+@admin.register(SensorToken)
+class SensorTokenAdmin(admin.ModelAdmin):
+    list_display = ('name', 'farm', 'is_active', 'created_at')
+    list_filter = ('is_active',)
+    search_fields = ('name', 'farm__name')
+    readonly_fields = ('token_hash',)
+
+
+@admin.register(PredictionParameterSet)
+class PredictionParameterSetAdmin(admin.ModelAdmin):
+    list_display = ('version', 'is_active', 'created_at', 'activated_at')
+    list_filter = ('is_active',)
+    readonly_fields = ('version', 'parameters', 'metrics', 'is_active', 'created_at', 'activated_at')
+    actions = ['activate']
+    
+    @admin.action(description="Activate the selected parameter set")
+    def activate(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one parameter set to activate", level='error')
+            return
+        queryset.get().activate()
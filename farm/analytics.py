@@ -0,0 +1,226 @@
+import datetime
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Avg, Count, F, Q, Sum, Window
+from django.db.models.functions import RowNumber, TruncMonth
+from django.utils import timezone
+
+from .models import ActivityLog, Crop, FarmAnalyticsSnapshot
+
+class FarmAnalytics:
+    """
+    Builds the analytics shown on the farm detail page.
+
+    Every section is answered by a single grouped or aggregated query, so
+    the number of queries stays the same no matter how many fields, crops
+    or activities a farm has. The plain-data sections can also be served
+    from the farm's FarmAnalyticsSnapshot.
+    """
+
+    # Window used for the monthly activity trend chart
+    TREND_DAYS = 180
+
+    @classmethod
+    def for_farm(cls, farm, today=None):
+        """
+        Assemble the analytics dict for a farm from live queries.
+
+        Returns: Dictionary with activity_counts, crop_type_counts,
+        harvest_stats, field_stats, field_latest_activities,
+        monthly_activity_data and maintenance_status
+        """
+        today = today or timezone.now().date()
+        analytics = cls.snapshot_data(farm, today)
+        analytics.update(cls._live_sections(farm, today))
+        return analytics
+
+    @classmethod
+    def from_snapshot(cls, farm, now=None):
+        """
+        Assemble the analytics dict for a farm, reading the snapshot sections
+        from the farm's FarmAnalyticsSnapshot and rebuilding it first if it
+        is missing or stale.
+
+        Returns: The same dictionary as for_farm
+        """
+        now = now or timezone.now()
+        snapshot = FarmAnalyticsSnapshot.objects.filter(farm=farm).first()
+        if snapshot is None or snapshot.is_stale(cls.max_staleness(), now):
+            snapshot = cls.refresh_snapshot(farm, snapshot, now)
+
+        analytics = dict(snapshot.data)
+        analytics.update(cls._live_sections(farm, now.date()))
+        return analytics
+
+    @classmethod
+    def snapshot_data(cls, farm, today):
+        """Compute the sections stored in the snapshot, as JSON-serializable data"""
+        return {
+            'activity_counts': cls._activity_counts(farm),
+            'crop_type_counts': list(
+                Crop.objects.filter(field__farm=farm).values('crop_type')
+                .annotate(count=Count('crop_type')).order_by('-count', 'crop_type')
+            ),
+            'harvest_stats': cls._harvest_stats(Crop.objects.filter(field__farm=farm)),
+            'field_stats': cls._field_stats(farm),
+            'monthly_activity_data': cls._monthly_activity_data(farm, today),
+        }
+
+    @classmethod
+    def refresh_snapshot(cls, farm, snapshot=None, now=None):
+        """
+        Recompute and store the analytics snapshot of a farm.
+
+        The dirty flag is only cleared if no write bumped the data version
+        while the snapshot was being computed, so a concurrent change is
+        never lost.
+
+        Returns: The refreshed FarmAnalyticsSnapshot
+        """
+        now = now or timezone.now()
+        if snapshot is None:
+            snapshot, _ = FarmAnalyticsSnapshot.objects.get_or_create(farm=farm)
+
+        data = cls.snapshot_data(farm, now.date())
+        cleared = FarmAnalyticsSnapshot.objects.filter(
+            farm=farm, data_version=snapshot.data_version
+        ).update(data=data, is_dirty=False, dirtied_at=None, refreshed_at=now)
+        if not cleared:
+            FarmAnalyticsSnapshot.objects.filter(farm=farm).update(data=data, refreshed_at=now)
+
+        snapshot.data = data
+        snapshot.refreshed_at = now
+        if cleared:
+            snapshot.is_dirty = False
+            snapshot.dirtied_at = None
+        return snapshot
+
+    @classmethod
+    def max_staleness(cls):
+        """How long a dirty snapshot may still be served (FARM_ANALYTICS_MAX_STALENESS seconds)"""
+        return datetime.timedelta(seconds=getattr(settings, 'FARM_ANALYTICS_MAX_STALENESS', 0))
+
+    @classmethod
+    def _live_sections(cls, farm, today):
+        """Sections holding model instances, which are always read live"""
+        return {
+            'field_latest_activities': cls._field_latest_activities(farm),
+            'maintenance_status': cls._maintenance_status(Crop.objects.filter(field__farm=farm), today),
+        }
+
+    @classmethod
+    def _activity_counts(cls, farm):
+        """Count activities per type, with zero for types that were never logged"""
+        activity_counts = {activity_type: 0 for activity_type, _ in ActivityLog.ACTIVITY_CHOICES}
+        grouped = farm.activities.values('activity_type').annotate(count=Count('log_id')).order_by()
+        for item in grouped:
+            activity_counts[item['activity_type']] = item['count']
+        return activity_counts
+
+    @classmethod
+    def _harvest_stats(cls, crops):
+        """Total and average yield of harvested crops in one conditional aggregate"""
+        harvested = Q(is_harvested=True)
+        stats = crops.aggregate(
+            harvest_count=Count('pk', filter=harvested),
+            total_yield=Sum('harvest_activity__yield_amount', filter=harvested),
+            avg_yield=Avg('harvest_activity__yield_amount', filter=harvested),
+        )
+        if not stats['harvest_count']:
+            return {}
+
+        return {
+            'total_yield': stats['total_yield'] or 0,
+            'avg_yield': stats['avg_yield'] or 0,
+            'harvest_count': stats['harvest_count']
+        }
+
+    @classmethod
+    def _field_stats(cls, farm):
+        """Field count, total area and the share of the farm it covers"""
+        stats = farm.fields.aggregate(total_area=Sum('size'), count=Count('pk'))
+        total_field_area = stats['total_area'] or 0
+        if not stats['count'] or total_field_area <= 0:
+            return {}
+
+        return {
+            'total_area': total_field_area,
+            'utilization': (total_field_area / farm.size) * 100 if farm.size > 0 else 0,
+            'count': stats['count']
+        }
+
+    @classmethod
+    def _field_latest_activities(cls, farm):
+        """
+        Most recent preparation activity for each field.
+
+        PostgreSQL answers this with DISTINCT ON; other databases pick the
+        first row of each field partition with ROW_NUMBER().
+        """
+        activities = ActivityLog.objects.filter(
+            farm=farm,
+            preparationlog__field__isnull=False
+        ).select_related('preparationlog__field')
+
+        if connection.features.can_distinct_on_fields:
+            latest = activities.order_by(
+                'preparationlog__field', '-timestamp'
+            ).distinct('preparationlog__field')
+        else:
+            latest = activities.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=F('preparationlog__field'),
+                    order_by=F('timestamp').desc()
+                )
+            ).filter(row_number=1)
+
+        field_latest_activities = [
+            {'field': activity.preparationlog.field, 'activity': activity}
+            for activity in latest
+        ]
+        field_latest_activities.sort(key=lambda entry: entry['field'].name)
+        return field_latest_activities
+
+    @classmethod
+    def _monthly_activity_data(cls, farm, today):
+        """Activity counts per month over the trend window, formatted for the chart"""
+        start_date = today - datetime.timedelta(days=cls.TREND_DAYS)
+        monthly_activities = farm.activities.filter(
+            timestamp__date__gte=start_date,
+            timestamp__date__lte=today
+        ).annotate(
+            month=TruncMonth('timestamp')
+        ).values('month').annotate(
+            count=Count('log_id')
+        ).order_by('month')
+
+        months = []
+        counts = []
+        for entry in monthly_activities:
+            months.append(entry['month'].strftime('%b %Y'))
+            counts.append(entry['count'])
+
+        return {
+            'months': months,
+            'counts': counts
+        }
+
+    @classmethod
+    def _maintenance_status(cls, crops, today):
+        """Days since the last maintenance for each maintained active crop"""
+        maintained_crops = crops.filter(
+            is_harvested=False,
+            maintenance_summary__last_maintenance_at__isnull=False
+        ).select_related('maintenance_summary', 'field')
+
+        maintenance_status = []
+        for crop in maintained_crops:
+            last_maintenance = crop.maintenance_summary.last_maintenance_at.date()
+            maintenance_status.append({
+                'crop': crop,
+                'days_since_maintenance': (today - last_maintenance).days,
+                'last_maintenance_date': last_maintenance
+            })
+        return maintenance_status
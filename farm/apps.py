@@ -3,4 +3,9 @@ from django.apps import AppConfig
 class FarmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'farm'
-    verbose_name = 'Farm Management'
\ No newline at end of file
+    verbose_name = 'Farm Management'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa: F401
+        from . import checks  # noqa: F401
@@ -0,0 +1,348 @@
+import datetime
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+
+from . import crop_types, prediction_rules
+from .harvest_prediction import HarvestPredictionSystem
+from .models import Crop, FarmConditionReading, FarmConditionRollup, PredictionParameterSet
+
+METRICS = HarvestPredictionSystem.CONDITION_COLUMNS
+
+# Every crop key with a growing period of its own, '' for crops of unknown type
+GROWING_PERIOD_KEYS = tuple(HarvestPredictionSystem.BASE_GROWING_PERIODS) + ('',)
+
+class HarvestBacktest:
+    """
+    Backtest and calibration of the harvest prediction rules against the
+    harvests that actually happened.
+
+    Every harvested crop is replayed as of its harvest: with the
+    maintenance logged up to the harvest date and the average farm
+    conditions of its season, read from the condition history. Readings
+    the history does not hold for the season count as not recorded.
+
+    A prediction is its crop's growing period plus one adjustment per rule
+    that applies, so it is linear in the rule set's values. Each replayed
+    crop becomes a row of a 0/1 design matrix marking the growing period
+    and the table segments it used, and the values are refitted with
+    ridge-regularized least squares towards the current rules. Crops are
+    processed in chunks of farms, and only the normal equations and one
+    row of segment indexes per crop are kept, so memory stays small over
+    the full harvest history.
+    """
+
+    @classmethod
+    def chunk_size(cls):
+        """Farms replayed per chunk (PREDICTION_BACKTEST_CHUNK_SIZE, default 200)"""
+        return getattr(settings, 'PREDICTION_BACKTEST_CHUNK_SIZE', 200)
+
+    @classmethod
+    def run(cls, crops=None, rules=None, fit=False, regularization=10.0):
+        """
+        Replay the harvested crops and measure the prediction errors.
+
+        Args:
+            crops: Optional Crop queryset to backtest (defaults to all crops)
+            rules: RuleSet to backtest (defaults to the active rules)
+            fit: Whether to also fit new rule values
+            regularization: Weight pulling fitted values towards `rules`,
+                in crops; higher values need more evidence to move a value
+
+        Returns: Dictionary with the number of samples, the errors per crop
+        key (see error_stats), and with fit, the fitted parameters and the
+        errors they give
+        """
+        rules = rules or HarvestPredictionSystem.rules()
+        layout = ParameterLayout(rules)
+        crops = Crop.objects.all() if crops is None else crops
+        crops = crops.filter(is_harvested=True, planting_date__isnull=False, harvest_date__isnull=False)
+
+        slots, actual, key_indexes = [], [], []
+        gram = np.zeros((layout.size, layout.size))
+        moment = np.zeros(layout.size)
+
+        farm_ids = list(crops.values_list('field__farm_id', flat=True).distinct().order_by('field__farm_id'))
+        for start in range(0, len(farm_ids), cls.chunk_size()):
+            columns = cls.replay(crops.filter(field__farm_id__in=farm_ids[start:start + cls.chunk_size()]))
+            if not len(columns['actual_days']):
+                continue
+            chunk_slots = layout.slots(columns)
+            if fit:
+                design = layout.design_matrix(chunk_slots)
+                gram += design.T @ design
+                moment += design.T @ columns['actual_days']
+            slots.append(chunk_slots)
+            actual.append(columns['actual_days'])
+            key_indexes.append(columns['key_index'])
+
+        if not slots:
+            return {'samples': 0, 'rules_version': rules.version, 'errors': {}}
+
+        slots = np.concatenate(slots)
+        actual = np.concatenate(actual)
+        key_indexes = np.concatenate(key_indexes)
+
+        report = {
+            'samples': len(actual),
+            'rules_version': rules.version,
+            'errors': cls.error_stats(layout.predict(slots, layout.values), actual, key_indexes),
+        }
+        if fit:
+            fitted = cls.fit(gram, moment, layout.values, regularization)
+            report['parameters'] = layout.parameters(fitted)
+            report['fitted_errors'] = cls.error_stats(layout.predict(slots, fitted), actual, key_indexes)
+        return report
+
+    @classmethod
+    def calibrate(cls, crops=None, regularization=10.0, activate=False):
+        """
+        Fit new rule values and store them as the next PredictionParameterSet.
+
+        Returns: Tuple of (PredictionParameterSet, backtest report)
+        """
+        report = cls.run(crops, fit=True, regularization=regularization)
+        if not report['samples']:
+            return None, report
+        parameter_set = PredictionParameterSet.create_version(report['parameters'], metrics={
+            'samples': report['samples'],
+            'fitted_from': report['rules_version'],
+            'errors_before': report['errors'],
+            'errors_after': report['fitted_errors'],
+        })
+        if activate:
+            parameter_set.activate()
+        return parameter_set, report
+
+    @classmethod
+    def fit(cls, gram, moment, prior, regularization):
+        """
+        Solve the ridge-regularized normal equations
+        (XᵀX + λI)θ = Xᵀy + λθ₀, rounding the result to whole days.
+        """
+        size = len(prior)
+        solution = np.linalg.solve(gram + regularization * np.eye(size), moment + regularization * prior)
+        return np.rint(solution)
+
+    @classmethod
+    def error_stats(cls, predicted, actual, key_indexes):
+        """
+        Distribution of the prediction errors (predicted minus actual days)
+        per crop key, plus 'all' across every crop. Crops of unknown type
+        are reported under 'other'.
+
+        Returns: Dictionary of key to {count, bias, mae, rmse, p50, p90},
+        the percentiles of the absolute error
+        """
+        errors = predicted - actual
+
+        def stats(values):
+            absolute = np.abs(values)
+            return {
+                'count': int(len(values)),
+                'bias': round(float(values.mean()), 2),
+                'mae': round(float(absolute.mean()), 2),
+                'rmse': round(float(np.sqrt((values ** 2).mean())), 2),
+                'p50': round(float(np.percentile(absolute, 50)), 2),
+                'p90': round(float(np.percentile(absolute, 90)), 2),
+            }
+
+        report = {'all': stats(errors)}
+        for index in np.unique(key_indexes):
+            report[GROWING_PERIOD_KEYS[index] or 'other'] = stats(errors[key_indexes == index])
+        return report
+
+    @classmethod
+    def replay(cls, crops):
+        """
+        The prediction inputs of harvested crops as of their harvest date,
+        and their actual growing periods.
+
+        Returns: Dictionary of numpy columns, one entry per crop
+        """
+        as_of_harvest = Q(maintenance_activities__activity_log__timestamp__date__lte=F('harvest_date'))
+        rows = list(crops.annotate(
+            as_of_count=Count('maintenance_activities', filter=as_of_harvest),
+            as_of_fertilizer=Sum('maintenance_activities__fertilizer_applied', filter=as_of_harvest),
+            as_of_irrigation=Sum('maintenance_activities__irrigation_amount', filter=as_of_harvest),
+            as_of_pesticide=Sum('maintenance_activities__pesticide_applied', filter=as_of_harvest),
+        ).values_list(
+            'field__farm_id', 'crop_key', 'crop_type', 'planting_date', 'harvest_date',
+            'as_of_count', 'as_of_fertilizer', 'as_of_irrigation', 'as_of_pesticide'
+        ))
+        # A harvest on or before planting is bad data, not a growing period
+        rows = [row for row in rows if row[4] > row[3]]
+
+        planting = np.array([row[3].toordinal() for row in rows], dtype=np.int64)
+        harvest = np.array([row[4].toordinal() for row in rows], dtype=np.int64)
+        crop_keys = [row[1] or crop_types.resolve(row[2]) or '' for row in rows]
+        columns = {
+            'actual_days': (harvest - planting).astype(float),
+            'key_index': np.array(
+                [GROWING_PERIOD_KEYS.index(key) if key in GROWING_PERIOD_KEYS else len(GROWING_PERIOD_KEYS) - 1 for key in crop_keys],
+                dtype=np.int64
+            ),
+            'temperature_profile': np.array(
+                [HarvestPredictionSystem._temperature_profile(key) for key in crop_keys], dtype=np.int64
+            ),
+            'maintenance_count': np.array([row[5] for row in rows], dtype=float),
+            'total_fertilizer': np.array([row[6] or 0 for row in rows], dtype=float),
+            'total_irrigation': np.array([row[7] or 0 for row in rows], dtype=float),
+            'total_pesticide': np.array([row[8] or 0 for row in rows], dtype=float),
+            'days_since_planting': (harvest - planting).astype(float),
+        }
+        columns.update(cls._season_conditions([row[0] for row in rows], planting, harvest))
+        return columns
+
+    @classmethod
+    def _season_conditions(cls, farm_ids, planting, harvest):
+        """
+        Average of every condition metric over each crop's season, from
+        per-farm daily prefix sums of the condition history.
+
+        Returns: Dictionary of metric to column, NaN where the history holds
+        no reading for the season
+        """
+        conditions = {metric: np.full(len(farm_ids), np.nan) for metric in METRICS}
+        if not farm_ids:
+            return conditions
+
+        days = cls._daily_history(set(farm_ids))
+        farm_column = np.array([str(farm_id) for farm_id in farm_ids])
+        for farm_id, farm_days in days.items():
+            rows = np.flatnonzero(farm_column == str(farm_id))
+            if not len(rows):
+                continue
+            ordinals = np.array(sorted(farm_days), dtype=np.int64)
+            # [count, sum] of every metric per day, prefixed with a zero row
+            sums = np.zeros((len(ordinals) + 1, 2, len(METRICS)))
+            sums[1:] = np.cumsum([farm_days[ordinal] for ordinal in ordinals], axis=0)
+            start = np.searchsorted(ordinals, planting[rows], side='left')
+            end = np.searchsorted(ordinals, harvest[rows], side='right')
+            season = sums[end] - sums[start]
+            counts, values = season[:, 0], season[:, 1]
+            averages = np.where(counts > 0, values / np.where(counts > 0, counts, 1), np.nan)
+            for index, metric in enumerate(METRICS):
+                conditions[metric][rows] = averages[:, index]
+        return conditions
+
+    @classmethod
+    def _daily_history(cls, farm_ids):
+        """
+        The condition history of farms merged into days across all tiers.
+
+        Returns: Dictionary of farm id to {date ordinal: [counts, sums]}
+        arrays of shape (2, metrics)
+        """
+        days = {}
+
+        def add(farm_id, day, counts, sums):
+            farm_days = days.setdefault(farm_id, {})
+            day = day.toordinal()
+            if day not in farm_days:
+                farm_days[day] = np.zeros((2, len(METRICS)))
+            farm_days[day][0] += counts
+            farm_days[day][1] += sums
+
+        aggregates = {}
+        for metric in METRICS:
+            aggregates[f'{metric}_count'] = Count(metric)
+            aggregates[f'{metric}_sum'] = Sum(metric)
+        readings = FarmConditionReading.objects.filter(farm_id__in=farm_ids).annotate(
+            day=TruncDate('recorded_at', tzinfo=datetime.timezone.utc)
+        ).values('farm_id', 'day').annotate(**aggregates).order_by()
+        for row in readings.iterator():
+            add(
+                row['farm_id'], row['day'],
+                [row[f'{metric}_count'] for metric in METRICS],
+                [row[f'{metric}_sum'] or 0 for metric in METRICS]
+            )
+
+        rollups = FarmConditionRollup.objects.filter(farm_id__in=farm_ids).values_list('farm_id', 'period_start', 'stats')
+        for farm_id, period_start, stats in rollups.iterator():
+            add(
+                farm_id, period_start.astimezone(datetime.timezone.utc).date(),
+                [stats[metric][0] if metric in stats else 0 for metric in METRICS],
+                [stats[metric][1] if metric in stats else 0 for metric in METRICS]
+            )
+        return days
+
+class ParameterLayout:
+    """
+    Lays the values of a RuleSet out as one parameter vector: the growing
+    period of every crop key, the no-maintenance adjustment, then the
+    segment values of every table. A replayed crop uses at most one
+    parameter per slot (its growing period, the no-maintenance adjustment
+    and one segment per table), so the crops are stored as rows of
+    parameter indexes, with `size` marking an unused slot.
+    """
+
+    MAINTENANCE_TABLES = ('fertilizer', 'irrigation', 'pesticide')
+    CONDITION_TABLES = ('soil_ph', 'soil_moisture', 'rainfall', 'day_length')
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.offsets = {}
+        values = [HarvestPredictionSystem._base_growing_period(key or None, rules) for key in GROWING_PERIOD_KEYS]
+        self.no_maintenance = len(values)
+        values.append(rules.no_maintenance)
+        for name in prediction_rules.RuleSet.TABLE_NAMES:
+            self.offsets[name] = len(values)
+            values.extend(rules.tables[name].values.tolist())
+        self.values = np.array(values, dtype=float)
+        self.size = len(values)
+
+    def slots(self, columns):
+        """Parameter indexes used by every replayed crop, one row per crop"""
+        unused = self.size
+        tables = self.rules.tables
+        count = columns['maintenance_count']
+        maintained = count > 0
+        safe_count = np.where(maintained, count, 1)
+
+        slots = [columns['key_index'], np.where(maintained, unused, self.no_maintenance)]
+        for name in self.MAINTENANCE_TABLES:
+            totals = columns[f'total_{name}']
+            segment = self.offsets[name] + tables[name].segments(totals / safe_count)
+            slots.append(np.where(maintained & (totals > 0), segment, unused))
+
+        days = columns['days_since_planting']
+        frequency = count / np.where(days > 0, days, 1) * 30
+        segment = self.offsets['frequency'] + tables['frequency'].segments(frequency)
+        slots.append(np.where(maintained & (days > 0), segment, unused))
+
+        temperature = columns['max_daily_temp']
+        segment = np.choose(columns['temperature_profile'], [
+            self.offsets[f'temperature_{profile}'] + table.segments(temperature)
+            for profile, table in zip(prediction_rules.TEMPERATURE_PROFILES, self.rules.temperature_tables)
+        ])
+        slots.append(np.where(np.isnan(temperature), unused, segment))
+
+        for name in self.CONDITION_TABLES:
+            segment = self.offsets[name] + tables[name].segments(columns[name])
+            slots.append(np.where(np.isnan(columns[name]), unused, segment))
+        return np.stack(slots, axis=1).astype(np.int16)
+
+    def design_matrix(self, slots):
+        """The 0/1 design matrix of rows of parameter indexes"""
+        design = np.zeros((len(slots), self.size + 1))
+        np.put_along_axis(design, slots, 1, axis=1)
+        return design[:, :self.size]
+
+    def predict(self, slots, values):
+        """Predicted growing periods of rows of parameter indexes"""
+        return np.append(values, 0)[slots].sum(axis=1)
+
+    def parameters(self, values):
+        """A parameter vector as RuleSet parameters"""
+        values = [int(value) for value in values]
+        return {
+            'growing_periods': dict(zip(GROWING_PERIOD_KEYS, values[:self.no_maintenance])),
+            'no_maintenance': values[self.no_maintenance],
+            'tables': {
+                name: values[self.offsets[name]:self.offsets[name] + len(self.rules.tables[name].values)]
+                for name in prediction_rules.RuleSet.TABLE_NAMES
+            },
+        }
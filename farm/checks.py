@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+@register(Tags.caches, deploy=True)
+def check_dashboard_cache(app_configs, **kwargs):
+    """
+    Dashboard summaries are invalidated by whichever process writes the
+    data, so every process must read them from the same cache
+    """
+    alias = getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')
+    if isinstance(caches[alias], LocMemCache):
+        return [Warning(
+            f"The dashboard cache '{alias}' is local to each process.",
+            hint=(
+                "Point DASHBOARD_CACHE_ALIAS at a cache shared by every process (e.g. Redis or "
+                "Memcached). Otherwise writes made in other processes, such as the import_activities "
+                "command, only show up once the cached summaries expire."
+            ),
+            id='farm.W001',
+        )]
+    return []
@@ -0,0 +1,260 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncHour
+
+from .models import FarmCondition, FarmConditionReading, FarmConditionRollup
+
+METRICS = FarmConditionReading.METRICS
+
+class FarmConditionHistory:
+    """
+    Condition history of farms, stored in three tiers: raw readings for the
+    recent past, hourly rollups after FARM_CONDITION_RAW_RETENTION and daily
+    rollups after FARM_CONDITION_HOURLY_RETENTION. Every reading lives in
+    exactly one tier, so range queries read each tier once without double
+    counting. The latest values stay on the farm's FarmCondition row.
+    """
+
+    @classmethod
+    def raw_retention(cls):
+        """How long raw readings are kept (FARM_CONDITION_RAW_RETENTION seconds, default 7 days)"""
+        return datetime.timedelta(seconds=getattr(settings, 'FARM_CONDITION_RAW_RETENTION', 7 * 86400))
+
+    @classmethod
+    def hourly_retention(cls):
+        """How long hourly rollups are kept (FARM_CONDITION_HOURLY_RETENTION seconds, default 90 days)"""
+        return datetime.timedelta(seconds=getattr(settings, 'FARM_CONDITION_HOURLY_RETENTION', 90 * 86400))
+
+    @classmethod
+    def record(cls, condition):
+        """Append the current values of a FarmCondition to the history, unless it is empty"""
+        reading = FarmConditionReading.from_condition(condition)
+        if reading.has_values():
+            reading.save()
+        return reading
+
+    @classmethod
+    def latest(cls, farm):
+        """The latest conditions of a farm, read from its single FarmCondition row"""
+        return FarmCondition.objects.filter(farm=farm).first()
+
+    @classmethod
+    def readings(cls, farm, start, end):
+        """Raw readings of a farm recorded in [start, end), oldest first"""
+        return FarmConditionReading.objects.filter(
+            farm=farm,
+            recorded_at__gte=start,
+            recorded_at__lt=end
+        ).order_by('recorded_at')
+
+    @classmethod
+    def series(cls, farm, start, end):
+        """
+        The condition history of a farm in [start, end) at the finest
+        resolution still stored for each part of the range.
+
+        Returns: List of points, oldest first, each a dict with time,
+        resolution ('day', 'hour' or 'raw'), samples and the value (or
+        period average) of every metric
+        """
+        points = []
+        rollups = FarmConditionRollup.objects.filter(
+            farm=farm,
+            period_start__gte=start,
+            period_start__lt=end
+        )
+        for rollup in rollups:
+            point = {'time': rollup.period_start, 'resolution': rollup.resolution, 'samples': rollup.sample_count}
+            point.update(rollup.averages())
+            points.append(point)
+
+        for reading in cls.readings(farm, start, end).values('recorded_at', *METRICS):
+            point = {'time': reading.pop('recorded_at'), 'resolution': 'raw', 'samples': 1}
+            point.update(reading)
+            points.append(point)
+
+        points.sort(key=lambda point: point['time'])
+        return points
+
+    @classmethod
+    def summary(cls, farm, start, end):
+        """
+        Count, average, minimum and maximum of every metric of a farm over
+        [start, end), combined across all tiers.
+
+        Returns: Dictionary of metric to {count, avg, min, max}, None for
+        metrics without samples
+        """
+        raw = cls.readings(farm, start, end).aggregate(**cls._stat_aggregates())
+        stats = {metric: cls._aggregated_stats(raw, metric) for metric in METRICS}
+
+        rollups = FarmConditionRollup.objects.filter(
+            farm=farm,
+            period_start__gte=start,
+            period_start__lt=end
+        ).values_list('stats', flat=True)
+        for rollup_stats in rollups:
+            for metric in METRICS:
+                stats[metric] = cls.merge_stats(stats[metric], rollup_stats.get(metric))
+
+        return {
+            metric: {
+                'count': values[0],
+                'avg': values[1] / values[0],
+                'min': values[2],
+                'max': values[3]
+            } if values else None
+            for metric, values in stats.items()
+        }
+
+    @classmethod
+    def rollup(cls, now=None):
+        """
+        Fold expired raw readings into hourly rollups and expired hourly
+        rollups into daily rollups, deleting what was folded.
+
+        Only whole periods are folded, and rows added after a pass started
+        are left for the next pass.
+
+        Returns: Dictionary with the number of readings and hourly rollups
+        that were folded
+        """
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        hour_cutoff = cls._floor(now - cls.raw_retention(), FarmConditionRollup.RESOLUTION_HOUR)
+        day_cutoff = cls._floor(now - cls.hourly_retention(), FarmConditionRollup.RESOLUTION_DAY)
+
+        return {
+            'readings': cls._rollup_readings(hour_cutoff),
+            'hourly': cls._rollup_hours(day_cutoff),
+        }
+
+    @classmethod
+    def merge_stats(cls, a, b):
+        """Merge two [count, sum, min, max] lists, either of which may be empty"""
+        if not a:
+            return list(b) if b else None
+        if not b:
+            return a
+        return [a[0] + b[0], a[1] + b[1], min(a[2], b[2]), max(a[3], b[3])]
+
+    @classmethod
+    def _rollup_readings(cls, cutoff):
+        expired = FarmConditionReading.objects.filter(recorded_at__lt=cutoff)
+        with transaction.atomic():
+            last_pk = expired.aggregate(last_pk=Max('pk'))['last_pk']
+            if last_pk is None:
+                return 0
+            expired = expired.filter(pk__lte=last_pk)
+
+            grouped = expired.annotate(
+                period=TruncHour('recorded_at', tzinfo=datetime.timezone.utc)
+            ).values('farm_id', 'period').annotate(
+                samples=Count('pk'),
+                **cls._stat_aggregates()
+            ).order_by()
+
+            periods = {
+                (row['farm_id'], row['period']): (
+                    row['samples'],
+                    {metric: cls._aggregated_stats(row, metric) for metric in METRICS}
+                )
+                for row in grouped
+            }
+            cls._merge_into(FarmConditionRollup.RESOLUTION_HOUR, periods)
+            count, _ = expired.delete()
+        return count
+
+    @classmethod
+    def _rollup_hours(cls, cutoff):
+        expired = FarmConditionRollup.objects.filter(
+            resolution=FarmConditionRollup.RESOLUTION_HOUR,
+            period_start__lt=cutoff
+        )
+        with transaction.atomic():
+            last_pk = expired.aggregate(last_pk=Max('pk'))['last_pk']
+            if last_pk is None:
+                return 0
+            expired = expired.filter(pk__lte=last_pk)
+
+            periods = {}
+            for farm_id, period_start, sample_count, stats in expired.values_list(
+                'farm_id', 'period_start', 'sample_count', 'stats'
+            ).iterator():
+                key = (farm_id, cls._floor(period_start, FarmConditionRollup.RESOLUTION_DAY))
+                samples, day_stats = periods.get(key, (0, {}))
+                for metric in METRICS:
+                    day_stats[metric] = cls.merge_stats(day_stats.get(metric), stats.get(metric))
+                periods[key] = (samples + sample_count, day_stats)
+
+            cls._merge_into(FarmConditionRollup.RESOLUTION_DAY, periods)
+            count, _ = expired.delete()
+        return count
+
+    @classmethod
+    def _merge_into(cls, resolution, periods):
+        """Add {(farm_id, period_start): (samples, stats)} to the rollups of a resolution"""
+        if not periods:
+            return
+
+        existing = {
+            (rollup.farm_id, rollup.period_start): rollup
+            for rollup in FarmConditionRollup.objects.filter(
+                resolution=resolution,
+                farm_id__in={farm_id for farm_id, _ in periods},
+                period_start__in={period_start for _, period_start in periods}
+            )
+        }
+
+        to_create = []
+        to_update = []
+        for key, (samples, stats) in periods.items():
+            stats = {metric: values for metric, values in stats.items() if values}
+            rollup = existing.get(key)
+            if rollup is None:
+                farm_id, period_start = key
+                to_create.append(FarmConditionRollup(
+                    farm_id=farm_id,
+                    resolution=resolution,
+                    period_start=period_start,
+                    sample_count=samples,
+                    stats=stats
+                ))
+            else:
+                # Readings that arrived late for an already rolled up period
+                rollup.sample_count += samples
+                for metric in METRICS:
+                    merged = cls.merge_stats(rollup.stats.get(metric), stats.get(metric))
+                    if merged:
+                        rollup.stats[metric] = merged
+                to_update.append(rollup)
+
+        FarmConditionRollup.objects.bulk_create(to_create)
+        FarmConditionRollup.objects.bulk_update(to_update, ['sample_count', 'stats'])
+
+    @classmethod
+    def _stat_aggregates(cls):
+        aggregates = {}
+        for metric in METRICS:
+            aggregates[f'{metric}_count'] = Count(metric)
+            aggregates[f'{metric}_sum'] = Sum(metric)
+            aggregates[f'{metric}_min'] = Min(metric)
+            aggregates[f'{metric}_max'] = Max(metric)
+        return aggregates
+
+    @classmethod
+    def _aggregated_stats(cls, row, metric):
+        """The [count, sum, min, max] of a metric from an aggregate row"""
+        if not row[f'{metric}_count']:
+            return None
+        return [row[f'{metric}_count'], row[f'{metric}_sum'], row[f'{metric}_min'], row[f'{metric}_max']]
+
+    @classmethod
+    def _floor(cls, moment, resolution):
+        """Start of the UTC hour or day a moment falls in"""
+        moment = moment.astimezone(datetime.timezone.utc)
+        if resolution == FarmConditionRollup.RESOLUTION_DAY:
+            return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        return moment.replace(minute=0, second=0, microsecond=0)
@@ -0,0 +1,61 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+
+# Canonical crop keys and the other names farmers use for them. The keys
+# match anywhere in a crop type ("Sweetcorn"), the other names only as
+# whole words, since short local names like "kol" or "tebu" are common
+# substrings of unrelated words.
+CROP_NAMES = {
+    'corn': ('jagung', 'maize'),
+    'rice': ('padi', 'paddy'),
+    'tomato': ('tomat',),
+    'potato': ('kentang',),
+    'cabbage': ('kubis', 'kol'),
+    'carrot': ('wortel',),
+    'chili': ('chilli', 'chile', 'cabai', 'cabe', 'lombok'),
+    'onion': ('bawang',),
+    'soybean': ('soya', 'soy bean', 'kedelai', 'kedele'),
+    'peanut': ('groundnut', 'kacang tanah'),
+    'cassava': ('singkong', 'ubi kayu', 'manioc'),
+    'coffee': ('kopi',),
+    'cacao': ('cocoa', 'kakao', 'coklat'),
+    'banana': ('pisang',),
+    'sugarcane': ('sugar cane', 'tebu'),
+}
+
+_NAME_TO_KEY = {name: key for key, names in CROP_NAMES.items() for name in names}
+_NAME_TO_KEY.update({key: key for key in CROP_NAMES})
+
+def _compile():
+    """One alternation over every name, longest first so "sugar cane" wins over shorter overlaps"""
+    alternatives = []
+    for name in sorted(_NAME_TO_KEY, key=len, reverse=True):
+        pattern = re.escape(name).replace(r'\ ', r'\s+')
+        alternatives.append(pattern if name in CROP_NAMES else rf'\b{pattern}\b')
+    return re.compile('|'.join(alternatives))
+
+_PATTERN = _compile()
+_SEPARATORS = re.compile(r'[\s_\-]+')
+
+@lru_cache(maxsize=getattr(settings, 'CROP_TYPE_CACHE_SIZE', 4096))
+def resolve(crop_type):
+    """
+    Map a free-text crop type to its canonical crop key.
+
+    The crop type is scanned once with a precompiled pattern and the
+    earliest name found wins. Results are memoized in a bounded LRU.
+
+    Returns: The canonical key, or None for crop types we don't know
+    """
+    if not crop_type:
+        return None
+    match = _PATTERN.search(_SEPARATORS.sub(' ', crop_type.lower()))
+    if match is None:
+        return None
+    return _NAME_TO_KEY[_SEPARATORS.sub(' ', match.group(0))]
+
+def crop_key(crop_type):
+    """The value stored in Crop.crop_key: the canonical key, or '' when unknown"""
+    return resolve(crop_type) or ''
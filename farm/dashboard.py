@@ -0,0 +1,152 @@
+import logging
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .models import ActivityLog, Crop, Farm
+
+logger = logging.getLogger(__name__)
+
+class DashboardCache:
+    """
+    Per-farmer cache of the dashboard summary: the farms, the crop count,
+    the latest activities and the crops due for harvest soon.
+
+    A summary is stored as one entry of the DASHBOARD_CACHE_ALIAS cache,
+    keyed by farmer and day, so the dashboard is served with a single
+    cache read. The signals on Farm, Crop and ActivityLog delete the entry
+    of the farmer they belong to, and entries expire after
+    DASHBOARD_CACHE_TIMEOUT seconds to bound the staleness of writes that
+    bypass the signals (queryset updates, bulk jobs).
+
+    To measure how often the cache serves stale data, a share of the hits
+    (DASHBOARD_CACHE_VERIFY_RATE) is checked against a fresh summary; a
+    mismatch is counted, logged and replaces the entry.
+    """
+
+    # Activities and upcoming harvests listed on the dashboard
+    LIST_SIZE = 5
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.verified = 0
+        self.stale = 0
+        self._lock = threading.Lock()
+
+    def cache(self):
+        return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+    def timeout(self):
+        return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+
+    def verify_rate(self):
+        return getattr(settings, 'DASHBOARD_CACHE_VERIFY_RATE', 0.01)
+
+    def upcoming_days(self):
+        return getattr(settings, 'DASHBOARD_UPCOMING_HARVEST_DAYS', 30)
+
+    def key(self, farmer_id, day=None):
+        day = day or timezone.now().date()
+        return f'dashboard:{farmer_id}:{day.isoformat()}'
+
+    def get_summary(self, farmer):
+        """The dashboard summary of a farmer, built and cached on a miss"""
+        key = self.key(farmer.pk)
+        summary = self.cache().get(key)
+        if summary is None:
+            self._count('misses')
+            summary = self.build(farmer)
+            self.cache().set(key, summary, self.timeout())
+            return summary
+
+        self._count('hits')
+        if random.random() < self.verify_rate():
+            summary = self._verify(farmer, key, summary)
+        return summary
+
+    def build(self, farmer):
+        """
+        Build the summary of a farmer from the database.
+
+        Returns: Dictionary with farms, farm_count, total_crops,
+        recent_activities and upcoming_harvests
+        """
+        farms = list(Farm.objects.filter(farmer=farmer))
+        if not farms:
+            return {
+                'farms': [],
+                'farm_count': 0,
+                'total_crops': 0,
+                'recent_activities': [],
+                'upcoming_harvests': [],
+            }
+
+        today = timezone.now().date()
+        return {
+            'farms': farms,
+            'farm_count': len(farms),
+            'total_crops': Crop.objects.filter(field__farm__farmer=farmer).count(),
+            'recent_activities': list(
+                ActivityLog.objects.filter(farm__farmer=farmer).select_related('farm').order_by('-timestamp')[:self.LIST_SIZE]
+            ),
+            'upcoming_harvests': list(
+                Crop.due_for_harvest(today, today + timezone.timedelta(days=self.upcoming_days())).filter(
+                    field__farm__farmer=farmer
+                ).select_related('field__farm').order_by('predicted_harvest_date')[:self.LIST_SIZE]
+            ),
+        }
+
+    def invalidate(self, farmer_id):
+        """Drop the cached summary of a farmer"""
+        self._count('invalidations')
+        self.cache().delete(self.key(farmer_id))
+
+    def stats(self):
+        """Return the counters of this process, with the share of verified hits that were stale"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'verified': self.verified,
+                'stale': self.stale,
+                'stale_rate': self.stale / self.verified if self.verified else None,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.invalidations = self.verified = self.stale = 0
+
+    def _verify(self, farmer, key, summary):
+        fresh = self.build(farmer)
+        self._count('verified')
+        if self._fingerprint(fresh) == self._fingerprint(summary):
+            return summary
+
+        self._count('stale')
+        logger.warning(
+            "Served a stale dashboard summary for farmer %s (%s of %s verified hits stale)",
+            farmer.pk, self.stale, self.verified
+        )
+        self.cache().set(key, fresh, self.timeout())
+        return fresh
+
+    def _fingerprint(self, summary):
+        """What a summary shows, for comparing two summaries"""
+        return (
+            [(farm.pk, farm.name, farm.location, farm.size) for farm in summary['farms']],
+            summary['total_crops'],
+            [(activity.pk, activity.activity_type, activity.timestamp) for activity in summary['recent_activities']],
+            [(crop.pk, crop.crop_type, crop.predicted_harvest_date) for crop in summary['upcoming_harvests']],
+        )
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+dashboard_cache = DashboardCache()
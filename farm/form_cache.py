@@ -0,0 +1,101 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import get_template, render_to_string
+
+from .forms import PreparationLogForm, PlantingLogForm, MaintenanceLogForm, HarvestingLogForm
+from .models import FarmCropVersion
+
+# The specialized form of each activity type and the partial it renders with
+ACTIVITY_FORMS = {
+    'preparation': (PreparationLogForm, 'partials/preparation_form.html'),
+    'planting': (PlantingLogForm, 'partials/planting_form.html'),
+    'maintenance': (MaintenanceLogForm, 'partials/maintenance_form.html'),
+    'harvesting': (HarvestingLogForm, 'partials/harvesting_form.html'),
+}
+
+class ActivityFormCache:
+    """
+    Cache of the rendered specialized activity form partials, per farm and
+    activity type.
+
+    The partials list the fields and active crops of their farm, named
+    after the farm. Their version is the farm's FarmCropVersion, which
+    every change to its fields and crops bumps in the database, and a
+    digest of the farm name. The version is part of the key of the
+    partials in the ACTIVITY_FORM_CACHE_ALIAS cache and of their ETag, so
+    a change made by any process (another web worker, the import command)
+    is seen by all of them, whichever cache backend they use.
+
+    Versions also carry the code version: a digest of the partial templates
+    and of ACTIVITY_FORM_CACHE_VERSION, which deploys set to their release
+    (e.g. the commit hash). After a deploy that changes the templates or the
+    release, partials are rendered afresh and old ETags stop matching, so
+    browsers don't keep getting 304s for outdated forms.
+
+    Partials are rendered without the request: the form they are loaded
+    into carries the CSRF token, and a cached copy must not hold the token
+    of whoever rendered it first.
+    """
+
+    def __init__(self):
+        self._templates_digest = None
+
+    def cache(self):
+        return caches[getattr(settings, 'ACTIVITY_FORM_CACHE_ALIAS', 'default')]
+
+    def timeout(self):
+        return getattr(settings, 'ACTIVITY_FORM_CACHE_TIMEOUT', 3600)
+
+    def code_version(self):
+        """Digest of the partial templates and the configured release, computed once per process"""
+        if self._templates_digest is None:
+            sources = [get_template(template).template.source for _, template in ACTIVITY_FORMS.values()]
+            self._templates_digest = hashlib.md5('\0'.join(sources).encode()).hexdigest()
+        release = getattr(settings, 'ACTIVITY_FORM_CACHE_VERSION', '')
+        return hashlib.md5(f'{self._templates_digest}:{release}'.encode()).hexdigest()[:12]
+
+    def version(self, farm):
+        """
+        The current version of a farm's partials: the code version, the
+        version of the farm's crop list and a digest of its name
+        """
+        crop_version, removed_version = FarmCropVersion.current(farm)
+        name = hashlib.md5(farm.name.encode()).hexdigest()[:8]
+        return f'{self.code_version()}:{crop_version}.{removed_version}:{name}'
+
+    def etag(self, farm, activity_type, version=None):
+        """ETag of a partial, known without rendering or reading it"""
+        version = version or self.version(farm)
+        digest = hashlib.md5(f'{version}:{activity_type}'.encode()).hexdigest()
+        return f'"{digest}"'
+
+    def get_html(self, farm, activity_type, version=None):
+        """
+        The rendered partial of an activity type for a farm, rendered and
+        cached on a miss.
+
+        Returns: The HTML, or None for activity types without a specialized form
+        """
+        if activity_type not in ACTIVITY_FORMS:
+            return None
+
+        version = version or self.version(farm)
+        key = f'activity_forms:{farm.pk}:{version}:{activity_type}'
+        html = self.cache().get(key)
+        if html is None:
+            html = self.render(farm, activity_type)
+            self.cache().set(key, html, self.timeout())
+        return html
+
+    def render(self, farm, activity_type):
+        form_class, template = ACTIVITY_FORMS[activity_type]
+        return render_to_string(template, {
+            'form': form_class(farm=farm),
+            'farm': farm,
+            # What the csrf context processor provides when there is no token
+            'csrf_token': 'NOTPROVIDED',
+        })
+
+activity_form_cache = ActivityFormCache()
@@ -606,4 +606,96 @@ class HarvestingLogForm(forms.ModelForm):
             if days_before_expected > 30:  # If harvesting more than a month before expected
                 self.add_error(None, "Harvesting significantly earlier than expected harvest date")
         
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+class ActivityImportForm(forms.Form):
+    FORMAT_CHOICES = [
+        ('', 'Detect from file name'),
+        ('csv', 'CSV'),
+        ('json', 'JSON')
+    ]
+    
+    file = forms.FileField(
+        widget=forms.ClearableFileInput(attrs={
+            'class': 'py-3 px-4 block w-full border border-gray-300 rounded-md shadow-sm focus:ring-[#3E8061] focus:border-[#3E8061] sm:text-sm',
+            'accept': '.csv,.json'
+        })
+    )
+    file_format = forms.ChoiceField(
+        choices=FORMAT_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={
+            'class': 'py-3 px-4 block w-full border border-gray-300 rounded-md shadow-sm focus:ring-[#3E8061] focus:border-[#3E8061] sm:text-sm'
+        })
+    )
+    
+    def clean(self):
+        """Resolve the file format from the file name when it is not given"""
+        cleaned_data = super().clean()
+        file = cleaned_data.get('file')
+        
+        if file and not cleaned_data.get('file_format'):
+            extension = file.name.rsplit('.', 1)[-1].lower() if '.' in file.name else ''
+            if extension not in ('csv', 'json'):
+                self.add_error('file_format', "Choose a format, the file name does not end in .csv or .json")
+            else:
+                cleaned_data['file_format'] = extension
+        
+        return cleaned_data
+
+
+class ActivityLogFilterForm(forms.Form):
+    # Rendered by the template itself
+    type = forms.ChoiceField(
+        choices=[('', 'All Activities')] + ActivityLog.ACTIVITY_CHOICES,
+        required=False
+    )
+    date_from = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={
+            'class': 'py-2 px-3 border border-gray-300 rounded-md shadow-sm focus:ring-[#3E8061] focus:border-[#3E8061] text-sm',
+            'type': 'date'
+        })
+    )
+    date_to = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={
+            'class': 'py-2 px-3 border border-gray-300 rounded-md shadow-sm focus:ring-[#3E8061] focus:border-[#3E8061] text-sm',
+            'type': 'date'
+        })
+    )
+    field = forms.ModelChoiceField(
+        queryset=Field.objects.none(),
+        required=False,
+        empty_label='All Fields',
+        widget=forms.Select(attrs={
+            'class': 'py-2 px-3 border border-gray-300 rounded-md shadow-sm focus:ring-[#3E8061] focus:border-[#3E8061] text-sm',
+        })
+    )
+    crop = forms.ModelChoiceField(
+        queryset=Crop.objects.none(),
+        required=False,
+        empty_label='All Crops',
+        widget=forms.Select(attrs={
+            'class': 'py-2 px-3 border border-gray-300 rounded-md shadow-sm focus:ring-[#3E8061] focus:border-[#3E8061] text-sm',
+        })
+    )
+    
+    def __init__(self, *args, **kwargs):
+        farm = kwargs.pop('farm', None)
+        super().__init__(*args, **kwargs)
+        
+        if farm:
+            self.fields['field'].queryset = Field.objects.filter(farm=farm).order_by('name')
+            self.fields['crop'].queryset = Crop.objects.filter(field__farm=farm).select_related('field').order_by('-planting_date')
+    
+    def clean(self):
+        """Make sure the date range is not reversed"""
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        
+        if date_from and date_to and date_from > date_to:
+            self.add_error('date_to', "End date must be on or after the start date")
+        
+        return cleaned_data
@@ -1,6 +1,50 @@
+import threading
+import time
 from datetime import timedelta
+import numpy as np
+from django.conf import settings
 from django.utils import timezone
 
+from .models import Crop, CropMaintenanceSummary, FarmCondition, PredictionParameterSet
+from . import crop_types, prediction_rules
+
+class ActiveRules:
+    """
+    Process-wide memo of the prediction rules of the active
+    PredictionParameterSet, re-read every PREDICTION_RULES_REFRESH seconds
+    (default 60) so every process picks up a newly activated set.
+    """
+
+    def __init__(self):
+        self._rules = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def refresh_interval(self):
+        return getattr(settings, 'PREDICTION_RULES_REFRESH', 60)
+
+    def get(self):
+        """The active rules, or the built-in rules when no set is active"""
+        with self._lock:
+            if self._rules is None or time.monotonic() - self._loaded_at >= self.refresh_interval():
+                parameter_set = PredictionParameterSet.objects.filter(is_active=True).first()
+                if parameter_set is None:
+                    self._rules = prediction_rules.DEFAULT_RULES
+                else:
+                    self._rules = prediction_rules.DEFAULT_RULES.with_parameters(
+                        parameter_set.parameters,
+                        version=parameter_set.version
+                    )
+                self._loaded_at = time.monotonic()
+            return self._rules
+
+    def reset(self):
+        """Forget the memoized rules, so the next get() reads them again"""
+        with self._lock:
+            self._rules = None
+
+active_rules = ActiveRules()
+
 class HarvestPredictionSystem:
     """
     Rule-based system for predicting harvest dates based on crop type,
@@ -29,6 +73,9 @@ class HarvestPredictionSystem:
     # Default growing period for crops not in the list
     DEFAULT_GROWING_PERIOD = 100
     
+    # Farm condition columns, in the order prediction_rules.environment_effect takes them
+    CONDITION_COLUMNS = ('max_daily_temp', 'soil_ph', 'soil_moisture', 'rainfall', 'day_length')
+    
     @classmethod
     def predict_harvest_date(cls, crop, farm_condition=None):
         """
@@ -45,21 +92,17 @@ class HarvestPredictionSystem:
         if not crop or not crop.planting_date:
             return None
         
-        # Start with the base growing period for this crop type
-        crop_type_lower = crop.crop_type.lower()
+        rules = cls.rules()
+        crop_key = cls._crop_key(crop)
         
-        # Find the closest match in our base growing periods
-        base_days = cls.DEFAULT_GROWING_PERIOD
-        for known_crop, days in cls.BASE_GROWING_PERIODS.items():
-            if known_crop in crop_type_lower or crop_type_lower in known_crop:
-                base_days = days
-                break
+        # Start with the base growing period for this crop type
+        base_days = cls._base_growing_period(crop_key, rules)
         
         # Adjustments based on maintenance activities
-        maintenance_modifier = cls._calculate_maintenance_effect(crop)
+        maintenance_modifier = cls._calculate_maintenance_effect(crop, rules)
         
         # Adjustments based on environmental factors
-        environment_modifier = cls._calculate_environment_effect(crop, farm_condition)
+        environment_modifier = cls._environment_modifier(crop_key, farm_condition, rules)
         
         # Calculate the total growing period with all modifiers
         total_days = base_days + maintenance_modifier + environment_modifier
@@ -70,179 +113,70 @@ class HarvestPredictionSystem:
         return predicted_date
     
     @classmethod
-    def _calculate_maintenance_effect(cls, crop):
+    def rules(cls):
+        """The prediction rules currently in effect (see ActiveRules)"""
+        return active_rules.get()
+    
+    @classmethod
+    def _calculate_maintenance_effect(cls, crop, rules=prediction_rules.DEFAULT_RULES):
         """
         Calculate the effect of maintenance activities on growing period.
         Frequent and proper maintenance should reduce growing time.
         
         Returns: Adjustment in days (negative means faster growth)
         """
-        days_adjustment = 0
-        
-        # Get all maintenance activities for this crop
-        maintenance_activities = crop.maintenance_activities.all()
-        
-        if not maintenance_activities.exists():
-            # No maintenance might extend growing period
-            return 15
-        
-        # Calculate fertilizer effect
-        total_fertilizer = sum(m.fertilizer_applied or 0 for m in maintenance_activities)
-        if total_fertilizer > 0:
-            fertilizer_per_activity = total_fertilizer / maintenance_activities.count()
-            # Good fertilization (neither too little nor too much) speeds up growth
-            if 0 < fertilizer_per_activity <= 5:
-                days_adjustment -= 5
-            elif 5 < fertilizer_per_activity <= 15:
-                days_adjustment -= 10
-            elif fertilizer_per_activity > 15:
-                # Too much fertilizer might slow growth
-                days_adjustment += 5
+        # The running totals of the crop, not its maintenance history
+        summary = cls._maintenance_summary(crop)
         
-        # Calculate irrigation effect
-        total_irrigation = sum(m.irrigation_amount or 0 for m in maintenance_activities)
-        if total_irrigation > 0:
-            irrigation_per_activity = total_irrigation / maintenance_activities.count()
-            # Proper irrigation speeds up growth
-            if 0 < irrigation_per_activity <= 100:
-                days_adjustment -= 3
-            elif 100 < irrigation_per_activity <= 500:
-                days_adjustment -= 7
-            elif irrigation_per_activity > 500:
-                # Too much water might slow growth or cause disease
-                days_adjustment += 10
-        
-        # Calculate pesticide effect (prevents disease, can speed up growth)
-        total_pesticide = sum(m.pesticide_applied or 0 for m in maintenance_activities)
-        if total_pesticide > 0:
-            pesticide_per_activity = total_pesticide / maintenance_activities.count()
-            if 0 < pesticide_per_activity <= 3:
-                days_adjustment -= 3
-            # Too much pesticide might stress plants
-            elif pesticide_per_activity > 3:
-                days_adjustment += 2
-        
-        # Overall maintenance frequency effect
         days_since_planting = (timezone.now().date() - crop.planting_date).days
-        if days_since_planting > 0:
-            maintenance_frequency = maintenance_activities.count() / days_since_planting * 30  # activities per month
-            
-            if maintenance_frequency < 1:
-                # Infrequent maintenance extends growing period
-                days_adjustment += 10
-            elif 1 <= maintenance_frequency < 4:
-                # Regular maintenance speeds up growth slightly
-                days_adjustment -= 5
-            else:
-                # Very frequent maintenance leads to optimal growth
-                days_adjustment -= 8
-        
-        return days_adjustment
+        return int(prediction_rules.maintenance_effect(
+            [summary.maintenance_count if summary else 0],
+            [summary.total_fertilizer if summary else 0],
+            [summary.total_irrigation if summary else 0],
+            [summary.total_pesticide if summary else 0],
+            [days_since_planting],
+            rules=rules
+        )[0])
+    
+    @classmethod
+    def _maintenance_summary(cls, crop):
+        """The CropMaintenanceSummary of a crop, or None for crops without maintenance"""
+        try:
+            return crop.maintenance_summary
+        except CropMaintenanceSummary.DoesNotExist:
+            return None
     
     @classmethod
-    def _calculate_environment_effect(cls, crop, farm_condition):
+    def _environment_modifier(cls, crop_key, farm_condition, rules=prediction_rules.DEFAULT_RULES):
         """
-        Calculate the effect of environmental conditions on growing period.
-        Optimal conditions speed up growth, poor conditions slow it down.
+        Score the farm conditions of a crop with a rule set.
         
         Returns: Adjustment in days
         """
         if not farm_condition:
             return 0
-        
-        days_adjustment = 0
-        crop_type_lower = crop.crop_type.lower()
-        
-        # Temperature effects
-        if farm_condition.max_daily_temp is not None:
-            temp = farm_condition.max_daily_temp
-            
-            # Different crops have different optimal temperature ranges
-            if ('rice' in crop_type_lower) or ('padi' in crop_type_lower):
-                # Rice prefers warmer temperatures (25-30°C)
-                if 25 <= temp <= 30:
-                    days_adjustment -= 10
-                elif 20 <= temp < 25 or 30 < temp <= 35:
-                    days_adjustment -= 5
-                elif temp > 35:
-                    days_adjustment += 15  # Too hot slows growth significantly
-            
-            elif ('corn' in crop_type_lower) or ('jagung' in crop_type_lower):
-                # Corn grows well in 20-30°C
-                if 20 <= temp <= 30:
-                    days_adjustment -= 8
-                elif 15 <= temp < 20 or 30 < temp <= 32:
-                    days_adjustment -= 3
-                elif temp > 32:
-                    days_adjustment += 10
-            
-            # General temperature effects for other crops
-            else:
-                if 18 <= temp <= 28:  # Optimal temperature range for most crops
-                    days_adjustment -= 7
-                elif 15 <= temp < 18 or 28 < temp <= 32:
-                    days_adjustment -= 3
-                elif temp > 32 or temp < 15:
-                    days_adjustment += 10
-        
-        # Soil pH effects
-        if farm_condition.soil_ph is not None:
-            ph = farm_condition.soil_ph
-            
-            # Most crops grow best in slightly acidic to neutral soil (6.0-7.0)
-            if 6.0 <= ph <= 7.0:
-                days_adjustment -= 5
-            elif 5.5 <= ph < 6.0 or 7.0 < ph <= 7.5:
-                days_adjustment -= 2
-            else:
-                # Very acidic or alkaline soil slows growth
-                days_adjustment += 8
-        
-        # Soil moisture effects
-        if farm_condition.soil_moisture is not None:
-            moisture = farm_condition.soil_moisture
-            
-            # Optimal soil moisture is typically 50-70%
-            if 50 <= moisture <= 70:
-                days_adjustment -= 7
-            elif 40 <= moisture < 50 or 70 < moisture <= 80:
-                days_adjustment -= 3
-            elif moisture < 20:  # Too dry
-                days_adjustment += 15
-            elif moisture > 90:  # Waterlogged
-                days_adjustment += 20
-        
-        # Rainfall effects
-        if farm_condition.rainfall is not None:
-            rainfall = farm_condition.rainfall
-            
-            # Moderate rainfall is beneficial
-            if 100 <= rainfall <= 200:
-                days_adjustment -= 5
-            elif 50 <= rainfall < 100 or 200 < rainfall <= 300:
-                days_adjustment -= 2
-            elif rainfall > 400:  # Excessive rain
-                days_adjustment += 10
-        
-        # Day length effects
-        if farm_condition.day_length is not None:
-            day_length = farm_condition.day_length
-            
-            # Many crops grow best with 10-14 hours of light
-            if 10 <= day_length <= 14:
-                days_adjustment -= 5
-            elif 8 <= day_length < 10 or 14 < day_length <= 16:
-                days_adjustment -= 2
-            else:
-                days_adjustment += 3
-        
-        return days_adjustment
+        values = [getattr(farm_condition, metric) for metric in cls.CONDITION_COLUMNS]
+        return int(prediction_rules.environment_effect(
+            [cls._temperature_profile(crop_key)],
+            *([np.nan if value is None else value] for value in values),
+            rules=rules
+        )[0])
     
     @classmethod
     def get_confidence_level(cls, crop, farm_condition=None):
         """
         Calculate a confidence level for the prediction based on data completeness.
         
+        Returns: Confidence level as a percentage (0-100)
+        """
+        summary = cls._maintenance_summary(crop)
+        return cls._confidence(cls._crop_key(crop), summary.maintenance_count if summary else 0, farm_condition)
+    
+    @classmethod
+    def _confidence(cls, crop_key, maintenance_count, farm_condition=None):
+        """
+        Apply the confidence rules to a canonical crop key and its maintenance count.
+        
         Returns: Confidence level as a percentage (0-100)
         """
         confidence = 60  # Base confidence
@@ -261,16 +195,170 @@ class HarvestPredictionSystem:
                 confidence += 5
         
         # Having maintenance activities increases confidence
-        maintenance_count = crop.maintenance_activities.count()
         if maintenance_count > 0:
             confidence += min(15, maintenance_count * 3)  # Up to 15% for maintenance records
         
         # Check if crop type is in our database
-        crop_type_lower = crop.crop_type.lower()
-        crop_type_known = any(known_crop in crop_type_lower or crop_type_lower in known_crop 
-                            for known_crop in cls.BASE_GROWING_PERIODS.keys())
-        if crop_type_known:
+        if crop_key in cls.BASE_GROWING_PERIODS:
             confidence += 10
         
         # Cap at 100%
-        return min(confidence, 100)
\ No newline at end of file
+        return min(confidence, 100)
+    
+    @classmethod
+    def _crop_key(cls, crop):
+        """Canonical crop key of a crop, from its stored crop_key when it has one"""
+        return crop.crop_key or crop_types.resolve(crop.crop_type)
+    
+    @classmethod
+    def _base_growing_period(cls, crop_key, rules=prediction_rules.DEFAULT_RULES):
+        """Base growing period of a canonical crop key, as fitted in the rules if they have one"""
+        fitted = rules.growing_periods.get(crop_key or '')
+        if fitted is not None:
+            return fitted
+        return cls.BASE_GROWING_PERIODS.get(crop_key, cls.DEFAULT_GROWING_PERIOD)
+    
+    @classmethod
+    def _temperature_profile(cls, crop_type):
+        """
+        Index of the temperature ladder a crop type (or canonical crop
+        key, which resolves to itself) uses in
+        prediction_rules.TEMPERATURE_PROFILES.
+        """
+        crop_key = crop_types.resolve(crop_type)
+        if crop_key in ('rice', 'corn'):
+            return prediction_rules.TEMPERATURE_PROFILES.index(crop_key)
+        return prediction_rules.TEMPERATURE_PROFILES.index('general')
+    
+    @classmethod
+    def predict_batch(cls, crops, today=None):
+        """
+        Predict harvest dates and confidence levels for every active crop
+        in a queryset using a constant number of queries.
+        
+        Maintenance totals are read from each crop's CropMaintenanceSummary
+        in the same query as the crops, and farm conditions are fetched once
+        for all involved farms, so the cost does not grow with the number of
+        crops or the length of their maintenance history. The modifiers
+        are then scored column-wise with the breakpoint tables in
+        prediction_rules.
+        
+        Args:
+            crops: QuerySet of Crop objects
+            today: Optional date to predict as of (defaults to today)
+            
+        Returns:
+            List of dicts with 'crop', 'predicted_date' and 'confidence' keys
+        """
+        today = today or timezone.now().date()
+        crop_list, farm_condition_list = cls.load_batch(crops)
+        if not crop_list:
+            return []
+        
+        rules = cls.rules()
+        columns = cls.batch_columns(crop_list, farm_condition_list, today, rules)
+        maintenance_modifiers = prediction_rules.maintenance_effect(
+            columns['maintenance_count'],
+            columns['total_fertilizer'],
+            columns['total_irrigation'],
+            columns['total_pesticide'],
+            columns['days_since_planting'],
+            rules=rules
+        )
+        environment_modifiers = prediction_rules.environment_effect(
+            columns['temperature_profile'],
+            *(columns[metric] for metric in cls.CONDITION_COLUMNS),
+            rules=rules
+        )
+        total_days = (columns['base_days'] + maintenance_modifiers + environment_modifiers).tolist()
+        crop_keys = columns['crop_key']
+        maintenance_counts = columns['maintenance_count'].tolist()
+        
+        predictions = []
+        for crop, crop_key, farm_condition, maintenance_count, days in zip(
+                crop_list, crop_keys, farm_condition_list, maintenance_counts, total_days):
+            predictions.append({
+                'crop': crop,
+                'predicted_date': crop.planting_date + timedelta(days=days) if crop.planting_date else None,
+                'confidence': cls._confidence(crop_key, maintenance_count, farm_condition),
+            })
+        
+        return predictions
+    
+    @classmethod
+    def load_batch(cls, crops):
+        """
+        Load the active crops of a queryset with their maintenance summaries,
+        and the farm conditions that apply to each, in two queries.
+        
+        Returns:
+            Tuple of (list of crops, list of FarmCondition or None per crop)
+        """
+        crop_list = list(crops.filter(is_harvested=False).select_related('field', 'maintenance_summary'))
+        if not crop_list:
+            return [], []
+        
+        farm_ids = {crop.field.farm_id for crop in crop_list if crop.field}
+        farm_conditions = {
+            condition.farm_id: condition
+            for condition in FarmCondition.objects.filter(farm_id__in=farm_ids)
+        }
+        farm_condition_list = [
+            farm_conditions.get(crop.field.farm_id) if crop.field else None
+            for crop in crop_list
+        ]
+        return crop_list, farm_condition_list
+    
+    @classmethod
+    def batch_columns(cls, crop_list, farm_condition_list, today, rules=prediction_rules.DEFAULT_RULES):
+        """
+        Lay the prediction inputs of a batch out as numpy columns, one entry
+        per crop, ready for the vectorized rules in prediction_rules.
+        
+        Condition columns use NaN for readings that are not recorded.
+        
+        Returns:
+            Dictionary of column name to array (crop_key is a plain list)
+        """
+        summaries = [
+            crop.maintenance_summary if hasattr(crop, 'maintenance_summary') else None
+            for crop in crop_list
+        ]
+        
+        def total_column(attribute):
+            return np.array([getattr(summary, attribute) if summary else 0 for summary in summaries], dtype=float)
+        
+        def condition_column(attribute):
+            return np.array([
+                np.nan if condition is None or getattr(condition, attribute) is None
+                else getattr(condition, attribute)
+                for condition in farm_condition_list
+            ], dtype=float)
+        
+        crop_keys = [cls._crop_key(crop) for crop in crop_list]
+        columns = {
+            'crop_key': crop_keys,
+            'base_days': np.array([cls._base_growing_period(crop_key, rules) for crop_key in crop_keys], dtype=np.int64),
+            'temperature_profile': np.array([cls._temperature_profile(crop_key) for crop_key in crop_keys], dtype=np.int64),
+            'maintenance_count': np.array([summary.maintenance_count if summary else 0 for summary in summaries], dtype=np.int64),
+            'total_fertilizer': total_column('total_fertilizer'),
+            'total_irrigation': total_column('total_irrigation'),
+            'total_pesticide': total_column('total_pesticide'),
+            'days_since_planting': np.array(
+                [(today - crop.planting_date).days if crop.planting_date else 0 for crop in crop_list],
+                dtype=np.int64
+            ),
+        }
+        for metric in cls.CONDITION_COLUMNS:
+            columns[metric] = condition_column(metric)
+        return columns
+    
+    @classmethod
+    def predict_for_farmer(cls, farmer, today=None):
+        """
+        Predict harvest dates for every active crop across all farms of a farmer.
+        
+        Returns:
+            List of dicts with 'crop', 'predicted_date' and 'confidence' keys
+        """
+        return cls.predict_batch(Crop.objects.filter(field__farm__farmer=farmer), today=today)
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from farm.backtest import HarvestBacktest
+from farm.harvest_prediction import active_rules
+
+class Command(BaseCommand):
+    help = "Replay the harvest predictions of harvested crops and report their errors per crop type"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fit',
+            action='store_true',
+            help="Fit new rule values and store them as the next prediction parameter set"
+        )
+        parser.add_argument(
+            '--activate',
+            action='store_true',
+            help="Activate the fitted parameter set (implies --fit)"
+        )
+        parser.add_argument(
+            '--regularization',
+            type=float,
+            default=10.0,
+            help="Weight, in crops, pulling fitted values towards the current rules"
+        )
+
+    def handle(self, *args, **options):
+        if options['regularization'] < 0:
+            raise CommandError("--regularization can't be negative")
+
+        if options['fit'] or options['activate']:
+            parameter_set, report = HarvestBacktest.calibrate(
+                regularization=options['regularization'],
+                activate=options['activate']
+            )
+        else:
+            parameter_set, report = None, HarvestBacktest.run()
+
+        if not report['samples']:
+            self.stdout.write("No harvested crops to backtest")
+            return
+
+        rules = f"v{report['rules_version']}" if report['rules_version'] else "built-in"
+        self.stdout.write(f"Backtested {report['samples']} harvested crops against the {rules} rules")
+        self._write_errors("Errors (predicted minus actual days)", report['errors'])
+
+        if parameter_set is not None:
+            self._write_errors("Errors with the fitted values", report['fitted_errors'])
+            if options['activate']:
+                active_rules.reset()
+                self.stdout.write(self.style.SUCCESS(f"Activated prediction parameters v{parameter_set.version}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"Stored prediction parameters v{parameter_set.version} (inactive)"))
+
+    def _write_errors(self, title, errors):
+        self.stdout.write(f"\n{title}")
+        self.stdout.write(f"{'crop':<12}{'count':>8}{'bias':>9}{'mae':>9}{'rmse':>9}{'p50':>9}{'p90':>9}")
+        for key, stats in errors.items():
+            self.stdout.write(
+                f"{key:<12}{stats['count']:>8}{stats['bias']:>9}{stats['mae']:>9}"
+                f"{stats['rmse']:>9}{stats['p50']:>9}{stats['p90']:>9}"
+            )
@@ -0,0 +1,21 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from farm.models import Farm, SensorToken
+
+class Command(BaseCommand):
+    help = "Issue a token a sensor gateway uses to post condition readings for a farm"
+
+    def add_arguments(self, parser):
+        parser.add_argument('farm_id', help="Id of the farm the gateway reports for")
+        parser.add_argument('--name', default="Sensor gateway", help="Label of the token")
+
+    def handle(self, *args, **options):
+        try:
+            farm = Farm.objects.get(farm_id=options['farm_id'])
+        except (Farm.DoesNotExist, ValidationError):
+            raise CommandError(f"Farm {options['farm_id']} does not exist")
+
+        _, token = SensorToken.issue(farm, options['name'])
+        self.stdout.write(self.style.SUCCESS(f"Sensor token for {farm.name} (shown only once):"))
+        self.stdout.write(token)
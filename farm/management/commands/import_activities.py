@@ -0,0 +1,48 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from farm.activity_import import ActivityImporter, ActivityImportError, parse_activity_file
+from farm.models import Farm
+
+class Command(BaseCommand):
+    help = "Import activity logs into a farm from a CSV or JSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('farm_id', help="Id of the farm to import into")
+        parser.add_argument('path', help="CSV or JSON file to import")
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'json'],
+            help="File format, detected from the file extension by default"
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help="Rows written per transaction (defaults to ACTIVITY_IMPORT_CHUNK_SIZE)"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            farm = Farm.objects.get(farm_id=options['farm_id'])
+        except (Farm.DoesNotExist, ValidationError):
+            raise CommandError(f"Farm {options['farm_id']} does not exist")
+
+        path = options['path']
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        try:
+            with open(path, 'rb') as file:
+                rows = parse_activity_file(file, file_format)
+        except (OSError, ActivityImportError) as e:
+            raise CommandError(str(e))
+
+        result = ActivityImporter(farm, chunk_size=options['chunk_size']).import_rows(rows)
+
+        for error in result['errors']:
+            for field, messages in error['errors'].items():
+                for message in messages:
+                    self.stderr.write(f"Row {error['row']}: {field}: {message}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} of {result['rows']} activities "
+            f"({result['crops_created']} crops created, {len(result['errors'])} rows skipped)"
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from farm import crop_types
+from farm.models import Crop
+
+class Command(BaseCommand):
+    help = "Recompute the canonical crop key of every crop from its crop type"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Crops updated per query"
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        now = timezone.now()
+        changed = []
+        updated = 0
+        for crop in Crop.objects.only('pk', 'crop_type', 'crop_key', 'inputs_updated_at').iterator(chunk_size=batch_size):
+            crop_key = crop_types.crop_key(crop.crop_type)
+            if crop.crop_key != crop_key:
+                crop.crop_key = crop_key
+                # The key feeds the prediction, so bump its version stamp too
+                crop.inputs_updated_at = now
+                changed.append(crop)
+            if len(changed) >= batch_size:
+                updated += Crop.objects.bulk_update(changed, ['crop_key', 'inputs_updated_at'])
+                changed = []
+        if changed:
+            updated += Crop.objects.bulk_update(changed, ['crop_key', 'inputs_updated_at'])
+
+        self.stdout.write(self.style.SUCCESS(f"Updated the crop key of {updated} crops"))
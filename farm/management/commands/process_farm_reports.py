@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from farm.reports import FarmPortfolioExporter, FarmReportExporter
+
+class Command(BaseCommand):
+    help = "Render queued farm PDF report and portfolio export jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Process the jobs currently queued and exit instead of polling"
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help="Seconds to wait between polls when the queue is empty"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = FarmReportExporter.run_pending()
+            if processed:
+                self.stdout.write(f"Processed {processed} report jobs")
+            portfolios = FarmPortfolioExporter.run_pending()
+            if portfolios:
+                self.stdout.write(f"Processed {portfolios} portfolio jobs")
+            processed += portfolios
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['poll_interval'])
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from farm.models import CropMaintenanceSummary
+
+class Command(BaseCommand):
+    help = "Rebuild the per-crop maintenance summaries from the maintenance logs"
+
+    def handle(self, *args, **options):
+        count = CropMaintenanceSummary.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt maintenance summaries for {count} crops"))
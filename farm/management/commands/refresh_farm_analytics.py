@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from farm.analytics import FarmAnalytics
+from farm.models import Farm
+
+class Command(BaseCommand):
+    help = "Rebuild the analytics snapshots of farms whose data changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help="Rebuild the snapshot of every farm, including clean and missing ones"
+        )
+
+    def handle(self, *args, **options):
+        farms = Farm.objects.select_related('analytics_snapshot').order_by('pk')
+        if not options['all']:
+            farms = farms.filter(analytics_snapshot__is_dirty=True)
+
+        refreshed = 0
+        for farm in farms.iterator():
+            snapshot = getattr(farm, 'analytics_snapshot', None)
+            FarmAnalytics.refresh_snapshot(farm, snapshot)
+            refreshed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Refreshed analytics snapshots for {refreshed} farms"))
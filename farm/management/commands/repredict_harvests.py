@@ -0,0 +1,64 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from farm.harvest_prediction import HarvestPredictionSystem
+from farm.models import Crop
+
+class Command(BaseCommand):
+    help = "Recompute the stored harvest predictions of all active crops"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help="Number of crops to predict and update per batch"
+        )
+        parser.add_argument(
+            '--as-of',
+            type=date.fromisoformat,
+            default=None,
+            help="Date to predict as of (YYYY-MM-DD, defaults to today)"
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        # The maintenance frequency term depends on days since planting, so
+        # stored predictions drift daily and are recomputed for a fixed date
+        as_of = options['as_of'] or timezone.now().date()
+
+        active_crops = Crop.objects.filter(is_harvested=False).order_by('pk')
+        updated = 0
+        last_pk = None
+
+        while True:
+            chunk = active_crops if last_pk is None else active_crops.filter(pk__gt=last_pk)
+            crop_ids = list(chunk.values_list('pk', flat=True)[:chunk_size])
+            if not crop_ids:
+                break
+
+            predictions = HarvestPredictionSystem.predict_batch(
+                Crop.objects.filter(pk__in=crop_ids), today=as_of
+            )
+            crops = []
+            for prediction in predictions:
+                crop = prediction['crop']
+                crop.predicted_harvest_date = prediction['predicted_date']
+                crop.prediction_confidence = prediction['confidence']
+                crop.predicted_on = as_of
+                crops.append(crop)
+
+            with transaction.atomic():
+                Crop.objects.bulk_update(
+                    crops,
+                    ['predicted_harvest_date', 'prediction_confidence', 'predicted_on'],
+                    batch_size=chunk_size
+                )
+
+            updated += len(crops)
+            last_pk = crop_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Updated harvest predictions for {updated} crops as of {as_of}"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from farm.condition_history import FarmConditionHistory
+
+class Command(BaseCommand):
+    help = "Fold old farm condition readings into hourly and daily rollups"
+
+    def handle(self, *args, **options):
+        counts = FarmConditionHistory.rollup()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {counts['readings']} readings and {counts['hourly']} hourly rollups"
+        ))
@@ -1,5 +1,10 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Max, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from authentication.models import Farmer
+from . import crop_types
+import hashlib
+import secrets
 import uuid
 from django.utils import timezone
 from django.core.validators import MinValueValidator, RegexValidator, MaxValueValidator
@@ -122,6 +127,196 @@ class FarmCondition(models.Model):
     def get_day_length(self):
         return self.day_length
 
+class FarmConditionReading(models.Model):
+    """
+    One reading of a farm's soil and weather conditions. Readings are only
+    ever appended; FarmCondition holds the latest values. Readings older than
+    the raw retention window are folded into hourly FarmConditionRollups by
+    the rollup_farm_conditions command.
+    """
+    METRICS = ('soil_ph', 'soil_moisture', 'rainfall', 'max_daily_temp', 'day_length')
+    
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='condition_readings')
+    recorded_at = models.DateTimeField()
+    soil_ph = models.FloatField(null=True, blank=True)
+    soil_moisture = models.FloatField(null=True, blank=True)
+    rainfall = models.FloatField(null=True, blank=True)
+    max_daily_temp = models.FloatField(null=True, blank=True)
+    day_length = models.FloatField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['farm', 'recorded_at']),
+            # Lets the rollup find expired readings across all farms
+            models.Index(fields=['recorded_at']),
+        ]
+    
+    def __str__(self):
+        return f"Conditions for {self.farm.name} at {self.recorded_at}"
+    
+    @classmethod
+    def from_condition(cls, condition):
+        """An unsaved reading holding the current values of a FarmCondition"""
+        return cls(
+            farm_id=condition.farm_id,
+            recorded_at=condition.updated_at or timezone.now(),
+            **{metric: getattr(condition, metric) for metric in cls.METRICS}
+        )
+    
+    def has_values(self):
+        return any(getattr(self, metric) is not None for metric in self.METRICS)
+
+class FarmConditionRollup(models.Model):
+    """
+    Aggregate of a farm's condition readings over one hour or one day (UTC).
+
+    `stats` maps each metric to its [count, sum, min, max] over the period,
+    so rollups can be merged into coarser periods and averaged exactly.
+    """
+    RESOLUTION_HOUR = 'hour'
+    RESOLUTION_DAY = 'day'
+    RESOLUTION_CHOICES = [
+        (RESOLUTION_HOUR, 'Hourly'),
+        (RESOLUTION_DAY, 'Daily')
+    ]
+    
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='condition_rollups')
+    resolution = models.CharField(max_length=4, choices=RESOLUTION_CHOICES)
+    period_start = models.DateTimeField()
+    sample_count = models.PositiveIntegerField(default=0)
+    stats = models.JSONField(default=dict)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['farm', 'resolution', 'period_start'], name='unique_condition_rollup_period'),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'period_start']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_resolution_display()} conditions for {self.farm.name} from {self.period_start}"
+    
+    def averages(self):
+        """Average of each metric over the period, None for metrics without samples"""
+        return {
+            metric: (self.stats[metric][1] / self.stats[metric][0]) if self.stats.get(metric) else None
+            for metric in FarmConditionReading.METRICS
+        }
+
+class FarmAnalyticsSnapshot(models.Model):
+    """
+    Materialized analytics of a farm (activity counts, crop distribution,
+    harvest and field stats and the monthly activity series), so the farm
+    pages read one row instead of recomputing aggregates on every hit.
+
+    Writes to the farm's data only mark the snapshot dirty and bump its
+    data_version; the snapshot is rebuilt by FarmAnalytics on the next read
+    once it is older than the configured staleness bound, or by the
+    refresh_farm_analytics command.
+    """
+    farm = models.OneToOneField(Farm, on_delete=models.CASCADE, primary_key=True, related_name='analytics_snapshot')
+    data = models.JSONField(default=dict)
+    data_version = models.PositiveIntegerField(
+        default=0,
+        help_text="Incremented on every change to the farm's data"
+    )
+    is_dirty = models.BooleanField(default=True)
+    dirtied_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the snapshot first went dirty since its last refresh"
+    )
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Analytics snapshot for {self.farm.name}"
+
+    @classmethod
+    def mark_dirty(cls, **filters):
+        """
+        Mark the snapshots of the farms matching the filters as dirty and
+        bump their data version. Farms without a snapshot yet are skipped,
+        they are built on first read.
+        """
+        cls.objects.filter(**filters).update(
+            is_dirty=True,
+            dirtied_at=Coalesce('dirtied_at', Value(timezone.now())),
+            data_version=F('data_version') + 1
+        )
+
+    def is_stale(self, max_staleness, now=None):
+        """
+        Whether the snapshot must be rebuilt before being served.
+
+        A dirty snapshot is served for up to max_staleness (a timedelta)
+        after it first went dirty. Snapshots from a previous day are always
+        stale since the monthly activity window has moved.
+        """
+        now = now or timezone.now()
+        if self.refreshed_at is None or self.refreshed_at.date() != now.date():
+            return True
+        if not self.is_dirty:
+            return False
+        return self.dirtied_at is None or now - self.dirtied_at >= max_staleness
+
+class FarmCropVersion(models.Model):
+    """
+    Version counter of the crop list of a farm, kept out of the Farm row so
+    saving a farm can never write back an older version.
+
+    Every change to a crop or field of the farm bumps the version, and the
+    crops it touched are stamped with the new value in Crop.version, so a
+    client holding version N only needs the crops stamped after N.
+    Deletions leave nothing to stamp; they move removed_version instead,
+    and clients older than it must reload the whole list.
+    """
+    farm = models.OneToOneField(Farm, on_delete=models.CASCADE, primary_key=True, related_name='crop_version')
+    version = models.PositiveIntegerField(default=0)
+    removed_version = models.PositiveIntegerField(
+        default=0,
+        help_text="Version at which a crop or field was last deleted"
+    )
+
+    def __str__(self):
+        return f"Crop list of {self.farm.name} (v{self.version})"
+
+    @classmethod
+    def current(cls, farm):
+        """The (version, removed_version) of a farm, (0, 0) before its first bump"""
+        try:
+            row = farm.crop_version
+        except cls.DoesNotExist:
+            return 0, 0
+        return row.version, row.removed_version
+
+    @classmethod
+    def bump(cls, farm_id, crops=None):
+        """
+        Bump the version of a farm and stamp the given crops with it.
+
+        Args:
+            farm_id: Primary key of the farm
+            crops: Optional QuerySet of the crops that changed
+        """
+        if not cls.objects.filter(farm_id=farm_id).update(version=F('version') + 1):
+            cls.objects.get_or_create(farm_id=farm_id)
+            cls.objects.filter(farm_id=farm_id).update(version=F('version') + 1)
+        if crops is not None:
+            crops.update(version=Subquery(cls.objects.filter(farm_id=farm_id).values('version')[:1]))
+
+    @classmethod
+    def mark_removed(cls, farm_id):
+        """
+        Bump the version of a farm after a crop or field was deleted. Farms
+        without a counter yet are skipped: their lists are always sent whole,
+        and the farm itself may be being deleted.
+        """
+        cls.objects.filter(farm_id=farm_id).update(
+            version=F('version') + 1,
+            removed_version=F('version') + 1
+        )
+
 class Field(models.Model):
     """Represents a specific field within a farm"""
     field_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -182,6 +377,41 @@ class Crop(models.Model):
     harvest_date = models.DateField(null=True, blank=True)
     seed_variety = models.CharField(max_length=100, blank=True, null=True)
     planting_activity = models.OneToOneField('PlantingLog', on_delete=models.SET_NULL, null=True, related_name='crop')
+    inputs_updated_at = models.DateTimeField(
+        auto_now=True,
+        help_text="Version stamp of the prediction inputs, bumped when the crop, its maintenance, harvest or farm conditions change"
+    )
+    predicted_harvest_date = models.DateField(null=True, blank=True)
+    prediction_confidence = models.PositiveSmallIntegerField(null=True, blank=True)
+    predicted_on = models.DateField(
+        null=True,
+        blank=True,
+        help_text="Date the stored prediction was computed for"
+    )
+    crop_key = models.CharField(
+        max_length=20,
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text="Canonical crop key resolved from crop_type, empty for unknown crop types"
+    )
+    version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="FarmCropVersion.version of the last change to the crop or its field"
+    )
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_harvested', 'predicted_harvest_date']),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.crop_key = crop_types.crop_key(self.crop_type)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'crop_type' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'crop_key'}
+        super().save(*args, **kwargs)
     
     def clean(self):
         """Perform model validation"""
@@ -226,6 +456,14 @@ class Crop(models.Model):
         except HarvestingLog.DoesNotExist:
             return None
     
+    @classmethod
+    def due_for_harvest(cls, start_date, end_date):
+        """Get active crops whose stored predicted harvest date falls within a date range"""
+        return cls.objects.filter(
+            is_harvested=False,
+            predicted_harvest_date__range=(start_date, end_date)
+        )
+    
     def mark_as_harvested(self, harvest_date=None):
         """Mark this crop as harvested"""
         self.is_harvested = True
@@ -247,6 +485,12 @@ class ActivityLog(models.Model):
     timestamp = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Serves the keyset paginated activity listing of a farm
+            models.Index(fields=['farm', 'timestamp', 'log_id']),
+        ]
+    
     def clean(self):
         """Perform model validation"""
         super().clean()
@@ -381,6 +625,123 @@ class MaintenanceLog(models.Model):
         self.fertilizer_applied = amount
         self.save()
 
+class CropMaintenanceSummary(models.Model):
+    """
+    Running totals of the maintenance activities of a crop, so predictions
+    and "days since maintenance" do not need to scan the crop's MaintenanceLog
+    history. Kept up to date by the activity log views and rebuilt with the
+    rebuild_maintenance_summaries command.
+    """
+    crop = models.OneToOneField(Crop, on_delete=models.CASCADE, primary_key=True, related_name='maintenance_summary')
+    maintenance_count = models.PositiveIntegerField(default=0)
+    total_fertilizer = models.FloatField(default=0)
+    total_irrigation = models.FloatField(default=0)
+    total_pesticide = models.FloatField(default=0)
+    last_maintenance_at = models.DateTimeField(null=True, blank=True)
+    
+    # Totals are rounded after each change so repeated add/remove cycles don't drift
+    PRECISION = 9
+    
+    def __str__(self):
+        return f"Maintenance summary for {self.crop}"
+    
+    @staticmethod
+    def log_values(maintenance_log):
+        """Capture the values of a maintenance log that feed its crop's summary"""
+        return {
+            'log_id': maintenance_log.pk,
+            'crop_id': maintenance_log.crop_id,
+            'fertilizer': maintenance_log.fertilizer_applied or 0,
+            'irrigation': maintenance_log.irrigation_amount or 0,
+            'pesticide': maintenance_log.pesticide_applied or 0,
+            'timestamp': maintenance_log.activity_log.timestamp,
+        }
+    
+    @classmethod
+    def add_maintenance(cls, values):
+        """Add a saved maintenance log (see log_values) to its crop's summary"""
+        cls._apply(values, 1)
+    
+    @classmethod
+    def remove_maintenance(cls, values):
+        """Remove a maintenance log (see log_values) from its crop's summary"""
+        cls._apply(values, -1)
+    
+    @classmethod
+    def _apply(cls, values, sign):
+        crop_id = values['crop_id']
+        if not crop_id:
+            return
+        
+        with transaction.atomic():
+            summary = cls.objects.select_for_update().filter(crop_id=crop_id).first()
+            if summary is None:
+                # No summary yet: build it from the logs, which already reflect an
+                # added log but still contain a log that is being removed
+                exclude_log_ids = [values['log_id']] if sign < 0 else []
+                cls.rebuild(Crop.objects.filter(pk=crop_id), exclude_log_ids=exclude_log_ids)
+                return
+            
+            summary.maintenance_count += sign
+            if summary.maintenance_count <= 0:
+                # Crops without maintenance have no summary, same as after a rebuild
+                summary.delete()
+                return
+            
+            summary.total_fertilizer = round(summary.total_fertilizer + sign * values['fertilizer'], cls.PRECISION)
+            summary.total_irrigation = round(summary.total_irrigation + sign * values['irrigation'], cls.PRECISION)
+            summary.total_pesticide = round(summary.total_pesticide + sign * values['pesticide'], cls.PRECISION)
+            
+            timestamp = values['timestamp']
+            if sign > 0:
+                if summary.last_maintenance_at is None or timestamp > summary.last_maintenance_at:
+                    summary.last_maintenance_at = timestamp
+            elif summary.last_maintenance_at is None or timestamp >= summary.last_maintenance_at:
+                # The latest maintenance was removed, find the one before it
+                summary.last_maintenance_at = MaintenanceLog.objects.filter(
+                    crop_id=crop_id
+                ).exclude(pk=values['log_id']).aggregate(
+                    last=Max('activity_log__timestamp')
+                )['last']
+            summary.save()
+    
+    @classmethod
+    def rebuild(cls, crops=None, exclude_log_ids=()):
+        """
+        Recompute the summaries of the given crops (all crops by default)
+        from their maintenance logs.
+        
+        Returns: Number of summaries written
+        """
+        crop_ids = (crops if crops is not None else Crop.objects.all()).values('pk')
+        rows = MaintenanceLog.objects.filter(
+            crop__in=crop_ids
+        ).exclude(pk__in=exclude_log_ids).values('crop').annotate(
+            count=Count('pk'),
+            fertilizer=Sum('fertilizer_applied'),
+            irrigation=Sum('irrigation_amount'),
+            pesticide=Sum('pesticide_applied'),
+            last=Max('activity_log__timestamp'),
+        ).order_by()
+        
+        summaries = [
+            cls(
+                crop_id=row['crop'],
+                maintenance_count=row['count'],
+                total_fertilizer=round(row['fertilizer'] or 0, cls.PRECISION),
+                total_irrigation=round(row['irrigation'] or 0, cls.PRECISION),
+                total_pesticide=round(row['pesticide'] or 0, cls.PRECISION),
+                last_maintenance_at=row['last'],
+            )
+            for row in rows
+        ]
+        
+        with transaction.atomic():
+            cls.objects.filter(crop__in=crop_ids).delete()
+            cls.objects.bulk_create(summaries, batch_size=1000)
+        
+        return len(summaries)
+
 class HarvestingLog(models.Model):
     activity_log = models.OneToOneField(ActivityLog, on_delete=models.CASCADE, primary_key=True)
     crop = models.OneToOneField(Crop, on_delete=models.CASCADE, related_name='harvest_activity', null=True, blank=True)
@@ -407,4 +768,183 @@ class HarvestingLog(models.Model):
         # Mark the crop as harvested when saving a harvest log
         super().save(*args, **kwargs)
         if self.crop and not self.crop.is_harvested:
-            self.crop.mark_as_harvested(harvest_date=self.activity_log.timestamp.date())
\ No newline at end of file
+            self.crop.mark_as_harvested(harvest_date=self.activity_log.timestamp.date())
+
+
+class FarmReportJob(models.Model):
+    """
+    A PDF report export of a farm, rendered by the process_farm_reports
+    worker. Finished jobs keep their PDF as the cached artifact for the
+    farm's data_version, so unchanged farms are served without rendering.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed')
+    ]
+    
+    job_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='report_jobs')
+    data_version = models.PositiveIntegerField(help_text="FarmAnalyticsSnapshot.data_version the report was requested for")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    pdf = models.FileField(upload_to='farm_reports/', null=True, blank=True)
+    filename = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['farm', 'data_version']),
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Report of {self.farm.name} (v{self.data_version}, {self.status})"
+    
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+class FarmPortfolioJob(models.Model):
+    """
+    A zip export of the reports of all of a farmer's farms, built by the
+    process_farm_reports worker from the farms' cached FarmReportJob PDFs.
+    The fingerprint identifies the farms and data versions it covers, so a
+    finished archive is reused until one of them changes.
+    """
+    STATUS_PENDING = FarmReportJob.STATUS_PENDING
+    STATUS_RUNNING = FarmReportJob.STATUS_RUNNING
+    STATUS_DONE = FarmReportJob.STATUS_DONE
+    STATUS_FAILED = FarmReportJob.STATUS_FAILED
+    STATUS_CHOICES = FarmReportJob.STATUS_CHOICES
+
+    job_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    farmer = models.ForeignKey(Farmer, on_delete=models.CASCADE, related_name='portfolio_jobs')
+    fingerprint = models.CharField(max_length=32, help_text="Hash of the farms and data versions exported")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    archive = models.FileField(upload_to='farm_portfolios/', null=True, blank=True)
+    filename = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['farmer', 'fingerprint']),
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Portfolio of {self.farmer} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+class SensorToken(models.Model):
+    """
+    API token a sensor gateway uses to post condition readings for one farm.
+    Only a hash of the token is stored; the token itself is shown once, when
+    it is issued.
+    """
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='sensor_tokens')
+    name = models.CharField(max_length=100)
+    token_hash = models.CharField(max_length=64, unique=True, editable=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.name} ({self.farm.name})"
+    
+    @staticmethod
+    def hash_token(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+    
+    @classmethod
+    def issue(cls, farm, name):
+        """
+        Create a token for a farm.
+        
+        Returns: Tuple of (SensorToken, token), the token in plain text
+        """
+        token = secrets.token_urlsafe(32)
+        sensor_token = cls.objects.create(farm=farm, name=name, token_hash=cls.hash_token(token))
+        return sensor_token, token
+    
+    @classmethod
+    def authenticate(cls, token):
+        """The active SensorToken matching a plain text token, or None"""
+        if not token:
+            return None
+        return cls.objects.select_related('farm').filter(
+            token_hash=cls.hash_token(token),
+            is_active=True
+        ).first()
+
+
+class PredictionParameterSet(models.Model):
+    """
+    A versioned set of harvest prediction rule adjustments, fitted by the
+    backtest_harvest_predictions command. The engine scores with the
+    active set, or with its built-in rules when no set is active.
+    """
+    version = models.PositiveIntegerField(unique=True)
+    parameters = models.JSONField(help_text="prediction_rules.RuleSet parameters")
+    metrics = models.JSONField(default=dict, blank=True, help_text="Backtest errors before and after fitting")
+    is_active = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    activated_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-version']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_active'],
+                condition=models.Q(is_active=True),
+                name='single_active_prediction_parameter_set'
+            )
+        ]
+    
+    def __str__(self):
+        return f"Prediction parameters v{self.version}{' (active)' if self.is_active else ''}"
+    
+    # Attempts at taking the next version number when concurrent runs collide
+    CREATE_ATTEMPTS = 5
+    
+    @classmethod
+    def create_version(cls, parameters, metrics=None):
+        """
+        Store parameters as the next version, inactive.
+
+        The latest set is locked while its successor is stored. A run that
+        still collides on the unique version (e.g. two runs storing the
+        first set, with no row to lock) retries with the next number.
+        """
+        for attempt in range(cls.CREATE_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    latest = cls.objects.select_for_update().order_by('-version').only('version').first()
+                    return cls.objects.create(
+                        version=(latest.version if latest else 0) + 1,
+                        parameters=parameters,
+                        metrics=metrics or {}
+                    )
+            except IntegrityError:
+                if attempt == cls.CREATE_ATTEMPTS - 1:
+                    raise
+    
+    def activate(self):
+        """Make this the set predictions are scored with"""
+        with transaction.atomic():
+            type(self).objects.filter(is_active=True).exclude(pk=self.pk).update(is_active=False)
+            self.is_active = True
+            self.activated_at = timezone.now()
+            self.save(update_fields=['is_active', 'activated_at'])
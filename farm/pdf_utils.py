@@ -1,27 +1,32 @@
 import io
 from datetime import datetime
-from django.http import HttpResponse
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, landscape
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
 
-def generate_farm_report_pdf(farm, fields, crops, active_crops, recent_activities, farm_condition=None):
+def farm_report_filename(farm_name, generated_at=None):
+    """Download filename of a farm report"""
+    generated_at = generated_at or datetime.now()
+    return f"farm_report_{farm_name.replace(' ', '_')}_{generated_at.strftime('%Y%m%d')}.pdf"
+
+def build_farm_report_pdf(report):
     """
-    Generate a PDF report for a farm with all its details.
+    Render the PDF report of a farm.
+    
+    The report data only holds plain values and row tuples, so rendering
+    never touches the database.
     
     Args:
-        farm: The Farm model instance
-        fields: QuerySet of Field objects
-        crops: QuerySet of Crop objects
-        active_crops: QuerySet of active Crop objects
-        recent_activities: QuerySet of ActivityLog objects
-        farm_condition: Optional FarmCondition instance
-        
+        report: Report data from FarmReportLoader.load
+    
     Returns:
-        HttpResponse with PDF attachment
+        The PDF document as bytes
     """
+    farm = report['farm']
+    farm_condition = report['condition']
+    
     # Create a buffer for the PDF
     buffer = io.BytesIO()
     
@@ -61,18 +66,18 @@ def generate_farm_report_pdf(farm, fields, crops, active_crops, recent_activitie
     # elements.append(Image("path/to/logo.png", width=2*inch, height=1*inch))
     
     # Title
-    title = Paragraph(f"Farm Report: {farm.name}", styles['CenterTitle'])
+    title = Paragraph(f"Farm Report: {farm['name']}", styles['CenterTitle'])
     elements.append(title)
     elements.append(Spacer(1, 0.25*inch))
     
     # Farm details
     elements.append(Paragraph("FARM DETAILS", styles['Heading2']))
     farm_data = [
-        ["Farm Name:", farm.name],
-        ["Location:", farm.location],
-        ["Size:", f"{farm.size} hectares"],
-        ["Created:", farm.created_at.strftime("%B %d, %Y")],
-        ["Last Updated:", farm.updated_at.strftime("%B %d, %Y")]
+        ["Farm Name:", farm['name']],
+        ["Location:", farm['location']],
+        ["Size:", f"{farm['size']} hectares"],
+        ["Created:", farm['created_at'].strftime("%B %d, %Y")],
+        ["Last Updated:", farm['updated_at'].strftime("%B %d, %Y")]
     ]
     
     farm_table = Table(farm_data, colWidths=[2*inch, 4*inch])
@@ -102,20 +107,20 @@ def generate_farm_report_pdf(farm, fields, crops, active_crops, recent_activitie
         
         conditions_data = [["Metric", "Value"]]
         
-        if farm_condition.soil_ph is not None:
-            conditions_data.append(["Soil pH", f"{farm_condition.soil_ph:.1f}"])
+        if farm_condition['soil_ph'] is not None:
+            conditions_data.append(["Soil pH", f"{farm_condition['soil_ph']:.1f}"])
             
-        if farm_condition.soil_moisture is not None:
-            conditions_data.append(["Soil Moisture", f"{farm_condition.soil_moisture:.1f}%"])
+        if farm_condition['soil_moisture'] is not None:
+            conditions_data.append(["Soil Moisture", f"{farm_condition['soil_moisture']:.1f}%"])
             
-        if farm_condition.rainfall is not None:
-            conditions_data.append(["Rainfall", f"{farm_condition.rainfall:.1f} mm"])
+        if farm_condition['rainfall'] is not None:
+            conditions_data.append(["Rainfall", f"{farm_condition['rainfall']:.1f} mm"])
             
-        if farm_condition.max_daily_temp is not None:
-            conditions_data.append(["Max Temperature", f"{farm_condition.max_daily_temp:.1f}°C"])
+        if farm_condition['max_daily_temp'] is not None:
+            conditions_data.append(["Max Temperature", f"{farm_condition['max_daily_temp']:.1f}°C"])
             
-        if farm_condition.day_length is not None:
-            conditions_data.append(["Day Length", f"{farm_condition.day_length:.1f} hours"])
+        if farm_condition['day_length'] is not None:
+            conditions_data.append(["Day Length", f"{farm_condition['day_length']:.1f} hours"])
         
         if len(conditions_data) > 1:  # Only create table if there's data
             condition_table = Table(conditions_data, colWidths=[3*inch, 3*inch])
@@ -143,15 +148,15 @@ def generate_farm_report_pdf(farm, fields, crops, active_crops, recent_activitie
     # Fields section
     elements.append(Paragraph("FIELDS", styles['Heading2']))
     
-    if fields.exists():
+    if report['field_rows']:
         fields_data = [["Field Name", "Size (ha)", "Location", "Active Crops"]]
         
-        for field in fields:
+        for name, size, location, active_crop_count in report['field_rows']:
             fields_data.append([
-                field.name, 
-                f"{field.size:.2f}",
-                field.location_within_farm or "N/A",
-                str(field.get_active_crop_count())
+                name, 
+                f"{size:.2f}",
+                location or "N/A",
+                str(active_crop_count)
             ])
         
         fields_table = Table(fields_data, colWidths=[2*inch, 1*inch, 2.5*inch, 1*inch])
@@ -183,15 +188,15 @@ def generate_farm_report_pdf(farm, fields, crops, active_crops, recent_activitie
     # Active Crops section
     elements.append(Paragraph("ACTIVE CROPS", styles['Heading2']))
     
-    if active_crops.exists():
+    if report['active_crop_rows']:
         crops_data = [["Crop Type", "Field", "Planting Date", "Expected Harvest"]]
         
-        for crop in active_crops:
-            expected_harvest = crop.expected_harvest_date.strftime("%B %d, %Y") if crop.expected_harvest_date else "Not specified"
+        for crop_type, field_name, planting_date, expected_harvest_date in report['active_crop_rows']:
+            expected_harvest = expected_harvest_date.strftime("%B %d, %Y") if expected_harvest_date else "Not specified"
             crops_data.append([
-                crop.crop_type,
-                crop.field.name,
-                crop.planting_date.strftime("%B %d, %Y"),
+                crop_type,
+                field_name,
+                planting_date.strftime("%B %d, %Y"),
                 expected_harvest
             ])
         
@@ -222,32 +227,13 @@ def generate_farm_report_pdf(farm, fields, crops, active_crops, recent_activitie
     # Recent activities section
     elements.append(Paragraph("RECENT ACTIVITIES", styles['Heading2']))
     
-    if recent_activities:
+    if report['activity_rows']:
         activities_data = [["Date", "Activity Type", "Details"]]
         
-        for activity in recent_activities:
-            # Generate detail text based on activity type
-            detail_text = "Activity recorded"
-            try:
-                if activity.activity_type == 'preparation':
-                    prep = activity.preparationlog
-                    detail_text = f"Field: {prep.field.name}, Equipment: {prep.equipment_used}"
-                elif activity.activity_type == 'planting':
-                    plant = activity.plantinglog
-                    detail_text = f"Field: {plant.field.name}, Crop: {plant.crop.crop_type}"
-                elif activity.activity_type == 'maintenance':
-                    maint = activity.maintenancelog
-                    detail_text = f"Crop: {maint.crop.crop_type}"
-                elif activity.activity_type == 'harvesting':
-                    harv = activity.harvestinglog
-                    detail_text = f"Crop: {harv.crop.crop_type}, Yield: {harv.yield_amount} kg"
-            except:
-                # If any relations don't exist, just use the default text
-                pass
-            
+        for timestamp, activity_type_display, detail_text in report['activity_rows']:
             activities_data.append([
-                activity.timestamp.strftime("%B %d, %Y"),
-                activity.get_activity_type_display(),
+                timestamp.strftime("%B %d, %Y"),
+                activity_type_display,
                 detail_text
             ])
         
@@ -282,14 +268,81 @@ def generate_farm_report_pdf(farm, fields, crops, active_crops, recent_activitie
     # Build PDF
     doc.build(elements)
     
-    # Get the value of the BytesIO buffer and create response
+    # Get the value of the BytesIO buffer
     pdf = buffer.getvalue()
     buffer.close()
     
-    # Create HTTP response with PDF
-    filename = f"farm_report_{farm.name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf"
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    response.write(pdf)
+    return pdf
+
+def build_portfolio_summary_pdf(summary_rows):
+    """
+    Render the consolidated summary page of a multi-farm portfolio export.
+    
+    Args:
+        summary_rows: (name, location, size, field count, field area,
+            active crop count) tuples, one per farm
+    
+    Returns:
+        The PDF document as bytes
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=landscape(letter),
+                        rightMargin=72, leftMargin=72,
+                        topMargin=72, bottomMargin=72)
+    
+    styles = getSampleStyleSheet()
+    if 'CenterTitle' not in styles:
+        styles.add(ParagraphStyle(name='CenterTitle', fontSize=16, alignment=1, spaceAfter=12))
+    
+    elements = []
+    elements.append(Paragraph("Farm Portfolio Summary", styles['CenterTitle']))
+    elements.append(Spacer(1, 0.25*inch))
+    
+    summary_data = [["Farm", "Location", "Size (ha)", "Fields", "Field Area (ha)", "Active Crops"]]
+    for name, location, size, field_count, field_area, active_crop_count in summary_rows:
+        summary_data.append([
+            name,
+            location,
+            f"{size:.2f}",
+            str(field_count),
+            f"{field_area:.2f}",
+            str(active_crop_count)
+        ])
+    summary_data.append([
+        "Total",
+        f"{len(summary_rows)} farms",
+        f"{sum(row[2] for row in summary_rows):.2f}",
+        str(sum(row[3] for row in summary_rows)),
+        f"{sum(row[4] for row in summary_rows):.2f}",
+        str(sum(row[5] for row in summary_rows))
+    ])
+    
+    summary_table = Table(summary_data, colWidths=[2*inch, 2*inch, 1*inch, 0.8*inch, 1.3*inch, 1*inch])
+    summary_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -2), colors.white),
+        ('ALIGN', (2, 1), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (0, 1), (-1, -2), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('BOX', (0, 0), (-1, -1), 1, colors.black),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ]))
+    elements.append(summary_table)
+    
+    elements.append(Spacer(1, 0.5*inch))
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    elements.append(Paragraph(f"Report generated: {timestamp}", styles['Normal']))
+    
+    doc.build(elements)
+    pdf = buffer.getvalue()
+    buffer.close()
     
-    return response
\ No newline at end of file
+    return pdf
@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+from .harvest_prediction import HarvestPredictionSystem
+
+class PredictionCache:
+    """
+    Bounded in-process LRU cache for harvest predictions.
+
+    Entries are keyed by crop, the crop's prediction input version stamp
+    (Crop.inputs_updated_at), the date the prediction was made for and
+    the version of the prediction rules, so any change to the inputs, a
+    new day or newly activated rules produce a new key and old entries
+    simply age out of the LRU.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for a key, or None on a miss"""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries if full"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the hit/miss counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+            }
+
+prediction_cache = PredictionCache(max_size=getattr(settings, 'HARVEST_PREDICTION_CACHE_SIZE', 1024))
+
+def get_cached_prediction(crop, farm_condition=None):
+    """
+    Get the predicted harvest date and confidence level for a crop,
+    computing and caching them on a miss.
+
+    Returns:
+        Tuple of (predicted_date, confidence)
+    """
+    key = (crop.crop_id, crop.inputs_updated_at, timezone.now().date(), HarvestPredictionSystem.rules().version)
+    prediction = prediction_cache.get(key)
+    if prediction is None:
+        prediction = (
+            HarvestPredictionSystem.predict_harvest_date(crop, farm_condition),
+            HarvestPredictionSystem.get_confidence_level(crop, farm_condition),
+        )
+        prediction_cache.set(key, prediction)
+    return prediction
@@ -0,0 +1,196 @@
+import numpy as np
+
+class BreakpointTable:
+    """
+    A threshold ladder compiled into arrays so whole columns of values can
+    be scored in one vectorized pass.
+
+    The ladder is described by ascending breakpoints. Each breakpoint is a
+    (threshold, inclusive) pair that starts a new segment: inclusive
+    breakpoints start at the threshold (x >= threshold), exclusive ones
+    just above it (x > threshold). `values` holds one adjustment per
+    segment, so it is always one longer than the breakpoints.
+    """
+
+    def __init__(self, breakpoints, values, missing=0):
+        if len(values) != len(breakpoints) + 1:
+            raise ValueError("A breakpoint table needs exactly one more value than breakpoints")
+
+        self.breakpoints = list(breakpoints)
+        self.thresholds = np.array([threshold for threshold, _ in breakpoints], dtype=float)
+        self.inclusive = np.array([inclusive for _, inclusive in breakpoints], dtype=bool)
+        self.values = np.array(values, dtype=np.int64)
+        self.missing = missing
+
+    def evaluate(self, column):
+        """
+        Score a column of values against the ladder.
+
+        Missing values (NaN) score as `missing`.
+
+        Returns: Integer array of day adjustments
+        """
+        column = np.asarray(column, dtype=float)
+        return np.where(np.isnan(column), self.missing, self.values[self.segments(column)])
+
+    def segments(self, column):
+        """
+        Index of the segment every value of a column falls in.
+
+        Returns: Integer array; missing values (NaN) land in segment 0
+        """
+        column = np.asarray(column, dtype=float)
+        above = column[..., np.newaxis] > self.thresholds
+        at_or_above = column[..., np.newaxis] >= self.thresholds
+        return np.where(self.inclusive, at_or_above, above).sum(axis=-1)
+
+    def with_values(self, values):
+        """The same ladder with other adjustments per segment"""
+        return BreakpointTable(self.breakpoints, values, missing=self.missing)
+
+# Maintenance ladders, scored on the average amount per maintenance activity
+FERTILIZER_TABLE = BreakpointTable([(0, False), (5, False), (15, False)], [0, -5, -10, 5])
+IRRIGATION_TABLE = BreakpointTable([(0, False), (100, False), (500, False)], [0, -3, -7, 10])
+PESTICIDE_TABLE = BreakpointTable([(0, False), (3, False)], [0, -3, 2])
+
+# Maintenance activities per month
+FREQUENCY_TABLE = BreakpointTable([(1, True), (4, True)], [10, -5, -8])
+
+# Temperature ladders per crop temperature profile
+TEMPERATURE_PROFILES = ('general', 'rice', 'corn')
+TEMPERATURE_TABLES = (
+    BreakpointTable([(15, True), (18, True), (28, False), (32, False)], [10, -3, -7, -3, 10]),
+    BreakpointTable([(20, True), (25, True), (30, False), (35, False)], [0, -5, -10, -5, 15]),
+    BreakpointTable([(15, True), (20, True), (30, False), (32, False)], [0, -3, -8, -3, 10]),
+)
+
+# Soil and weather ladders shared by all crops
+SOIL_PH_TABLE = BreakpointTable([(5.5, True), (6.0, True), (7.0, False), (7.5, False)], [8, -2, -5, -2, 8])
+SOIL_MOISTURE_TABLE = BreakpointTable(
+    [(20, True), (40, True), (50, True), (70, False), (80, False), (90, False)],
+    [15, 0, -3, -7, -3, 0, 20]
+)
+RAINFALL_TABLE = BreakpointTable(
+    [(50, True), (100, True), (200, False), (300, False), (400, False)],
+    [0, -2, -5, -2, 0, 10]
+)
+DAY_LENGTH_TABLE = BreakpointTable([(8, True), (10, True), (14, False), (16, False)], [3, -2, -5, -2, 3])
+
+# Adjustment for crops without any maintenance
+NO_MAINTENANCE_DAYS = 15
+
+class RuleSet:
+    """
+    The adjustments the prediction rules score with.
+
+    The breakpoints of every table are fixed; a rule set only chooses the
+    days each segment adds, the penalty for crops without maintenance and,
+    optionally, the base growing period per canonical crop key ('' for
+    crops of unknown type). Crop keys it leaves out use the engine's
+    built-in growing periods.
+    """
+
+    TABLE_NAMES = (
+        'fertilizer', 'irrigation', 'pesticide', 'frequency',
+        *(f'temperature_{profile}' for profile in TEMPERATURE_PROFILES),
+        'soil_ph', 'soil_moisture', 'rainfall', 'day_length',
+    )
+
+    def __init__(self, tables, no_maintenance=NO_MAINTENANCE_DAYS, growing_periods=None, version=None):
+        self.tables = dict(tables)
+        self.no_maintenance = no_maintenance
+        self.growing_periods = dict(growing_periods or {})
+        self.version = version
+
+    @property
+    def temperature_tables(self):
+        return tuple(self.tables[f'temperature_{profile}'] for profile in TEMPERATURE_PROFILES)
+
+    def parameters(self):
+        """The rule set as JSON-serializable parameters"""
+        return {
+            'tables': {name: self.tables[name].values.tolist() for name in self.TABLE_NAMES},
+            'no_maintenance': int(self.no_maintenance),
+            'growing_periods': {key: int(days) for key, days in self.growing_periods.items()},
+        }
+
+    def with_parameters(self, parameters, version=None):
+        """
+        A copy of this rule set with the given parameters applied on top.
+
+        Raises: ValueError for unknown tables or a wrong number of values
+        """
+        tables = dict(self.tables)
+        for name, values in (parameters.get('tables') or {}).items():
+            if name not in tables:
+                raise ValueError(f"Unknown rule table: {name}")
+            tables[name] = tables[name].with_values(values)
+        return RuleSet(
+            tables,
+            no_maintenance=parameters.get('no_maintenance', self.no_maintenance),
+            growing_periods={**self.growing_periods, **(parameters.get('growing_periods') or {})},
+            version=version
+        )
+
+DEFAULT_RULES = RuleSet(dict(zip(RuleSet.TABLE_NAMES, (
+    FERTILIZER_TABLE, IRRIGATION_TABLE, PESTICIDE_TABLE, FREQUENCY_TABLE,
+    *TEMPERATURE_TABLES,
+    SOIL_PH_TABLE, SOIL_MOISTURE_TABLE, RAINFALL_TABLE, DAY_LENGTH_TABLE,
+))))
+
+def maintenance_effect(maintenance_count, total_fertilizer, total_irrigation, total_pesticide, days_since_planting,
+                       rules=DEFAULT_RULES):
+    """
+    Day adjustment of the maintenance of crops: the fertilizer, irrigation
+    and pesticide amounts per activity and the activity frequency, each
+    scored with its breakpoint table.
+
+    All arguments are equally sized columns, one entry per crop. The
+    adjustments come from `rules`, the built-in rules by default.
+
+    Returns: Integer array of day adjustments
+    """
+    count = np.asarray(maintenance_count, dtype=float)
+    days = np.asarray(days_since_planting, dtype=float)
+    has_maintenance = count > 0
+    safe_count = np.where(has_maintenance, count, 1)
+
+    adjustment = np.zeros(count.shape, dtype=np.int64)
+    for totals, table in ((total_fertilizer, rules.tables['fertilizer']),
+                          (total_irrigation, rules.tables['irrigation']),
+                          (total_pesticide, rules.tables['pesticide'])):
+        totals = np.asarray(totals, dtype=float)
+        adjustment += np.where(totals > 0, table.evaluate(totals / safe_count), 0)
+
+    # Frequency only applies once the crop has been in the ground for a day
+    planted = days > 0
+    frequency = count / np.where(planted, days, 1) * 30
+    adjustment += np.where(planted, rules.tables['frequency'].evaluate(frequency), 0)
+
+    # No maintenance at all might extend growing period
+    return np.where(has_maintenance, adjustment, rules.no_maintenance)
+
+def environment_effect(temperature_profile, max_daily_temp, soil_ph, soil_moisture, rainfall, day_length,
+                       rules=DEFAULT_RULES):
+    """
+    Day adjustment of the farm conditions of crops: temperature (with a
+    ladder per crop profile), soil pH, soil moisture, rainfall and day
+    length, each scored with its breakpoint table.
+
+    `temperature_profile` holds indexes into TEMPERATURE_PROFILES; the
+    condition columns use NaN for readings that are not recorded. The
+    adjustments come from `rules`, the built-in rules by default.
+
+    Returns: Integer array of day adjustments
+    """
+    temperature = np.choose(
+        np.asarray(temperature_profile, dtype=np.int64),
+        [table.evaluate(max_daily_temp) for table in rules.temperature_tables]
+    )
+    return (
+        temperature
+        + rules.tables['soil_ph'].evaluate(soil_ph)
+        + rules.tables['soil_moisture'].evaluate(soil_moisture)
+        + rules.tables['rainfall'].evaluate(rainfall)
+        + rules.tables['day_length'].evaluate(day_length)
+    )
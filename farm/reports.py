@@ -0,0 +1,461 @@
+import datetime
+import hashlib
+import io
+import logging
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Crop, Farm, FarmAnalyticsSnapshot, FarmCondition, FarmPortfolioJob, FarmReportJob
+from .pdf_utils import build_farm_report_pdf, build_portfolio_summary_pdf, farm_report_filename
+
+logger = logging.getLogger(__name__)
+
+class FarmReportLoader:
+    """
+    Loads everything a farm report shows as plain values and row tuples.
+
+    The data is fetched with a fixed number of queries (farm condition,
+    fields with their active crop counts, active crops with their field and
+    activities with all their specialized logs), however many fields, crops
+    or activities the report covers.
+    """
+
+    CONDITION_FIELDS = ('soil_ph', 'soil_moisture', 'rainfall', 'max_daily_temp', 'day_length')
+
+    @classmethod
+    def default_activity_limit(cls):
+        """Number of activities in a report (FARM_REPORT_ACTIVITY_LIMIT, 0 for all)"""
+        return getattr(settings, 'FARM_REPORT_ACTIVITY_LIMIT', 10)
+
+    @classmethod
+    def load(cls, farm, activity_limit=None, activity_since=None):
+        """
+        Load the report data of a farm.
+
+        Args:
+            farm: The Farm model instance
+            activity_limit: Maximum number of most recent activities, 0 for
+                all of them; defaults to default_activity_limit()
+            activity_since: Optional datetime; only activities from then on
+                are included
+
+        Returns: Dictionary with farm, condition, field_rows,
+        active_crop_rows and activity_rows
+        """
+        if activity_limit is None:
+            activity_limit = cls.default_activity_limit()
+
+        condition = FarmCondition.objects.filter(farm=farm).values(*cls.CONDITION_FIELDS).first()
+
+        field_rows = [
+            (field['name'], field['size'], field['location_within_farm'], field['active_crop_count'])
+            for field in farm.fields.annotate(
+                active_crop_count=Count('crops', filter=Q(crops__is_harvested=False))
+            ).order_by('created_at').values('name', 'size', 'location_within_farm', 'active_crop_count')
+        ]
+
+        active_crop_rows = list(
+            Crop.objects.filter(field__farm=farm, is_harvested=False).order_by(
+                'planting_date', 'crop_type'
+            ).values_list('crop_type', 'field__name', 'planting_date', 'expected_harvest_date')
+        )
+
+        activities = farm.activities.select_related(
+            'preparationlog__field',
+            'plantinglog__field',
+            'plantinglog__crop',
+            'maintenancelog__crop',
+            'harvestinglog__crop'
+        ).order_by('-timestamp')
+        if activity_since is not None:
+            activities = activities.filter(timestamp__gte=activity_since)
+        if activity_limit:
+            activities = activities[:activity_limit]
+
+        activity_rows = [
+            (activity.timestamp, activity.get_activity_type_display(), cls.activity_detail(activity))
+            for activity in activities
+        ]
+
+        return {
+            'farm': {
+                'name': farm.name,
+                'location': farm.location,
+                'size': farm.size,
+                'created_at': farm.created_at,
+                'updated_at': farm.updated_at,
+            },
+            'condition': condition,
+            'field_rows': field_rows,
+            'active_crop_rows': active_crop_rows,
+            'activity_rows': activity_rows,
+        }
+
+    @classmethod
+    def activity_detail(cls, activity):
+        """Detail text of an activity, read from its already loaded specialized log"""
+        try:
+            if activity.activity_type == 'preparation':
+                prep = activity.preparationlog
+                return f"Field: {prep.field.name}, Equipment: {prep.equipment_used}"
+            elif activity.activity_type == 'planting':
+                plant = activity.plantinglog
+                return f"Field: {plant.field.name}, Crop: {plant.crop.crop_type}"
+            elif activity.activity_type == 'maintenance':
+                maint = activity.maintenancelog
+                return f"Crop: {maint.crop.crop_type}"
+            elif activity.activity_type == 'harvesting':
+                harv = activity.harvestinglog
+                return f"Crop: {harv.crop.crop_type}, Yield: {harv.yield_amount} kg"
+        except (ObjectDoesNotExist, AttributeError):
+            # If any relations don't exist, just use the default text
+            pass
+        return "Activity recorded"
+
+class FarmReportExporter:
+    """
+    Job based PDF export of farm reports.
+
+    Requests only enqueue a FarmReportJob for the farm's current data
+    version; the process_farm_reports worker renders it outside the web
+    process. A finished job is reused for as long as the farm's data does
+    not change.
+    """
+
+    @classmethod
+    def current_data_version(cls, farm):
+        """The data version of a farm, as tracked by its analytics snapshot"""
+        snapshot, _ = FarmAnalyticsSnapshot.objects.get_or_create(farm=farm)
+        return snapshot.data_version
+
+    @classmethod
+    def request_report(cls, farm):
+        """
+        Get the report job for the farm's current data, enqueueing a new
+        one unless a finished or in-progress job already exists.
+
+        Returns: FarmReportJob
+        """
+        data_version = cls.current_data_version(farm)
+        job = FarmReportJob.objects.filter(
+            farm=farm,
+            data_version=data_version
+        ).exclude(status=FarmReportJob.STATUS_FAILED).order_by('-created_at').first()
+
+        if job is None:
+            job = FarmReportJob.objects.create(farm=farm, data_version=data_version)
+        return job
+
+    @classmethod
+    def job_timeout(cls):
+        """How long a running job may take before another worker reclaims it"""
+        return datetime.timedelta(seconds=getattr(settings, 'FARM_REPORT_JOB_TIMEOUT', 600))
+
+    @classmethod
+    def claim_next_job(cls, now=None, model=FarmReportJob):
+        """
+        Claim the oldest pending job of a job model, or a running job whose
+        worker timed out.
+
+        Returns: The claimed job, or None if the queue is empty
+        """
+        now = now or timezone.now()
+        with transaction.atomic():
+            jobs = model.objects.filter(
+                Q(status=model.STATUS_PENDING) |
+                Q(status=model.STATUS_RUNNING, started_at__lt=now - cls.job_timeout())
+            ).order_by('created_at')
+            if connection.features.has_select_for_update_skip_locked:
+                jobs = jobs.select_for_update(skip_locked=True)
+            else:
+                jobs = jobs.select_for_update()
+
+            job = jobs.first()
+            if job is not None:
+                job.status = model.STATUS_RUNNING
+                job.started_at = now
+                job.save(update_fields=['status', 'started_at'])
+        return job
+
+    @classmethod
+    def render_job(cls, job):
+        """Render the PDF of a claimed job and store it as the job's artifact"""
+        try:
+            pdf = build_farm_report_pdf(FarmReportLoader.load(job.farm))
+        except Exception as e:
+            logger.exception("Rendering report job %s failed", job.pk)
+            return cls.fail_job(job, e)
+        return cls.store_pdf(job, pdf)
+
+    @classmethod
+    def fail_job(cls, job, error):
+        """Mark a claimed job as failed with the error that stopped its rendering"""
+        job.status = FarmReportJob.STATUS_FAILED
+        job.error = str(error)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        return job
+
+    @classmethod
+    def store_pdf(cls, job, pdf):
+        """Store the rendered PDF of a claimed job as its artifact and finish it"""
+        farm = job.farm
+        job.pdf.save(f"{job.pk}.pdf", ContentFile(pdf), save=False)
+        job.filename = farm_report_filename(farm.name)
+        job.status = FarmReportJob.STATUS_DONE
+        job.finished_at = timezone.now()
+        job.save(update_fields=['pdf', 'filename', 'status', 'finished_at'])
+
+        cls.prune_reports(farm, job.data_version)
+        return job
+
+    @classmethod
+    def prune_reports(cls, farm, data_version):
+        """Delete finished reports of a farm that older data versions left behind"""
+        old_jobs = FarmReportJob.objects.filter(
+            farm=farm,
+            data_version__lt=data_version
+        ).exclude(status__in=[FarmReportJob.STATUS_PENDING, FarmReportJob.STATUS_RUNNING])
+
+        for old_job in old_jobs:
+            if old_job.pdf:
+                old_job.pdf.delete(save=False)
+        old_jobs.delete()
+
+    @classmethod
+    def run_pending(cls, limit=None):
+        """
+        Render queued jobs until the queue is empty or `limit` jobs are done.
+
+        Returns: Number of jobs processed
+        """
+        processed = 0
+        while limit is None or processed < limit:
+            job = cls.claim_next_job()
+            if job is None:
+                break
+            cls.render_job(job)
+            processed += 1
+        return processed
+
+class FarmPortfolioExporter:
+    """
+    Job based zip export of the reports of all of a farmer's farms, with a
+    consolidated summary.
+
+    Requests only enqueue a FarmPortfolioJob; the process_farm_reports
+    worker builds the archive from each farm's cached report for its
+    current data version, rendering only the reports that are missing.
+    The CPU-bound ReportLab rendering is single threaded, so the missing
+    reports are spread over a process pool. Those renders are stored as the
+    farms' FarmReportJob artifacts, so single-farm exports reuse them too.
+    """
+
+    SUMMARY_FILENAME = 'portfolio_summary.pdf'
+
+    @classmethod
+    def max_workers(cls):
+        """Size of the rendering pool (FARM_REPORT_PROCESSES, defaults to the CPU count)"""
+        return getattr(settings, 'FARM_REPORT_PROCESSES', None) or os.cpu_count() or 1
+
+    @classmethod
+    def data_versions(cls, farms):
+        """The (farm, data version) pairs of farms, creating missing analytics snapshots"""
+        farms = list(farms.order_by('name', 'pk'))
+        FarmAnalyticsSnapshot.objects.bulk_create(
+            [FarmAnalyticsSnapshot(farm=farm) for farm in farms], ignore_conflicts=True
+        )
+        versions = dict(
+            FarmAnalyticsSnapshot.objects.filter(farm__in=farms).values_list('farm_id', 'data_version')
+        )
+        return [(farm, versions[farm.pk]) for farm in farms]
+
+    @classmethod
+    def fingerprint(cls, farm_versions):
+        """Hash identifying a set of farms at their data versions"""
+        key = ','.join(f"{farm.pk}:{data_version}" for farm, data_version in farm_versions)
+        return hashlib.md5(key.encode()).hexdigest()
+
+    @classmethod
+    def request_portfolio(cls, farmer):
+        """
+        Get the portfolio job for the current data of a farmer's farms,
+        enqueueing a new one unless a finished or in-progress job already
+        covers it.
+
+        Returns: FarmPortfolioJob
+        """
+        fingerprint = cls.fingerprint(cls.data_versions(Farm.objects.filter(farmer=farmer)))
+        job = FarmPortfolioJob.objects.filter(
+            farmer=farmer,
+            fingerprint=fingerprint
+        ).exclude(status=FarmPortfolioJob.STATUS_FAILED).order_by('-created_at').first()
+
+        if job is None:
+            job = FarmPortfolioJob.objects.create(farmer=farmer, fingerprint=fingerprint)
+        return job
+
+    @classmethod
+    def summary_rows(cls, farms):
+        """
+        One (name, location, size, fields, field area, active crops) row per
+        farm, in one query.
+        """
+        active_crops = Crop.objects.filter(
+            field__farm=OuterRef('pk'), is_harvested=False
+        ).order_by().values('field__farm').annotate(count=Count('pk')).values('count')
+        return list(
+            farms.annotate(
+                field_count=Count('fields'),
+                field_area=Coalesce(Sum('fields__size'), 0.0),
+                active_crop_count=Coalesce(Subquery(active_crops), 0)
+            ).order_by('name', 'pk').values_list(
+                'name', 'location', 'size', 'field_count', 'field_area', 'active_crop_count'
+            )
+        )
+
+    @classmethod
+    def render_reports(cls, reports, max_workers=None):
+        """
+        Render the PDF of every report, in a process pool when there is more
+        than one report and more than one worker.
+
+        Returns: List of (PDF bytes, None) or (None, exception) pairs, in the
+        order of the reports
+        """
+        max_workers = min(max_workers or cls.max_workers(), len(reports))
+        if max_workers <= 1:
+            outcomes = []
+            for report in reports:
+                try:
+                    outcomes.append((build_farm_report_pdf(report), None))
+                except Exception as e:
+                    outcomes.append((None, e))
+            return outcomes
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(build_farm_report_pdf, report) for report in reports]
+            return [
+                (None, future.exception()) if future.exception() else (future.result(), None)
+                for future in futures
+            ]
+
+    @classmethod
+    def farm_report_pdfs(cls, farms, max_workers=None):
+        """
+        The report PDFs of farms at their current data versions: their cached
+        artifacts, with the missing ones rendered in a process pool and
+        stored first.
+
+        Returns: List of PDF documents as bytes, in the order of the farms
+        """
+        jobs = [FarmReportExporter.request_report(farm) for farm in farms]
+        claimed = set()
+        for farm, job in zip(farms, jobs):
+            job.farm = farm
+            if job.status == FarmReportJob.STATUS_PENDING:
+                # Claim it, so the report worker doesn't render it a second time
+                if FarmReportJob.objects.filter(pk=job.pk, status=FarmReportJob.STATUS_PENDING).update(
+                    status=FarmReportJob.STATUS_RUNNING, started_at=timezone.now()
+                ):
+                    claimed.add(job.pk)
+                else:
+                    job.refresh_from_db()
+
+        # Reports another worker is rendering right now are rendered here too, without storing them
+        missing = [(farm, job) for farm, job in zip(farms, jobs) if job.status != FarmReportJob.STATUS_DONE]
+        outcomes = cls.render_reports([FarmReportLoader.load(farm) for farm, _ in missing], max_workers)
+
+        rendered = {}
+        failure = None
+        for (farm, job), (pdf, error) in zip(missing, outcomes):
+            if error is not None:
+                logger.error("Rendering the report of farm %s failed", farm.pk, exc_info=error)
+                failure = failure or RuntimeError(f"The report of {farm.name} could not be rendered: {error}")
+                if job.pk in claimed:
+                    FarmReportExporter.fail_job(job, error)
+                continue
+            if job.pk in claimed:
+                FarmReportExporter.store_pdf(job, pdf)
+            rendered[job.pk] = pdf
+        if failure is not None:
+            raise failure
+
+        pdfs = []
+        for job in jobs:
+            if job.pk in rendered:
+                pdfs.append(rendered[job.pk])
+            else:
+                with job.pdf.open('rb') as pdf:
+                    pdfs.append(pdf.read())
+        return pdfs
+
+    @classmethod
+    def build_job(cls, job):
+        """Build the archive of a claimed portfolio job and store it as the job's artifact"""
+        try:
+            farms = Farm.objects.filter(farmer=job.farmer)
+            ordered_farms = list(farms.order_by('name', 'pk'))
+            pdfs = cls.farm_report_pdfs(ordered_farms)
+
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr(cls.SUMMARY_FILENAME, build_portfolio_summary_pdf(cls.summary_rows(farms)))
+                for index, (farm, pdf) in enumerate(zip(ordered_farms, pdfs), start=1):
+                    # Farm names are not unique, so number the files
+                    archive.writestr(f"{index:03d}_{farm_report_filename(farm.name)}", pdf)
+        except Exception as e:
+            logger.exception("Building portfolio job %s failed", job.pk)
+            job.status = FarmPortfolioJob.STATUS_FAILED
+            job.error = str(e)
+            job.finished_at = timezone.now()
+            job.save(update_fields=['status', 'error', 'finished_at'])
+            return job
+
+        job.archive.save(f"{job.pk}.zip", ContentFile(buffer.getvalue()), save=False)
+        job.filename = f"farm_portfolio_{timezone.now().strftime('%Y%m%d')}.zip"
+        job.status = FarmPortfolioJob.STATUS_DONE
+        job.finished_at = timezone.now()
+        job.save(update_fields=['archive', 'filename', 'status', 'finished_at'])
+
+        cls.prune_archives(job)
+        return job
+
+    @classmethod
+    def prune_archives(cls, job):
+        """Delete the farmer's finished archives older than a newly built one"""
+        old_jobs = FarmPortfolioJob.objects.filter(
+            farmer=job.farmer,
+            created_at__lt=job.created_at
+        ).exclude(status__in=[FarmPortfolioJob.STATUS_PENDING, FarmPortfolioJob.STATUS_RUNNING])
+
+        for old_job in old_jobs:
+            if old_job.archive:
+                old_job.archive.delete(save=False)
+        old_jobs.delete()
+
+    @classmethod
+    def run_pending(cls, limit=None):
+        """
+        Build queued portfolio jobs until the queue is empty or `limit`
+        jobs are done.
+
+        Returns: Number of jobs processed
+        """
+        processed = 0
+        while limit is None or processed < limit:
+            job = FarmReportExporter.claim_next_job(model=FarmPortfolioJob)
+            if job is None:
+                break
+            cls.build_job(job)
+            processed += 1
+        return processed
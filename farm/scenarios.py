@@ -0,0 +1,245 @@
+import itertools
+import math
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from . import prediction_rules
+from .harvest_prediction import HarvestPredictionSystem
+
+# Inputs a scenario can override: the farm conditions and the maintenance totals
+CONDITION_TARGETS = HarvestPredictionSystem.CONDITION_COLUMNS
+MAINTENANCE_TARGETS = ('maintenance_count', 'total_fertilizer', 'total_irrigation', 'total_pesticide')
+TARGETS = CONDITION_TARGETS + MAINTENANCE_TARGETS
+
+# Override names accepted besides the targets themselves
+TARGET_ALIASES = {
+    'temperature': 'max_daily_temp',
+    'fertilizer': 'total_fertilizer',
+    'irrigation': 'total_irrigation',
+    'pesticide': 'total_pesticide',
+}
+
+OPERATIONS = ('set', 'add', 'multiply')
+OPERATION_SYMBOLS = {'set': '=', 'add': '+', 'multiply': '*'}
+
+class ScenarioError(ValueError):
+    """Raised when a scenario sweep request is malformed or too large"""
+
+class ScenarioSweep:
+    """
+    What-if simulation of harvest predictions.
+
+    A scenario overrides some prediction inputs of every crop: a farm
+    condition or maintenance total is set to a value, shifted by an amount
+    or scaled by a factor. The inputs of the crops are loaded once, the
+    overrides are applied as crop x scenario matrices and the whole sweep
+    is scored with a single pass of the vectorized rules, so its cost is a
+    handful of numpy operations however many crops and scenarios it spans.
+    """
+
+    @classmethod
+    def max_scenarios(cls):
+        """Scenarios per sweep (SCENARIO_SWEEP_MAX_SCENARIOS, default 500)"""
+        return getattr(settings, 'SCENARIO_SWEEP_MAX_SCENARIOS', 500)
+
+    @classmethod
+    def max_cells(cls):
+        """Crop x scenario combinations per sweep (SCENARIO_SWEEP_MAX_CELLS, default 200000)"""
+        return getattr(settings, 'SCENARIO_SWEEP_MAX_CELLS', 200000)
+
+    @classmethod
+    def parse(cls, payload):
+        """
+        Read the scenarios of a sweep request.
+
+        The request holds a "scenarios" list of {name, overrides} objects,
+        a "grid" of override options per input whose every combination is
+        a scenario, or both. An override is {"set": x}, {"add": x} or
+        {"multiply": x}; a bare number is shorthand for "set".
+
+        Returns: List of scenarios, each a dict with name and overrides
+        (target to (operation, value))
+        """
+        if not isinstance(payload, dict):
+            raise ScenarioError("The request must be a JSON object")
+
+        scenarios = []
+        listed = payload.get('scenarios') or []
+        if not isinstance(listed, list):
+            raise ScenarioError("scenarios must be a list")
+        for number, item in enumerate(listed, start=1):
+            if not isinstance(item, dict):
+                raise ScenarioError(f"Scenario {number} must be an object")
+            overrides = item.get('overrides') or {}
+            if not isinstance(overrides, dict):
+                raise ScenarioError(f"The overrides of scenario {number} must be an object")
+            overrides = cls._parse_overrides(overrides)
+            scenarios.append({'name': str(item.get('name') or cls._name(overrides)), 'overrides': overrides})
+
+        grid = payload.get('grid') or {}
+        if not isinstance(grid, dict):
+            raise ScenarioError("grid must be an object of override lists")
+        axes = []
+        for key, options in grid.items():
+            if not isinstance(options, list) or not options:
+                raise ScenarioError(f"The grid options of {key} must be a non-empty list")
+            axes.append([(key, option) for option in options])
+
+        # Size the grid before expanding it
+        grid_size = math.prod(len(axis) for axis in axes) if axes else 0
+        if len(scenarios) + grid_size > cls.max_scenarios():
+            raise ScenarioError(f"A sweep can hold at most {cls.max_scenarios()} scenarios")
+
+        if axes:
+            for combination in itertools.product(*axes):
+                overrides = cls._parse_overrides(dict(combination))
+                scenarios.append({'name': cls._name(overrides), 'overrides': overrides})
+
+        if not scenarios:
+            raise ScenarioError("Give at least one scenario or grid axis")
+        return scenarios
+
+    @classmethod
+    def run(cls, crops, scenarios, today=None):
+        """
+        Predict the harvest date of every active crop under every scenario.
+
+        Args:
+            crops: QuerySet of Crop objects
+            scenarios: List of scenarios as returned by parse()
+            today: Optional date to predict as of (defaults to today)
+
+        Returns: Dictionary with the crops (with their baseline date), the
+        scenarios, and predicted_dates and shift_days matrices with one row
+        per crop and one column per scenario. Dates are ISO strings, None
+        for crops without a planting date.
+        """
+        today = today or timezone.now().date()
+        crop_list, farm_condition_list = HarvestPredictionSystem.load_batch(crops)
+        if len(crop_list) * (len(scenarios) + 1) > cls.max_cells():
+            raise ScenarioError(f"A sweep can evaluate at most {cls.max_cells()} crop x scenario combinations")
+
+        # Column 0 is the baseline, without overrides
+        all_scenarios = [{'name': 'baseline', 'overrides': {}}] + list(scenarios)
+        total_days = cls._total_days(crop_list, farm_condition_list, all_scenarios, today)
+
+        planting_dates = np.array(
+            [crop.planting_date if crop.planting_date else 'NaT' for crop in crop_list],
+            dtype='datetime64[D]'
+        ).reshape(-1, 1)
+        dates = planting_dates + total_days.astype('timedelta64[D]')
+        date_strings = np.where(np.isnat(dates), None, np.datetime_as_string(dates)).tolist()
+        shift_days = (total_days[:, 1:] - total_days[:, :1]).tolist()
+
+        return {
+            'crops': [
+                {
+                    'crop_id': str(crop.crop_id),
+                    'crop_type': crop.crop_type,
+                    'field': crop.field.name if crop.field else None,
+                    'planting_date': crop.planting_date.isoformat() if crop.planting_date else None,
+                    'baseline_date': row[0],
+                }
+                for crop, row in zip(crop_list, date_strings)
+            ],
+            'scenarios': [
+                {
+                    'name': scenario['name'],
+                    'overrides': {
+                        target: {operation: value}
+                        for target, (operation, value) in scenario['overrides'].items()
+                    },
+                }
+                for scenario in scenarios
+            ],
+            'predicted_dates': [row[1:] for row in date_strings],
+            'shift_days': shift_days,
+        }
+
+    @classmethod
+    def _total_days(cls, crop_list, farm_condition_list, scenarios, today):
+        """Growing period of every crop under every scenario, as a crops x scenarios matrix"""
+        shape = (len(crop_list), len(scenarios))
+        if not crop_list:
+            return np.zeros(shape, dtype=np.int64)
+
+        rules = HarvestPredictionSystem.rules()
+        columns = HarvestPredictionSystem.batch_columns(crop_list, farm_condition_list, today, rules)
+        inputs = {target: cls._apply(columns[target], scenarios, target) for target in TARGETS}
+        # Counts are whole activities, and totals can't go negative
+        inputs['maintenance_count'] = np.round(inputs['maintenance_count'])
+        for target in MAINTENANCE_TARGETS:
+            inputs[target] = np.clip(inputs[target], 0, None)
+
+        def matrix(column):
+            return np.broadcast_to(column.reshape(-1, 1), shape)
+
+        maintenance_modifiers = prediction_rules.maintenance_effect(
+            inputs['maintenance_count'],
+            inputs['total_fertilizer'],
+            inputs['total_irrigation'],
+            inputs['total_pesticide'],
+            matrix(columns['days_since_planting']),
+            rules=rules
+        )
+        environment_modifiers = prediction_rules.environment_effect(
+            matrix(columns['temperature_profile']),
+            *(inputs[metric] for metric in CONDITION_TARGETS),
+            rules=rules
+        )
+        return matrix(columns['base_days']) + maintenance_modifiers + environment_modifiers
+
+    @classmethod
+    def _apply(cls, column, scenarios, target):
+        """
+        Apply the overrides of one target across all scenarios.
+
+        Returns: Float matrix of crops x scenarios. Shifting or scaling a
+        reading that is not recorded leaves it unrecorded (NaN).
+        """
+        base = np.asarray(column, dtype=float).reshape(-1, 1)
+        values = np.full(len(scenarios), np.nan)
+        offsets = np.zeros(len(scenarios))
+        factors = np.ones(len(scenarios))
+        for index, scenario in enumerate(scenarios):
+            operation, value = scenario['overrides'].get(target, (None, None))
+            if operation == 'set':
+                values[index] = value
+            elif operation == 'add':
+                offsets[index] = value
+            elif operation == 'multiply':
+                factors[index] = value
+        return np.where(np.isnan(values), base * factors + offsets, values)
+
+    @classmethod
+    def _parse_overrides(cls, overrides):
+        parsed = {}
+        for key, override in overrides.items():
+            target = TARGET_ALIASES.get(key, key)
+            if target not in TARGETS:
+                raise ScenarioError(f"Unknown input: {key}")
+            if target in parsed:
+                raise ScenarioError(f"{target} is overridden more than once")
+
+            if not isinstance(override, dict):
+                override = {'set': override}
+            if len(override) != 1:
+                raise ScenarioError(f"The override of {key} must hold exactly one of {', '.join(OPERATIONS)}")
+            (operation, value), = override.items()
+            if operation not in OPERATIONS:
+                raise ScenarioError(f"Unknown operation for {key}: {operation}")
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise ScenarioError(f"The {operation} value of {key} must be a number")
+            parsed[target] = (operation, value)
+        return parsed
+
+    @classmethod
+    def _name(cls, overrides):
+        if not overrides:
+            return 'baseline'
+        return ', '.join(
+            f"{target}{OPERATION_SYMBOLS[operation]}{value:g}"
+            for target, (operation, value) in overrides.items()
+        )
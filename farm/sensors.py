@@ -0,0 +1,190 @@
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import FarmAnalyticsSnapshot, FarmCondition, FarmConditionReading
+from .signals import bump_crop_inputs
+
+METRICS = FarmConditionReading.METRICS
+
+# Sensor field names accepted besides the metric names themselves
+FIELD_ALIASES = {
+    'ph': 'soil_ph',
+    'moisture': 'soil_moisture',
+    'temperature': 'max_daily_temp',
+    'temp': 'max_daily_temp',
+}
+
+# Line protocol timestamp precisions, as divisors to seconds
+PRECISIONS = {'s': 1, 'ms': 10 ** 3, 'us': 10 ** 6, 'ns': 10 ** 9}
+
+# Readings may be stamped slightly ahead of the server clock
+MAX_CLOCK_SKEW = datetime.timedelta(minutes=5)
+
+class SensorPayloadError(ValueError):
+    """Raised when a sensor payload cannot be parsed at all"""
+
+def parse_sensor_payload(body, payload_format, precision='ns', now=None):
+    """
+    Parse a batch of sensor readings.
+
+    JSON payloads are a list of objects, or an object with a "readings"
+    list; each object holds metric values and an optional recorded_at (ISO
+    8601 or epoch seconds). Line protocol payloads hold one
+    `measurement[,tags] field=value[,field=value] [timestamp]` line per
+    reading, with the timestamp in the given precision.
+
+    Readings without a time are stamped with the current time. Invalid
+    readings are reported without rejecting the rest of the batch.
+
+    Returns: Tuple of (list of unsaved FarmConditionReadings without a farm,
+    list of {'reading', 'error'} entries for the rejected readings)
+    """
+    now = now or timezone.now()
+    try:
+        text = body.decode('utf-8') if isinstance(body, bytes) else body
+    except UnicodeDecodeError:
+        raise SensorPayloadError("The payload must be UTF-8 encoded")
+
+    if payload_format == 'json':
+        entries = _json_entries(text)
+    elif payload_format == 'line':
+        if precision not in PRECISIONS:
+            raise SensorPayloadError(f"Unknown precision: {precision}")
+        entries = _line_entries(text, PRECISIONS[precision])
+    else:
+        raise SensorPayloadError(f"Unsupported payload format: {payload_format}")
+
+    readings = []
+    errors = []
+    for number, entry in entries:
+        try:
+            if isinstance(entry, Exception):
+                raise entry
+            values, recorded_at = entry
+            readings.append(_build_reading(values, recorded_at, now))
+        except (ValidationError, ValueError, TypeError) as e:
+            message = e.messages[0] if isinstance(e, ValidationError) else str(e)
+            errors.append({'reading': number, 'error': message})
+    return readings, errors
+
+def _json_entries(text):
+    try:
+        payload = json.loads(text)
+    except ValueError as e:
+        raise SensorPayloadError(f"Invalid JSON: {e}")
+    if isinstance(payload, dict):
+        payload = payload.get('readings')
+    if not isinstance(payload, list):
+        raise SensorPayloadError("JSON payloads must be a list of readings")
+
+    entries = []
+    for number, item in enumerate(payload, start=1):
+        if not isinstance(item, dict):
+            entries.append((number, ValueError("A reading must be an object")))
+            continue
+        values = dict(item)
+        recorded_at = values.pop('recorded_at', None)
+        if isinstance(recorded_at, str):
+            parsed = parse_datetime(recorded_at)
+            if parsed is None:
+                entries.append((number, ValueError(f"Invalid recorded_at: {recorded_at}")))
+                continue
+            recorded_at = parsed if timezone.is_aware(parsed) else parsed.replace(tzinfo=datetime.timezone.utc)
+        elif isinstance(recorded_at, (int, float)) and not isinstance(recorded_at, bool):
+            recorded_at = datetime.datetime.fromtimestamp(recorded_at, tz=datetime.timezone.utc)
+        elif recorded_at is not None:
+            entries.append((number, ValueError("recorded_at must be a string or a number")))
+            continue
+        entries.append((number, (values, recorded_at)))
+    return entries
+
+def _line_entries(text, divisor):
+    entries = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split(' ')
+        if len(parts) not in (2, 3):
+            entries.append((number, ValueError("Expected 'measurement field=value[,...] [timestamp]'")))
+            continue
+
+        values = {}
+        try:
+            for pair in parts[1].split(','):
+                key, value = pair.split('=', 1)
+                # Integer fields carry an "i" suffix
+                values[key] = float(value[:-1] if value.endswith('i') else value)
+            recorded_at = None
+            if len(parts) == 3:
+                recorded_at = datetime.datetime.fromtimestamp(int(parts[2]) / divisor, tz=datetime.timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            entries.append((number, ValueError(f"Malformed line: {line}")))
+            continue
+        entries.append((number, (values, recorded_at)))
+    return entries
+
+def _build_reading(values, recorded_at, now):
+    """Validate the values of one reading against the FarmCondition field limits"""
+    reading = FarmConditionReading(recorded_at=recorded_at or now)
+    if reading.recorded_at > now + MAX_CLOCK_SKEW:
+        raise ValueError("Reading is stamped in the future")
+
+    for key, value in values.items():
+        metric = FIELD_ALIASES.get(key, key)
+        if metric not in METRICS:
+            raise ValueError(f"Unknown field: {key}")
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{key} must be a number")
+        FarmCondition._meta.get_field(metric).run_validators(value)
+        setattr(reading, metric, float(value))
+
+    if not reading.has_values():
+        raise ValueError("Reading holds no values")
+    return reading
+
+def write_readings(readings):
+    """
+    Store a batch of readings with one bulk insert and move the conditions
+    of each farm in the batch to its latest values, once per farm.
+
+    A farm's conditions only take readings newer than their last update, so
+    a late batch never overwrites a newer manual or sensor update.
+    """
+    if not readings:
+        return
+
+    # Latest value of every metric per farm, and the time of the newest reading
+    latest = {}
+    for reading in sorted(readings, key=lambda reading: reading.recorded_at):
+        values, _ = latest.get(reading.farm_id, ({}, None))
+        for metric in METRICS:
+            value = getattr(reading, metric)
+            if value is not None:
+                values[metric] = value
+        latest[reading.farm_id] = (values, reading.recorded_at)
+
+    with transaction.atomic():
+        FarmConditionReading.objects.bulk_create(readings, batch_size=1000)
+
+        farm_ids = list(latest)
+        existing = set(FarmCondition.objects.filter(farm_id__in=farm_ids).values_list('farm_id', flat=True))
+        # Queryset writes, so the condition signals don't append the readings again
+        FarmCondition.objects.bulk_create(
+            [FarmCondition(farm_id=farm_id, **values) for farm_id, (values, _) in latest.items() if farm_id not in existing],
+            ignore_conflicts=True
+        )
+        for farm_id in existing:
+            values, recorded_at = latest[farm_id]
+            FarmCondition.objects.filter(farm_id=farm_id, updated_at__lte=recorded_at).update(
+                updated_at=recorded_at,
+                **values
+            )
+
+        bump_crop_inputs(field__farm_id__in=farm_ids)
+        FarmAnalyticsSnapshot.mark_dirty(farm_id__in=farm_ids)
@@ -0,0 +1,128 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .condition_history import FarmConditionHistory
+from .dashboard import dashboard_cache
+from .models import (
+    ActivityLog, Crop, Farm, FarmAnalyticsSnapshot, FarmCondition, FarmCropVersion, Field,
+    HarvestingLog, MaintenanceLog, PlantingLog, PreparationLog
+)
+
+def crop_farm_ids(crop):
+    """The farm of a crop, as a list that is empty for crops without a field"""
+    if Crop.field.is_cached(crop) and crop.field is not None:
+        return [crop.field.farm_id]
+    if not crop.field_id:
+        return []
+    return list(Field.objects.filter(pk=crop.field_id).values_list('farm_id', flat=True))
+
+def bump_crop_inputs(**filters):
+    """
+    Bump the prediction input version stamp of the matching crops.
+    Uses a queryset update so no further signals are sent. Saving a Crop
+    bumps its own stamp through auto_now.
+    """
+    Crop.objects.filter(**filters).update(inputs_updated_at=timezone.now())
+
+@receiver(post_save, sender=MaintenanceLog)
+@receiver(post_delete, sender=MaintenanceLog)
+@receiver(post_save, sender=HarvestingLog)
+@receiver(post_delete, sender=HarvestingLog)
+def crop_activity_changed(sender, instance, **kwargs):
+    """Maintenance and harvest logs feed the prediction of their crop"""
+    if instance.crop_id:
+        bump_crop_inputs(pk=instance.crop_id)
+
+@receiver(post_save, sender=FarmCondition)
+@receiver(post_delete, sender=FarmCondition)
+def farm_condition_changed(sender, instance, **kwargs):
+    """Farm conditions feed the prediction of every crop on the farm"""
+    bump_crop_inputs(field__farm_id=instance.farm_id)
+
+@receiver(post_save, sender=FarmCondition)
+def record_condition_history(sender, instance, raw=False, **kwargs):
+    """Every saved set of farm conditions is appended to the farm's condition history"""
+    if not raw:
+        FarmConditionHistory.record(instance)
+
+@receiver(post_save, sender=Farm)
+def farm_changed(sender, instance, **kwargs):
+    """The farm size feeds the field utilization of its analytics"""
+    FarmAnalyticsSnapshot.mark_dirty(farm_id=instance.pk)
+
+@receiver(post_save, sender=ActivityLog)
+@receiver(post_delete, sender=ActivityLog)
+@receiver(post_save, sender=Field)
+@receiver(post_delete, sender=Field)
+@receiver(post_save, sender=FarmCondition)
+@receiver(post_delete, sender=FarmCondition)
+def farm_data_changed(sender, instance, **kwargs):
+    """
+    Activities and fields feed the analytics snapshot of their farm; the
+    conditions only feed the farm report, but bump the same data version
+    """
+    FarmAnalyticsSnapshot.mark_dirty(farm_id=instance.farm_id)
+
+@receiver(post_save, sender=Crop)
+@receiver(post_delete, sender=Crop)
+def crop_changed(sender, instance, **kwargs):
+    """Crops feed the crop distribution and harvest stats of their farm"""
+    if instance.field_id:
+        FarmAnalyticsSnapshot.mark_dirty(farm__fields=instance.field_id)
+
+@receiver(post_save, sender=HarvestingLog)
+@receiver(post_delete, sender=HarvestingLog)
+@receiver(post_save, sender=PreparationLog)
+@receiver(post_delete, sender=PreparationLog)
+@receiver(post_save, sender=PlantingLog)
+@receiver(post_delete, sender=PlantingLog)
+@receiver(post_save, sender=MaintenanceLog)
+@receiver(post_delete, sender=MaintenanceLog)
+def activity_details_changed(sender, instance, **kwargs):
+    """Harvest yields and activity details feed the analytics and report of their farm"""
+    FarmAnalyticsSnapshot.mark_dirty(farm__activities=instance.activity_log_id)
+
+@receiver(post_save, sender=Farm)
+@receiver(post_delete, sender=Farm)
+def farm_listing_changed(sender, instance, **kwargs):
+    """Farms are listed on the dashboard of their farmer"""
+    dashboard_cache.invalidate(instance.farmer_id)
+
+@receiver(post_save, sender=ActivityLog)
+@receiver(post_delete, sender=ActivityLog)
+@receiver(post_save, sender=Crop)
+@receiver(post_delete, sender=Crop)
+def dashboard_data_changed(sender, instance, **kwargs):
+    """Crop counts, recent activities and upcoming harvests feed the dashboard of the farm's farmer"""
+    if sender is Crop:
+        farms = Farm.objects.filter(fields=instance.field_id) if instance.field_id else Farm.objects.none()
+    elif ActivityLog.farm.is_cached(instance):
+        dashboard_cache.invalidate(instance.farm.farmer_id)
+        return
+    else:
+        farms = Farm.objects.filter(pk=instance.farm_id)
+    for farmer_id in farms.values_list('farmer_id', flat=True):
+        dashboard_cache.invalidate(farmer_id)
+
+@receiver(post_save, sender=Field)
+@receiver(post_save, sender=Crop)
+def crop_list_changed(sender, instance, **kwargs):
+    """
+    Stamp the crops listed under a new version of their farm's crop list,
+    which also versions the farm's activity form partials
+    """
+    if sender is Field:
+        # The field name is part of the name of its crops
+        FarmCropVersion.bump(instance.farm_id, Crop.objects.filter(field_id=instance.pk))
+    else:
+        for farm_id in crop_farm_ids(instance):
+            FarmCropVersion.bump(farm_id, Crop.objects.filter(pk=instance.pk))
+
+@receiver(post_delete, sender=Field)
+@receiver(post_delete, sender=Crop)
+def crop_list_removed(sender, instance, **kwargs):
+    """Deleted crops can't be stamped; clients reload the whole list instead"""
+    farm_ids = [instance.farm_id] if sender is Field else crop_farm_ids(instance)
+    for farm_id in farm_ids:
+        FarmCropVersion.mark_removed(farm_id)
@@ -1,17 +1,34 @@
-from django.test import TestCase, Client
+from django.test import SimpleTestCase, TestCase, Client, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import F, QuerySet
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from unittest.mock import patch
+from io import StringIO
+import datetime
+import io
 import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+import numpy as np
 
 # Import models from farm and authentication
 from authentication.models import Farmer
 from .models import (
     Farm, FarmCondition, Field, Crop, ActivityLog,
-    PreparationLog, PlantingLog, MaintenanceLog, HarvestingLog
+    PreparationLog, PlantingLog, MaintenanceLog, HarvestingLog,
+    CropMaintenanceSummary, FarmAnalyticsSnapshot, FarmCropVersion, FarmPortfolioJob, FarmReportJob,
+    FarmConditionReading, FarmConditionRollup, SensorToken, PredictionParameterSet
 )
 # Import forms from farm
 from .forms import (
@@ -19,6 +36,21 @@ from .forms import (
     ActivityLogForm, PreparationLogForm, PlantingLogForm,
     MaintenanceLogForm, HarvestingLogForm
 )
+from .activity_import import ActivityImporter, ActivityImportError, parse_activity_file
+from .activity_listing import ActivityLogListing
+from .analytics import FarmAnalytics
+from .backtest import GROWING_PERIOD_KEYS, HarvestBacktest, ParameterLayout
+from .condition_history import FarmConditionHistory
+from .checks import check_dashboard_cache
+from .dashboard import dashboard_cache
+from .form_cache import activity_form_cache
+from .harvest_prediction import HarvestPredictionSystem, active_rules
+from . import crop_types, prediction_rules
+from .prediction_cache import PredictionCache, prediction_cache
+from .pdf_utils import build_farm_report_pdf
+from .reports import FarmPortfolioExporter, FarmReportExporter, FarmReportLoader
+from .scenarios import ScenarioError, ScenarioSweep
+from .sensors import SensorPayloadError, parse_sensor_payload
 
 User = get_user_model()
 
@@ -746,4 +778,2247 @@ class FarmModuleViewsTests(TestCase):
         self.assertEqual(response_field1.status_code, 200)
         json_field1 = response_field1.json()
         self.assertEqual(len(json_field1['crops']), 1)
-        self.assertEqual(json_field1['crops'][0]['id'], str(self.crop1_field1.crop_id))
\ No newline at end of file
+        self.assertEqual(json_field1['crops'][0]['id'], str(self.crop1_field1.crop_id))
+
+# --- Test for Harvest Prediction ---
+class HarvestPredictionBatchTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='batchfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Batch Farm", location="Here", size=50.0)
+        self.condition = FarmCondition.objects.create(
+            farm=self.farm, soil_ph=6.5, soil_moisture=55.0, rainfall=150.0, max_daily_temp=27.0, day_length=12.0
+        )
+        self.field = Field.objects.create(farm=self.farm, name="Batch Field", size=20.0)
+        self.other_farm = Farm.objects.create(farmer=self.farmer, name="Bare Farm", location="There", size=10.0)
+        self.other_field = Field.objects.create(farm=self.other_farm, name="Bare Field", size=5.0)
+        today = timezone.now().date()
+        self.crops = [
+            Crop.objects.create(field=self.field, crop_type="Padi", planting_date=today - timezone.timedelta(days=40)),
+            Crop.objects.create(field=self.field, crop_type="Corn", planting_date=today - timezone.timedelta(days=10)),
+            Crop.objects.create(field=self.other_field, crop_type="Durian", planting_date=today - timezone.timedelta(days=5)),
+        ]
+        self.harvested_crop = Crop.objects.create(
+            field=self.field, crop_type="Tomato", planting_date=today - timezone.timedelta(days=90),
+            is_harvested=True, harvest_date=today
+        )
+        for crop, amounts in ((self.crops[0], (2.0, 150.0, 1.0)), (self.crops[0], (20.0, None, 4.0)), (self.crops[1], (None, 600.0, None))):
+            log = ActivityLog.objects.create(farm=crop.field.farm, activity_type='maintenance', timestamp=timezone.now())
+            MaintenanceLog.objects.create(
+                activity_log=log, crop=crop,
+                fertilizer_applied=amounts[0], irrigation_amount=amounts[1], pesticide_applied=amounts[2]
+            )
+        CropMaintenanceSummary.rebuild()
+        # The active prediction rules are memoized per process; load them outside the query counts
+        HarvestPredictionSystem.rules()
+
+    def _scalar_prediction(self, crop):
+        farm_condition = FarmCondition.objects.filter(farm=crop.field.farm).first()
+        return (
+            HarvestPredictionSystem.predict_harvest_date(crop, farm_condition),
+            HarvestPredictionSystem.get_confidence_level(crop, farm_condition)
+        )
+
+    def test_batch_matches_scalar_predictions(self):
+        predictions = HarvestPredictionSystem.predict_batch(Crop.objects.filter(field__farm__farmer=self.farmer))
+        self.assertEqual(len(predictions), len(self.crops))
+        for prediction in predictions:
+            self.assertEqual(
+                (prediction['predicted_date'], prediction['confidence']),
+                self._scalar_prediction(prediction['crop'])
+            )
+
+    def test_scalar_prediction_reads_the_maintenance_summary(self):
+        crop = Crop.objects.get(pk=self.crops[0].pk)
+        # The summary row, whatever the length of the maintenance history
+        with self.assertNumQueries(1):
+            HarvestPredictionSystem.predict_harvest_date(crop, self.condition)
+            HarvestPredictionSystem.get_confidence_level(crop, self.condition)
+
+        bare_crop = Crop.objects.get(pk=self.crops[2].pk)
+        self.assertEqual(
+            HarvestPredictionSystem._calculate_maintenance_effect(bare_crop),
+            prediction_rules.DEFAULT_RULES.no_maintenance
+        )
+
+    def test_predict_for_farmer_skips_harvested_and_foreign_crops(self):
+        other_user = User.objects.create_user(username='otherbatch', password='password')
+        other_farmer = Farmer.objects.create(user=other_user)
+        foreign_farm = Farm.objects.create(farmer=other_farmer, name="Foreign", location="Far", size=5.0)
+        foreign_field = Field.objects.create(farm=foreign_farm, name="Foreign Field", size=1.0)
+        Crop.objects.create(field=foreign_field, crop_type="Rice", planting_date=timezone.now().date())
+
+        crop_ids = {p['crop'].crop_id for p in HarvestPredictionSystem.predict_for_farmer(self.farmer)}
+        self.assertSetEqual(crop_ids, {crop.crop_id for crop in self.crops})
+
+    def test_batch_query_count_is_constant(self):
+        with self.assertNumQueries(2):
+            HarvestPredictionSystem.predict_batch(Crop.objects.filter(field__farm__farmer=self.farmer))
+
+        for i in range(10):
+            crop = Crop.objects.create(field=self.field, crop_type="Cabbage", planting_date=timezone.now().date())
+            log = ActivityLog.objects.create(farm=self.farm, activity_type='maintenance', timestamp=timezone.now())
+            MaintenanceLog.objects.create(activity_log=log, crop=crop, fertilizer_applied=float(i))
+        CropMaintenanceSummary.rebuild()
+
+        with self.assertNumQueries(2):
+            predictions = HarvestPredictionSystem.predict_batch(Crop.objects.filter(field__farm__farmer=self.farmer))
+        self.assertEqual(len(predictions), len(self.crops) + 10)
+
+
+# --- Reference rule ladders ---
+def reference_maintenance_adjustment(maintenance_count, total_fertilizer, total_irrigation,
+                                     total_pesticide, planting_date, today=None):
+    """The scalar maintenance ladder the default prediction_rules tables encode"""
+    if maintenance_count == 0:
+        # No maintenance might extend growing period
+        return 15
+
+    days_adjustment = 0
+
+    # Calculate fertilizer effect
+    if total_fertilizer > 0:
+        fertilizer_per_activity = total_fertilizer / maintenance_count
+        # Good fertilization (neither too little nor too much) speeds up growth
+        if 0 < fertilizer_per_activity <= 5:
+            days_adjustment -= 5
+        elif 5 < fertilizer_per_activity <= 15:
+            days_adjustment -= 10
+        elif fertilizer_per_activity > 15:
+            # Too much fertilizer might slow growth
+            days_adjustment += 5
+
+    # Calculate irrigation effect
+    if total_irrigation > 0:
+        irrigation_per_activity = total_irrigation / maintenance_count
+        # Proper irrigation speeds up growth
+        if 0 < irrigation_per_activity <= 100:
+            days_adjustment -= 3
+        elif 100 < irrigation_per_activity <= 500:
+            days_adjustment -= 7
+        elif irrigation_per_activity > 500:
+            # Too much water might slow growth or cause disease
+            days_adjustment += 10
+
+    # Calculate pesticide effect (prevents disease, can speed up growth)
+    if total_pesticide > 0:
+        pesticide_per_activity = total_pesticide / maintenance_count
+        if 0 < pesticide_per_activity <= 3:
+            days_adjustment -= 3
+        # Too much pesticide might stress plants
+        elif pesticide_per_activity > 3:
+            days_adjustment += 2
+
+    # Overall maintenance frequency effect
+    today = today or timezone.now().date()
+    days_since_planting = (today - planting_date).days
+    if days_since_planting > 0:
+        maintenance_frequency = maintenance_count / days_since_planting * 30  # activities per month
+
+        if maintenance_frequency < 1:
+            # Infrequent maintenance extends growing period
+            days_adjustment += 10
+        elif 1 <= maintenance_frequency < 4:
+            # Regular maintenance speeds up growth slightly
+            days_adjustment -= 5
+        else:
+            # Very frequent maintenance leads to optimal growth
+            days_adjustment -= 8
+
+    return days_adjustment
+
+def reference_environment_effect(crop_type, farm_condition):
+    """The scalar environment ladder the default prediction_rules tables encode"""
+    if not farm_condition:
+        return 0
+
+    days_adjustment = 0
+    crop_key = crop_types.resolve(crop_type)
+
+    # Temperature effects
+    if farm_condition.max_daily_temp is not None:
+        temp = farm_condition.max_daily_temp
+
+        # Different crops have different optimal temperature ranges
+        if crop_key == 'rice':
+            # Rice prefers warmer temperatures (25-30°C)
+            if 25 <= temp <= 30:
+                days_adjustment -= 10
+            elif 20 <= temp < 25 or 30 < temp <= 35:
+                days_adjustment -= 5
+            elif temp > 35:
+                days_adjustment += 15  # Too hot slows growth significantly
+
+        elif crop_key == 'corn':
+            # Corn grows well in 20-30°C
+            if 20 <= temp <= 30:
+                days_adjustment -= 8
+            elif 15 <= temp < 20 or 30 < temp <= 32:
+                days_adjustment -= 3
+            elif temp > 32:
+                days_adjustment += 10
+
+        # General temperature effects for other crops
+        else:
+            if 18 <= temp <= 28:  # Optimal temperature range for most crops
+                days_adjustment -= 7
+            elif 15 <= temp < 18 or 28 < temp <= 32:
+                days_adjustment -= 3
+            elif temp > 32 or temp < 15:
+                days_adjustment += 10
+
+    # Soil pH effects
+    if farm_condition.soil_ph is not None:
+        ph = farm_condition.soil_ph
+
+        # Most crops grow best in slightly acidic to neutral soil (6.0-7.0)
+        if 6.0 <= ph <= 7.0:
+            days_adjustment -= 5
+        elif 5.5 <= ph < 6.0 or 7.0 < ph <= 7.5:
+            days_adjustment -= 2
+        else:
+            # Very acidic or alkaline soil slows growth
+            days_adjustment += 8
+
+    # Soil moisture effects
+    if farm_condition.soil_moisture is not None:
+        moisture = farm_condition.soil_moisture
+
+        # Optimal soil moisture is typically 50-70%
+        if 50 <= moisture <= 70:
+            days_adjustment -= 7
+        elif 40 <= moisture < 50 or 70 < moisture <= 80:
+            days_adjustment -= 3
+        elif moisture < 20:  # Too dry
+            days_adjustment += 15
+        elif moisture > 90:  # Waterlogged
+            days_adjustment += 20
+
+    # Rainfall effects
+    if farm_condition.rainfall is not None:
+        rainfall = farm_condition.rainfall
+
+        # Moderate rainfall is beneficial
+        if 100 <= rainfall <= 200:
+            days_adjustment -= 5
+        elif 50 <= rainfall < 100 or 200 < rainfall <= 300:
+            days_adjustment -= 2
+        elif rainfall > 400:  # Excessive rain
+            days_adjustment += 10
+
+    # Day length effects
+    if farm_condition.day_length is not None:
+        day_length = farm_condition.day_length
+
+        # Many crops grow best with 10-14 hours of light
+        if 10 <= day_length <= 14:
+            days_adjustment -= 5
+        elif 8 <= day_length < 10 or 14 < day_length <= 16:
+            days_adjustment -= 2
+        else:
+            days_adjustment += 3
+
+    return days_adjustment
+
+
+class PredictionRulesTests(SimpleTestCase):
+    """The vectorized breakpoint tables must agree with the scalar rule ladders."""
+
+    def test_environment_effect_matches_scalar(self):
+        temperatures = [None, 10, 14.9, 15, 17.9, 18, 20, 24.9, 25, 28, 28.1, 30, 30.1, 32, 32.1, 35, 35.1, 40]
+        ph_values = [None, 4.0, 5.5, 5.9, 6.0, 7.0, 7.1, 7.5, 7.6]
+        moistures = [None, 10, 20, 39.9, 40, 50, 70, 70.1, 80, 85, 90, 90.1]
+        rainfalls = [None, 0, 50, 99.9, 100, 200, 200.1, 300, 350, 400, 400.1]
+        day_lengths = [None, 6, 8, 9.9, 10, 14, 14.1, 16, 16.1]
+
+        rows = []
+        for crop_type in ('Padi Ciherang', 'Jagung', 'Tomato'):
+            for i, temp in enumerate(temperatures):
+                for j, ph in enumerate(ph_values):
+                    rows.append((
+                        crop_type, temp, ph,
+                        moistures[(i + j) % len(moistures)],
+                        rainfalls[(i * 3 + j) % len(rainfalls)],
+                        day_lengths[(i + j * 2) % len(day_lengths)],
+                    ))
+
+        def column(index):
+            return [np.nan if row[index] is None else row[index] for row in rows]
+
+        vectorized = prediction_rules.environment_effect(
+            [HarvestPredictionSystem._temperature_profile(row[0]) for row in rows],
+            column(1), column(2), column(3), column(4), column(5)
+        )
+        for row, result in zip(rows, vectorized.tolist()):
+            condition = FarmCondition(
+                max_daily_temp=row[1], soil_ph=row[2], soil_moisture=row[3], rainfall=row[4], day_length=row[5]
+            )
+            expected = reference_environment_effect(row[0], condition)
+            self.assertEqual(result, expected, row)
+
+    def test_environment_effect_without_conditions(self):
+        missing = [np.nan, np.nan]
+        result = prediction_rules.environment_effect([0, 1], missing, missing, missing, missing, missing)
+        self.assertEqual(result.tolist(), [0, 0])
+
+    def test_maintenance_effect_matches_scalar(self):
+        today = timezone.now().date()
+        amounts = [0, 0.5, 3, 3.1, 5, 5.1, 15, 15.1, 100, 100.1, 500, 500.1]
+        rows = []
+        for count in (0, 1, 2, 5):
+            for days in (-3, 0, 1, 15, 30, 45, 150):
+                for i, amount in enumerate(amounts):
+                    rows.append((
+                        count,
+                        amount * count,
+                        amounts[(i + 4) % len(amounts)] * count,
+                        amounts[(i + 7) % len(amounts)] * count,
+                        days,
+                    ))
+
+        vectorized = prediction_rules.maintenance_effect(*zip(*rows))
+        for row, result in zip(rows, vectorized.tolist()):
+            planting_date = today - timezone.timedelta(days=row[4])
+            expected = reference_maintenance_adjustment(*row[:4], planting_date, today)
+            self.assertEqual(result, expected, row)
+
+    def test_breakpoint_table_requires_one_value_per_segment(self):
+        with self.assertRaises(ValueError):
+            prediction_rules.BreakpointTable([(1, True)], [0])
+
+
+class PredictionCacheTests(TestCase):
+
+    def setUp(self):
+        prediction_cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='cachefarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Cache Farm", location="Here", size=10.0)
+        self.condition = FarmCondition.objects.create(farm=self.farm, soil_ph=6.5)
+        self.field = Field.objects.create(farm=self.farm, name="Cache Field", size=5.0)
+        self.crop = Crop.objects.create(
+            field=self.field, crop_type="Rice", planting_date=timezone.now().date() - timezone.timedelta(days=20)
+        )
+        self.prediction_url = reverse('farm:crop_harvest_prediction', args=[self.farm.farm_id, self.crop.crop_id])
+        self.client.login(username='cachefarmer', password='password')
+
+    def _stamp(self):
+        return Crop.objects.get(pk=self.crop.pk).inputs_updated_at
+
+    def test_repeat_views_hit_the_cache(self):
+        first = self.client.get(self.prediction_url)
+        second = self.client.get(self.prediction_url)
+        self.assertEqual(first.context['predicted_date'], second.context['predicted_date'])
+        stats = prediction_cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+
+    def test_maintenance_log_changes_invalidate_prediction(self):
+        self.client.get(self.prediction_url)
+        stamp = self._stamp()
+        log = ActivityLog.objects.create(farm=self.farm, activity_type='maintenance', timestamp=timezone.now())
+        maintenance = MaintenanceLog.objects.create(activity_log=log, crop=self.crop, fertilizer_applied=10.0)
+        self.assertGreater(self._stamp(), stamp)
+
+        response = self.client.get(self.prediction_url)
+        self.assertEqual(prediction_cache.stats()['misses'], 2)
+        self.assertEqual(
+            response.context['predicted_date'],
+            HarvestPredictionSystem.predict_harvest_date(self.crop, self.condition)
+        )
+
+        stamp = self._stamp()
+        maintenance.delete()
+        self.assertGreater(self._stamp(), stamp)
+
+    def test_farm_condition_and_harvest_changes_bump_version(self):
+        stamp = self._stamp()
+        self.condition.soil_ph = 7.2
+        self.condition.save()
+        self.assertGreater(self._stamp(), stamp)
+
+        stamp = self._stamp()
+        log = ActivityLog.objects.create(farm=self.farm, activity_type='harvesting', timestamp=timezone.now())
+        HarvestingLog.objects.create(activity_log=log, crop=self.crop, yield_amount=100, harvest_quality=3)
+        self.assertGreater(self._stamp(), stamp)
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = PredictionCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['size'], 2)
+
+
+class RepredictHarvestsCommandTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='nightlyfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Nightly Farm", location="Here", size=10.0)
+        FarmCondition.objects.create(farm=self.farm, max_daily_temp=26.0)
+        self.field = Field.objects.create(farm=self.farm, name="Nightly Field", size=5.0)
+        today = timezone.now().date()
+        self.crops = [
+            Crop.objects.create(field=self.field, crop_type=crop_type, planting_date=today - timezone.timedelta(days=days))
+            for crop_type, days in (("Corn", 30), ("Cabbage", 60), ("Rice", 5))
+        ]
+        self.harvested_crop = Crop.objects.create(
+            field=self.field, crop_type="Tomato", planting_date=today - timezone.timedelta(days=90),
+            is_harvested=True, harvest_date=today
+        )
+
+    def test_command_stores_predictions_in_chunks(self):
+        as_of = timezone.now().date()
+        call_command('repredict_harvests', '--chunk-size', '2', '--as-of', as_of.isoformat(), stdout=StringIO())
+
+        expected = {
+            p['crop'].crop_id: p
+            for p in HarvestPredictionSystem.predict_batch(Crop.objects.all(), today=as_of)
+        }
+        for crop in Crop.objects.filter(is_harvested=False):
+            self.assertEqual(crop.predicted_harvest_date, expected[crop.crop_id]['predicted_date'])
+            self.assertEqual(crop.prediction_confidence, expected[crop.crop_id]['confidence'])
+            self.assertEqual(crop.predicted_on, as_of)
+
+        self.harvested_crop.refresh_from_db()
+        self.assertIsNone(self.harvested_crop.predicted_harvest_date)
+
+    def test_command_does_not_bump_prediction_inputs(self):
+        stamps = dict(Crop.objects.values_list('pk', 'inputs_updated_at'))
+        call_command('repredict_harvests', stdout=StringIO())
+        self.assertDictEqual(dict(Crop.objects.values_list('pk', 'inputs_updated_at')), stamps)
+
+    def test_due_for_harvest_filters_on_stored_prediction(self):
+        call_command('repredict_harvests', stdout=StringIO())
+        dates = sorted(Crop.objects.filter(is_harvested=False).values_list('predicted_harvest_date', flat=True))
+
+        due = Crop.due_for_harvest(dates[0], dates[1])
+        self.assertEqual(due.count(), 2)
+        self.assertNotIn(self.harvested_crop, due)
+
+
+
+class CropMaintenanceSummaryTests(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='summaryfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Summary Farm", location="Here", size=10.0)
+        self.field = Field.objects.create(farm=self.farm, name="Summary Field", size=5.0)
+        self.crop = Crop.objects.create(
+            field=self.field, crop_type="Corn", planting_date=timezone.now().date() - timezone.timedelta(days=30)
+        )
+        self.other_crop = Crop.objects.create(
+            field=self.field, crop_type="Rice", planting_date=timezone.now().date() - timezone.timedelta(days=30)
+        )
+        self.create_url = reverse('farm:activity_log_create', args=[self.farm.farm_id])
+        self.client.login(username='summaryfarmer', password='password')
+
+    def _log_maintenance(self, crop, timestamp, **amounts):
+        data = {'activity_type': 'maintenance', 'timestamp': timestamp.strftime('%Y-%m-%dT%H:%M'), 'crop': crop.pk}
+        data.update(amounts)
+        self.client.post(self.create_url, data)
+        return ActivityLog.objects.filter(farm=self.farm, activity_type='maintenance').order_by('-created_at').first()
+
+    def _assert_matches_rebuild(self):
+        live = list(CropMaintenanceSummary.objects.order_by('crop_id').values())
+        CropMaintenanceSummary.rebuild()
+        rebuilt = list(CropMaintenanceSummary.objects.order_by('crop_id').values())
+        self.assertEqual(live, rebuilt)
+
+    def test_views_maintain_summary_incrementally(self):
+        now = timezone.now().replace(second=0, microsecond=0)
+        first = self._log_maintenance(self.crop, now - timezone.timedelta(days=3), fertilizer_applied=2.5, irrigation_amount=100)
+        second = self._log_maintenance(self.crop, now - timezone.timedelta(days=1), fertilizer_applied=0.1, pesticide_applied=1.2)
+
+        summary = CropMaintenanceSummary.objects.get(crop=self.crop)
+        self.assertEqual(summary.maintenance_count, 2)
+        self.assertAlmostEqual(summary.total_fertilizer, 2.6)
+        self.assertEqual(summary.last_maintenance_at, now - timezone.timedelta(days=1))
+        self._assert_matches_rebuild()
+
+        # Moving the latest maintenance to another crop updates both summaries
+        update_url = reverse('farm:activity_log_update', args=[self.farm.farm_id, second.log_id])
+        self.client.post(update_url, {
+            'activity_type': 'maintenance',
+            'timestamp': (now - timezone.timedelta(days=2)).strftime('%Y-%m-%dT%H:%M'),
+            'crop': self.other_crop.pk,
+            'irrigation_amount': 50,
+        })
+        summary.refresh_from_db()
+        self.assertEqual(summary.maintenance_count, 1)
+        self.assertEqual(summary.last_maintenance_at, now - timezone.timedelta(days=3))
+        self.assertEqual(CropMaintenanceSummary.objects.get(crop=self.other_crop).maintenance_count, 1)
+        self._assert_matches_rebuild()
+
+        delete_url = reverse('farm:activity_log_delete', args=[self.farm.farm_id, first.log_id])
+        self.client.post(delete_url)
+        self.assertFalse(CropMaintenanceSummary.objects.filter(crop=self.crop).exists())
+        self._assert_matches_rebuild()
+
+    def test_failed_delete_keeps_the_summary(self):
+        log = self._log_maintenance(self.crop, timezone.now(), fertilizer_applied=2.5)
+        delete_url = reverse('farm:activity_log_delete', args=[self.farm.farm_id, log.log_id])
+        with patch.object(ActivityLog, 'delete', side_effect=DatabaseError("database is down")):
+            with self.assertRaises(DatabaseError):
+                self.client.post(delete_url)
+
+        self.assertTrue(ActivityLog.objects.filter(pk=log.pk).exists())
+        self.assertEqual(CropMaintenanceSummary.objects.get(crop=self.crop).maintenance_count, 1)
+        self._assert_matches_rebuild()
+
+    def test_missing_summary_is_built_from_existing_logs(self):
+        log = ActivityLog.objects.create(farm=self.farm, activity_type='maintenance', timestamp=timezone.now())
+        MaintenanceLog.objects.create(activity_log=log, crop=self.crop, fertilizer_applied=4.0)
+
+        self._log_maintenance(self.crop, timezone.now(), fertilizer_applied=1.0)
+        summary = CropMaintenanceSummary.objects.get(crop=self.crop)
+        self.assertEqual(summary.maintenance_count, 2)
+        self.assertEqual(summary.total_fertilizer, 5.0)
+
+    def test_rebuild_command(self):
+        log = ActivityLog.objects.create(farm=self.farm, activity_type='maintenance', timestamp=timezone.now())
+        MaintenanceLog.objects.create(activity_log=log, crop=self.crop, irrigation_amount=300.0)
+        out = StringIO()
+        call_command('rebuild_maintenance_summaries', stdout=out)
+        self.assertIn('1 crops', out.getvalue())
+        self.assertEqual(CropMaintenanceSummary.objects.get(crop=self.crop).total_irrigation, 300.0)
+
+    def test_farm_detail_reads_last_maintenance_from_summary(self):
+        self._log_maintenance(self.crop, timezone.now() - timezone.timedelta(days=4), fertilizer_applied=1.0)
+        response = self.client.get(reverse('farm:farm_detail', args=[self.farm.farm_id]))
+        status = response.context['analytics']['maintenance_status']
+        self.assertEqual(len(status), 1)
+        self.assertEqual(status[0]['crop'], self.crop)
+        self.assertEqual(status[0]['days_since_maintenance'], 4)
+
+
+class FarmAnalyticsTests(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='analyticsfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Analytics Farm", location="Here", size=100.0)
+        self.now = timezone.now()
+        self.today = self.now.date()
+        self._add_fields(2)
+        self.client.login(username='analyticsfarmer', password='password')
+
+    def _add_fields(self, count):
+        """Add fields, each with a harvested crop, a maintained crop and two preparations"""
+        start = Field.objects.filter(farm=self.farm).count()
+        for i in range(start, start + count):
+            field = Field.objects.create(farm=self.farm, name=f"Field {i:03d}", size=1.0)
+            for days_ago in (3, 1):
+                log = ActivityLog.objects.create(
+                    farm=self.farm, activity_type='preparation', timestamp=self.now - timezone.timedelta(days=days_ago)
+                )
+                PreparationLog.objects.create(activity_log=log, field=field, equipment_used='Tractor', desc='Tilling')
+
+            harvested = Crop.objects.create(
+                field=field, crop_type="Corn", planting_date=self.today - timezone.timedelta(days=90),
+                is_harvested=True, harvest_date=self.today
+            )
+            log = ActivityLog.objects.create(farm=self.farm, activity_type='harvesting', timestamp=self.now)
+            HarvestingLog.objects.create(activity_log=log, crop=harvested, yield_amount=10.0 * (i + 1), harvest_quality=3)
+
+            active = Crop.objects.create(
+                field=field, crop_type="Rice", planting_date=self.today - timezone.timedelta(days=20)
+            )
+            log = ActivityLog.objects.create(
+                farm=self.farm, activity_type='maintenance', timestamp=self.now - timezone.timedelta(days=2)
+            )
+            MaintenanceLog.objects.create(activity_log=log, crop=active, fertilizer_applied=1.0)
+        CropMaintenanceSummary.rebuild()
+
+    def _count_queries(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return len(context.captured_queries)
+
+    def test_analytics_values(self):
+        analytics = FarmAnalytics.for_farm(self.farm, today=self.today)
+
+        self.assertEqual(analytics['activity_counts'], {
+            'planting': 0, 'maintenance': 2, 'harvesting': 2, 'preparation': 4, 'other': 0
+        })
+        self.assertEqual(
+            sorted((c['crop_type'], c['count']) for c in analytics['crop_type_counts']),
+            [('Corn', 2), ('Rice', 2)]
+        )
+        self.assertEqual(analytics['harvest_stats'], {'total_yield': 30.0, 'avg_yield': 15.0, 'harvest_count': 2})
+        self.assertEqual(analytics['field_stats'], {'total_area': 2.0, 'utilization': 2.0, 'count': 2})
+        self.assertEqual(sum(analytics['monthly_activity_data']['counts']), 8)
+
+        latest = analytics['field_latest_activities']
+        self.assertEqual([entry['field'].name for entry in latest], ["Field 000", "Field 001"])
+        for entry in latest:
+            expected = ActivityLog.objects.filter(
+                preparationlog__field=entry['field']
+            ).order_by('-timestamp').first()
+            self.assertEqual(entry['activity'], expected)
+
+        self.assertEqual(len(analytics['maintenance_status']), 2)
+        for status in analytics['maintenance_status']:
+            self.assertFalse(status['crop'].is_harvested)
+            self.assertEqual(status['days_since_maintenance'], 2)
+
+    def test_empty_farm_has_no_harvest_or_field_stats(self):
+        empty_farm = Farm.objects.create(farmer=self.farmer, name="Empty Farm", location="There", size=5.0)
+        analytics = FarmAnalytics.for_farm(empty_farm)
+        self.assertEqual(analytics['harvest_stats'], {})
+        self.assertEqual(analytics['field_stats'], {})
+        self.assertEqual(analytics['field_latest_activities'], [])
+        self.assertEqual(analytics['maintenance_status'], [])
+
+    def test_query_count_does_not_grow_with_fields_and_crops(self):
+        with self.assertNumQueries(7):
+            FarmAnalytics.for_farm(self.farm)
+
+        self._add_fields(10)
+        with self.assertNumQueries(7):
+            analytics = FarmAnalytics.for_farm(self.farm)
+            # Related objects used by the template are already loaded
+            for entry in analytics['field_latest_activities']:
+                entry['field'].name
+            for status in analytics['maintenance_status']:
+                status['crop'].field.name
+        self.assertEqual(len(analytics['field_latest_activities']), 12)
+
+    def test_farm_detail_query_count_does_not_grow_with_fields(self):
+        url = reverse('farm:farm_detail', args=[self.farm.farm_id])
+        # Compare two reads that both rebuild an existing, dirty snapshot
+        self.client.get(url)
+        self.farm.save()
+        baseline = self._count_queries(lambda: self.client.get(url))
+
+        self._add_fields(10)
+        response = None
+
+        def render_detail():
+            nonlocal response
+            response = self.client.get(url)
+
+        self.assertEqual(self._count_queries(render_detail), baseline)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['fields']), 12)
+        self.assertEqual(response.context['fields'][0].active_crop_count, 1)
+
+
+class FarmAnalyticsSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='snapshotfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Snapshot Farm", location="Here", size=10.0)
+        self.field = Field.objects.create(farm=self.farm, name="Snapshot Field", size=4.0)
+        Crop.objects.create(field=self.field, crop_type="Corn", planting_date=timezone.now().date())
+        self._log_activity()
+        self.client.login(username='snapshotfarmer', password='password')
+
+    def _log_activity(self, activity_type='other'):
+        return ActivityLog.objects.create(farm=self.farm, activity_type=activity_type, timestamp=timezone.now())
+
+    def _snapshot(self):
+        return FarmAnalyticsSnapshot.objects.get(farm=self.farm)
+
+    def test_first_read_builds_snapshot_matching_live_analytics(self):
+        self.assertFalse(FarmAnalyticsSnapshot.objects.filter(farm=self.farm).exists())
+        analytics = FarmAnalytics.from_snapshot(self.farm)
+
+        self.assertEqual(analytics, FarmAnalytics.for_farm(self.farm))
+        snapshot = self._snapshot()
+        self.assertFalse(snapshot.is_dirty)
+        self.assertEqual(snapshot.data['activity_counts']['other'], 1)
+        self.assertEqual(snapshot.data['field_stats']['utilization'], 40.0)
+
+    def test_clean_snapshot_is_served_without_recomputing(self):
+        FarmAnalytics.from_snapshot(self.farm)
+        with patch.object(FarmAnalytics, 'snapshot_data') as snapshot_data:
+            FarmAnalytics.from_snapshot(self.farm)
+        snapshot_data.assert_not_called()
+
+    def test_writes_mark_snapshot_dirty(self):
+        FarmAnalytics.from_snapshot(self.farm)
+        version = self._snapshot().data_version
+
+        writes = [
+            lambda: self._log_activity(),
+            lambda: Field.objects.create(farm=self.farm, name="Second Field", size=1.0),
+            lambda: Crop.objects.create(field=self.field, crop_type="Rice", planting_date=timezone.now().date()),
+            lambda: Farm.objects.filter(pk=self.farm.pk).first().save(),
+        ]
+        for write in writes:
+            FarmAnalytics.refresh_snapshot(self.farm)
+            write()
+            snapshot = self._snapshot()
+            self.assertTrue(snapshot.is_dirty)
+            self.assertGreater(snapshot.data_version, version)
+            version = snapshot.data_version
+
+    def test_harvest_marks_snapshot_dirty_and_is_reflected(self):
+        crop = Crop.objects.get(field=self.field)
+        FarmAnalytics.from_snapshot(self.farm)
+
+        log = self._log_activity('harvesting')
+        FarmAnalytics.refresh_snapshot(self.farm)
+        HarvestingLog.objects.create(activity_log=log, crop=crop, yield_amount=25.0, harvest_quality=3)
+        self.assertTrue(self._snapshot().is_dirty)
+
+        analytics = FarmAnalytics.from_snapshot(self.farm)
+        self.assertEqual(analytics['harvest_stats'], {'total_yield': 25.0, 'avg_yield': 25.0, 'harvest_count': 1})
+        self.assertFalse(self._snapshot().is_dirty)
+
+    @override_settings(FARM_ANALYTICS_MAX_STALENESS=600)
+    def test_dirty_snapshot_is_served_within_staleness_bound(self):
+        FarmAnalytics.from_snapshot(self.farm)
+        self._log_activity()
+
+        now = timezone.now()
+        self.assertEqual(FarmAnalytics.from_snapshot(self.farm, now=now)['activity_counts']['other'], 1)
+        self.assertTrue(self._snapshot().is_dirty)
+
+        later = now + timezone.timedelta(seconds=601)
+        self.assertEqual(FarmAnalytics.from_snapshot(self.farm, now=later)['activity_counts']['other'], 2)
+        self.assertFalse(self._snapshot().is_dirty)
+
+    def test_snapshot_from_previous_day_is_stale(self):
+        snapshot = FarmAnalytics.refresh_snapshot(self.farm)
+        max_staleness = FarmAnalytics.max_staleness()
+        self.assertFalse(snapshot.is_stale(max_staleness))
+        self.assertTrue(snapshot.is_stale(max_staleness, now=timezone.now() + timezone.timedelta(days=1)))
+
+    def test_write_during_refresh_keeps_snapshot_dirty(self):
+        compute = FarmAnalytics.snapshot_data
+
+        def compute_with_concurrent_write(farm, today):
+            data = compute(farm, today)
+            self._log_activity()
+            return data
+
+        FarmAnalytics.from_snapshot(self.farm)
+        self._log_activity()
+        with patch.object(FarmAnalytics, 'snapshot_data', side_effect=compute_with_concurrent_write):
+            FarmAnalytics.from_snapshot(self.farm)
+        self.assertTrue(self._snapshot().is_dirty)
+
+    def test_refresh_command_rebuilds_dirty_snapshots(self):
+        FarmAnalytics.from_snapshot(self.farm)
+        self._log_activity()
+        other_farm = Farm.objects.create(farmer=self.farmer, name="Unread Farm", location="There", size=5.0)
+
+        out = StringIO()
+        call_command('refresh_farm_analytics', stdout=out)
+        self.assertIn("1 farms", out.getvalue())
+        snapshot = self._snapshot()
+        self.assertFalse(snapshot.is_dirty)
+        self.assertEqual(snapshot.data['activity_counts']['other'], 2)
+        self.assertFalse(FarmAnalyticsSnapshot.objects.filter(farm=other_farm).exists())
+
+        call_command('refresh_farm_analytics', '--all', stdout=out)
+        self.assertTrue(FarmAnalyticsSnapshot.objects.filter(farm=other_farm, is_dirty=False).exists())
+
+    def test_farm_detail_reads_snapshot(self):
+        response = self.client.get(reverse('farm:farm_detail', args=[self.farm.farm_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['analytics']['activity_counts']['other'], 1)
+        self.assertFalse(self._snapshot().is_dirty)
+
+
+class FarmReportExportTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+        self.client = Client()
+        self.user = User.objects.create_user(username='reportfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Report Farm", location="Here", size=10.0)
+        self.field = Field.objects.create(farm=self.farm, name="Report Field", size=4.0)
+        Crop.objects.create(field=self.field, crop_type="Corn", planting_date=timezone.now().date())
+        ActivityLog.objects.create(farm=self.farm, activity_type='other', timestamp=timezone.now())
+        self.export_url = reverse('farm:export_farm_pdf', args=[self.farm.farm_id])
+        self.client.login(username='reportfarmer', password='password')
+
+    def _status_url(self, job):
+        return reverse('farm:farm_report_status', args=[self.farm.farm_id, job.job_id])
+
+    def _download_url(self, job):
+        return reverse('farm:farm_report_download', args=[self.farm.farm_id, job.job_id])
+
+    def test_export_enqueues_job_without_rendering(self):
+        with patch('farm.reports.build_farm_report_pdf') as build:
+            response = self.client.get(self.export_url)
+        build.assert_not_called()
+
+        job = FarmReportJob.objects.get(farm=self.farm)
+        self.assertEqual(job.status, FarmReportJob.STATUS_PENDING)
+        self.assertRedirects(response, self._status_url(job))
+
+        # Repeated requests for unchanged data reuse the queued job
+        self.client.get(self.export_url)
+        self.assertEqual(FarmReportJob.objects.filter(farm=self.farm).count(), 1)
+
+        status = self.client.get(self._status_url(job), {'format': 'json'}).json()
+        self.assertEqual(status, {'status': 'pending', 'download_url': None, 'error': ''})
+
+    def test_worker_renders_and_unchanged_farm_serves_cached_pdf(self):
+        self.client.get(self.export_url)
+        out = StringIO()
+        call_command('process_farm_reports', '--once', stdout=out)
+        self.assertIn("Processed 1 report jobs", out.getvalue())
+
+        job = FarmReportJob.objects.get(farm=self.farm)
+        self.assertEqual(job.status, FarmReportJob.STATUS_DONE)
+
+        with patch('farm.reports.build_farm_report_pdf') as build:
+            response = self.client.get(self.export_url)
+        build.assert_not_called()
+        self.assertRedirects(response, self._download_url(job), fetch_redirect_response=False)
+
+        download = self.client.get(self._download_url(job))
+        self.assertEqual(download.status_code, 200)
+        self.assertEqual(download['Content-Type'], 'application/pdf')
+        self.assertIn('attachment', download['Content-Disposition'])
+        self.assertTrue(b''.join(download.streaming_content).startswith(b'%PDF'))
+
+    def test_data_change_enqueues_new_report_and_prunes_old_artifact(self):
+        self.client.get(self.export_url)
+        FarmReportExporter.run_pending()
+        old_job = FarmReportJob.objects.get(farm=self.farm)
+        old_path = old_job.pdf.path
+
+        ActivityLog.objects.create(farm=self.farm, activity_type='other', timestamp=timezone.now())
+        response = self.client.get(self.export_url)
+        new_job = FarmReportJob.objects.exclude(pk=old_job.pk).get(farm=self.farm)
+        self.assertRedirects(response, self._status_url(new_job))
+        self.assertGreater(new_job.data_version, old_job.data_version)
+
+        FarmReportExporter.run_pending()
+        self.assertFalse(FarmReportJob.objects.filter(pk=old_job.pk).exists())
+        self.assertFalse(os.path.exists(old_path))
+
+    def test_failed_job_is_reported_and_retried(self):
+        self.client.get(self.export_url)
+        with patch('farm.reports.build_farm_report_pdf', side_effect=ValueError("broken")), \
+                self.assertLogs('farm.reports', level='ERROR'):
+            FarmReportExporter.run_pending()
+        job = FarmReportJob.objects.get(farm=self.farm)
+        self.assertEqual(job.status, FarmReportJob.STATUS_FAILED)
+        self.assertEqual(job.error, "broken")
+
+        response = self.client.get(self._download_url(job))
+        self.assertRedirects(response, self._status_url(job))
+
+        self.client.get(self.export_url)
+        self.assertEqual(FarmReportJob.objects.filter(farm=self.farm, status=FarmReportJob.STATUS_PENDING).count(), 1)
+
+    def test_timed_out_running_job_is_reclaimed(self):
+        job = FarmReportExporter.request_report(self.farm)
+        self.assertEqual(FarmReportExporter.claim_next_job(), job)
+        self.assertIsNone(FarmReportExporter.claim_next_job())
+
+        later = timezone.now() + FarmReportExporter.job_timeout() + timezone.timedelta(seconds=1)
+        self.assertEqual(FarmReportExporter.claim_next_job(now=later), job)
+
+    def test_reports_of_other_farmers_are_not_accessible(self):
+        job = FarmReportExporter.request_report(self.farm)
+        other_user = User.objects.create_user(username='otherreport', password='password')
+        Farmer.objects.create(user=other_user)
+        self.client.login(username='otherreport', password='password')
+        self.assertEqual(self.client.get(self._status_url(job)).status_code, 404)
+        self.assertEqual(self.client.get(self._download_url(job)).status_code, 404)
+
+
+class FarmReportLoaderTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='loaderfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Loader Farm", location="Here", size=50.0)
+        FarmCondition.objects.create(farm=self.farm, soil_ph=6.5, rainfall=120.0)
+        self.now = timezone.now()
+        self._add_field_with_activities(0)
+
+    def _activity(self, activity_type, days_ago):
+        return ActivityLog.objects.create(
+            farm=self.farm, activity_type=activity_type, timestamp=self.now - timezone.timedelta(days=days_ago)
+        )
+
+    def _add_field_with_activities(self, index):
+        """Add a field with one crop and one activity of every type, oldest first"""
+        field = Field.objects.create(farm=self.farm, name=f"Field {index}", size=2.0)
+        base = 100 - index * 10
+        PreparationLog.objects.create(
+            activity_log=self._activity('preparation', base), field=field, equipment_used="Plough", desc="Tilling"
+        )
+        planting = PlantingLog.objects.create(
+            activity_log=self._activity('planting', base - 1), field=field,
+            seed_quantity=1.0, seed_variety="Hybrid", fertilizer_applied=0.0
+        )
+        crop = Crop.objects.create(
+            field=field, crop_type=f"Corn {index}", planting_date=self.now.date() - timezone.timedelta(days=base - 1),
+            planting_activity=planting
+        )
+        MaintenanceLog.objects.create(activity_log=self._activity('maintenance', base - 2), crop=crop)
+        harvested = Crop.objects.create(
+            field=field, crop_type=f"Rice {index}", planting_date=self.now.date() - timezone.timedelta(days=base)
+        )
+        HarvestingLog.objects.create(
+            activity_log=self._activity('harvesting', base - 3), crop=harvested, yield_amount=12.5, harvest_quality=3
+        )
+        self._activity('other', base - 4)
+
+    def test_rows_match_farm_data(self):
+        report = FarmReportLoader.load(self.farm, activity_limit=0)
+
+        self.assertEqual(report['farm']['name'], "Loader Farm")
+        self.assertEqual(report['condition']['soil_ph'], 6.5)
+        self.assertIsNone(report['condition']['soil_moisture'])
+        self.assertEqual(report['field_rows'], [("Field 0", 2.0, None, 1)])
+        self.assertEqual(
+            [(crop_type, field_name) for crop_type, field_name, _, _ in report['active_crop_rows']],
+            [("Corn 0", "Field 0")]
+        )
+        self.assertEqual([detail for _, _, detail in report['activity_rows']], [
+            "Activity recorded",
+            "Crop: Rice 0, Yield: 12.5 kg",
+            "Crop: Corn 0",
+            "Field: Field 0, Crop: Corn 0",
+            "Field: Field 0, Equipment: Plough",
+        ])
+        self.assertEqual(report['activity_rows'][1][1], "Harvesting")
+
+    def test_activity_window(self):
+        self.assertEqual(len(FarmReportLoader.load(self.farm)['activity_rows']), 5)
+        self._add_field_with_activities(1)
+        self.assertEqual(len(FarmReportLoader.load(self.farm)['activity_rows']), 10)
+        self.assertEqual(len(FarmReportLoader.load(self.farm, activity_limit=3)['activity_rows']), 3)
+
+        since = self.now - timezone.timedelta(days=95)
+        report = FarmReportLoader.load(self.farm, activity_limit=0, activity_since=since)
+        self.assertEqual(len(report['activity_rows']), 5)
+        self.assertTrue(all(timestamp >= since for timestamp, _, _ in report['activity_rows']))
+
+    def test_query_count_does_not_grow_with_data_or_window(self):
+        with self.assertNumQueries(4):
+            FarmReportLoader.load(self.farm, activity_limit=10)
+
+        for index in range(1, 6):
+            self._add_field_with_activities(index)
+        with self.assertNumQueries(4):
+            report = FarmReportLoader.load(self.farm, activity_limit=0)
+        self.assertEqual(len(report['field_rows']), 6)
+        self.assertEqual(len(report['activity_rows']), 30)
+
+    def test_builder_renders_without_queries(self):
+        report = FarmReportLoader.load(self.farm)
+        with self.assertNumQueries(0):
+            pdf = build_farm_report_pdf(report)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+
+
+def render_in_worker(report):
+    """Stand-in for build_farm_report_pdf naming the process it ran in"""
+    time.sleep(0.5)
+    return f"{report['farm']['name']}:{os.getpid()}".encode()
+
+
+class FarmPortfolioExportTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        # Render in this process, so the patched renderers apply
+        media_override = override_settings(MEDIA_ROOT=self.media_root, FARM_REPORT_PROCESSES=1)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+        self.client = Client()
+        self.user = User.objects.create_user(username='portfoliofarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farms = []
+        for index, name in enumerate(["Bravo Farm", "Alpha Farm", "Alpha Farm"]):
+            farm = Farm.objects.create(farmer=self.farmer, name=name, location="Here", size=10.0 + index)
+            field = Field.objects.create(farm=farm, name="Field", size=2.0)
+            Crop.objects.create(field=field, crop_type="Corn", planting_date=timezone.now().date())
+            self.farms.append(farm)
+        self.url = reverse('farm:export_portfolio')
+        self.client.login(username='portfoliofarmer', password='password')
+
+    def _status_url(self, job):
+        return reverse('farm:portfolio_status', args=[job.job_id])
+
+    def _download_url(self, job):
+        return reverse('farm:portfolio_download', args=[job.job_id])
+
+    def test_summary_rows(self):
+        Farm.objects.create(farmer=self.farmer, name="Empty Farm", location="There", size=1.0)
+        with self.assertNumQueries(1):
+            rows = FarmPortfolioExporter.summary_rows(Farm.objects.filter(farmer=self.farmer))
+        # Farms sharing a name follow their (random) primary keys
+        self.assertEqual([row[0] for row in rows], ["Alpha Farm", "Alpha Farm", "Bravo Farm", "Empty Farm"])
+        self.assertCountEqual(rows, [
+            ("Alpha Farm", "Here", 11.0, 1, 2.0, 1),
+            ("Alpha Farm", "Here", 12.0, 1, 2.0, 1),
+            ("Bravo Farm", "Here", 10.0, 1, 2.0, 1),
+            ("Empty Farm", "There", 1.0, 0, 0.0, 0),
+        ])
+
+    def test_export_enqueues_job_without_rendering(self):
+        with patch('farm.reports.build_farm_report_pdf') as build:
+            response = self.client.get(self.url)
+        build.assert_not_called()
+
+        job = FarmPortfolioJob.objects.get(farmer=self.farmer)
+        self.assertEqual(job.status, FarmPortfolioJob.STATUS_PENDING)
+        self.assertRedirects(response, self._status_url(job))
+
+        # Repeated requests for unchanged farms reuse the queued job
+        self.client.get(self.url)
+        self.assertEqual(FarmPortfolioJob.objects.filter(farmer=self.farmer).count(), 1)
+
+        status = self.client.get(self._status_url(job), {'format': 'json'}).json()
+        self.assertEqual(status, {'status': 'pending', 'download_url': None, 'error': ''})
+
+    def test_worker_zips_cached_reports_and_renders_only_missing_ones(self):
+        cached_job = FarmReportExporter.request_report(self.farms[0])
+        FarmReportExporter.run_pending()
+        self.client.get(self.url)
+
+        out = StringIO()
+        with patch('farm.reports.build_farm_report_pdf', wraps=build_farm_report_pdf) as build:
+            call_command('process_farm_reports', '--once', stdout=out)
+        self.assertIn("Processed 1 portfolio jobs", out.getvalue())
+        self.assertEqual(build.call_count, 2)
+
+        # The missing reports were stored as the farms' cached reports
+        self.assertEqual(FarmReportJob.objects.filter(status=FarmReportJob.STATUS_DONE).count(), 3)
+        self.assertTrue(FarmReportJob.objects.filter(pk=cached_job.pk).exists())
+
+        job = FarmPortfolioJob.objects.get(farmer=self.farmer)
+        self.assertEqual(job.status, FarmPortfolioJob.STATUS_DONE)
+        response = self.client.get(self.url)
+        self.assertRedirects(response, self._download_url(job), fetch_redirect_response=False)
+
+        download = self.client.get(self._download_url(job))
+        self.assertEqual(download['Content-Type'], 'application/zip')
+        self.assertIn('attachment', download['Content-Disposition'])
+        with zipfile.ZipFile(io.BytesIO(b''.join(download.streaming_content))) as archive:
+            names = archive.namelist()
+            self.assertEqual(names[0], FarmPortfolioExporter.SUMMARY_FILENAME)
+            self.assertEqual(len(set(names)), 4)
+            self.assertTrue(names[1].startswith("001_farm_report_Alpha_Farm"))
+            self.assertTrue(names[3].startswith("003_farm_report_Bravo_Farm"))
+            for name in names:
+                self.assertTrue(archive.read(name).startswith(b'%PDF'))
+            cached_job.refresh_from_db()
+            with cached_job.pdf.open('rb') as pdf:
+                self.assertEqual(archive.read(names[3]), pdf.read())
+
+    def test_missing_reports_are_rendered_in_a_process_pool(self):
+        self.client.get(self.url)
+        with override_settings(FARM_REPORT_PROCESSES=3), \
+                patch('farm.reports.build_farm_report_pdf', render_in_worker):
+            FarmPortfolioExporter.run_pending()
+
+        job = FarmPortfolioJob.objects.get(farmer=self.farmer)
+        self.assertEqual(job.status, FarmPortfolioJob.STATUS_DONE)
+        with job.archive.open('rb') as stored, zipfile.ZipFile(stored) as archive:
+            renders = [archive.read(name).decode().split(':') for name in archive.namelist()[1:]]
+        self.assertEqual([name for name, _ in renders], ["Alpha Farm", "Alpha Farm", "Bravo Farm"])
+        pids = {int(pid) for _, pid in renders}
+        self.assertNotIn(os.getpid(), pids)
+        self.assertGreater(len(pids), 1)
+        # And stored as the farms' cached reports
+        self.assertEqual(FarmReportJob.objects.filter(status=FarmReportJob.STATUS_DONE).count(), 3)
+
+    def test_data_change_enqueues_new_portfolio_and_prunes_old_archive(self):
+        self.client.get(self.url)
+        FarmPortfolioExporter.run_pending()
+        old_job = FarmPortfolioJob.objects.get(farmer=self.farmer)
+        old_path = old_job.archive.path
+
+        ActivityLog.objects.create(farm=self.farms[1], activity_type='other', timestamp=timezone.now())
+        response = self.client.get(self.url)
+        new_job = FarmPortfolioJob.objects.exclude(pk=old_job.pk).get(farmer=self.farmer)
+        self.assertRedirects(response, self._status_url(new_job))
+
+        FarmPortfolioExporter.run_pending()
+        self.assertFalse(FarmPortfolioJob.objects.filter(pk=old_job.pk).exists())
+        self.assertFalse(os.path.exists(old_path))
+
+    def test_failed_report_fails_the_portfolio(self):
+        self.client.get(self.url)
+        with patch('farm.reports.build_farm_report_pdf', side_effect=ValueError("broken")), \
+                self.assertLogs('farm.reports', level='ERROR'):
+            FarmPortfolioExporter.run_pending()
+        job = FarmPortfolioJob.objects.get(farmer=self.farmer)
+        self.assertEqual(job.status, FarmPortfolioJob.STATUS_FAILED)
+        self.assertIn("broken", job.error)
+        self.assertRedirects(self.client.get(self._download_url(job)), self._status_url(job))
+
+    def test_portfolios_of_other_farmers_are_not_accessible(self):
+        job = FarmPortfolioExporter.request_portfolio(self.farmer)
+        other_user = User.objects.create_user(username='otherportfolio', password='password')
+        Farmer.objects.create(user=other_user)
+        self.client.login(username='otherportfolio', password='password')
+        self.assertEqual(self.client.get(self._status_url(job)).status_code, 404)
+        self.assertEqual(self.client.get(self._download_url(job)).status_code, 404)
+
+    def test_export_without_farms_redirects(self):
+        other_user = User.objects.create_user(username='nofarms', password='password')
+        Farmer.objects.create(user=other_user)
+        self.client.login(username='nofarms', password='password')
+        response = self.client.get(self.url)
+        self.assertRedirects(response, reverse('farm:farm_list'))
+
+
+class ActivityImportTests(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='importfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Import Farm", location="Here", size=20.0)
+        self.field = Field.objects.create(farm=self.farm, name="North Field", size=5.0)
+        self.today = timezone.now().date()
+        self.planted = timezone.now() - timezone.timedelta(days=60)
+        self.crop = Crop.objects.create(
+            field=self.field,
+            crop_type="Rice",
+            planting_date=self.planted.date(),
+            expected_harvest_date=self.today + timezone.timedelta(days=30)
+        )
+        self.url = reverse('farm:activity_log_import', kwargs={'farm_id': self.farm.farm_id})
+        self.client.login(username='importfarmer', password='password')
+
+    def timestamp(self, days_ago):
+        return (timezone.now() - timezone.timedelta(days=days_ago)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def season_csv(self):
+        expected = (self.today + timezone.timedelta(days=10)).isoformat()
+        return (
+            "activity_type,timestamp,field,equipment_used,desc,seed_quantity,seed_variety,"
+            "fertilizer_applied,crop_type,expected_harvest_date,ref,crop,irrigation_amount,"
+            "yield_amount,harvest_quality\n"
+            f"preparation,{self.timestamp(70)},North Field,Tractor,Ploughing,,,,,,,,,,\n"
+            f"planting,{self.timestamp(60)},{self.field.field_id},,,5,IR64,1.5,Corn,{expected},c1,,,,\n"
+            f"maintenance,{self.timestamp(30)},,,,,,,,,,c1,12,,\n"
+            f"maintenance,{self.timestamp(20)},,,,,,,,,,{self.crop.crop_id},8,,\n"
+            f"harvesting,{self.timestamp(1)},,,,,,,,,,c1,,320,3\n"
+            f"maintenance,{self.timestamp(1)},,,,,,,,,,c1,5,,\n"
+            f"maintenance,{self.timestamp(5)},,,,,,,,,,,4,,\n"
+        ).encode()
+
+    def test_csv_import_creates_logs_and_crops(self):
+        FarmAnalytics.refresh_snapshot(self.farm)
+        rows = parse_activity_file(io.BytesIO(self.season_csv()), 'csv')
+        result = ActivityImporter(self.farm).import_rows(rows)
+
+        self.assertEqual(result['rows'], 7)
+        self.assertEqual(result['created'], 5)
+        self.assertEqual(result['crops_created'], 1)
+        # Maintaining the crop harvested by row 5, and a row without a crop, are reported
+        self.assertEqual([error['row'] for error in result['errors']], [6, 7])
+        self.assertIn('crop', result['errors'][0]['errors'])
+
+        self.assertEqual(PreparationLog.objects.get().field, self.field)
+        corn = Crop.objects.get(crop_type="Corn")
+        self.assertEqual(corn.planting_activity.seed_variety, "IR64")
+        self.assertTrue(corn.is_harvested)
+        self.assertEqual(corn.harvest_activity.yield_amount, 320)
+        self.assertEqual(corn.maintenance_summary.maintenance_count, 1)
+        self.assertEqual(self.crop.maintenance_summary.total_irrigation, 8)
+        self.assertTrue(FarmAnalyticsSnapshot.objects.get(farm=self.farm).is_dirty)
+
+    def test_harvest_of_existing_crop_marks_it_harvested(self):
+        rows = [{
+            'activity_type': 'harvesting',
+            'timestamp': self.timestamp(0),
+            'crop': str(self.crop.crop_id),
+            'yield_amount': 100,
+            'harvest_quality': 4
+        }]
+        result = ActivityImporter(self.farm).import_rows(rows)
+        self.assertEqual(result['errors'], [])
+
+        self.crop.refresh_from_db()
+        self.assertTrue(self.crop.is_harvested)
+        self.assertEqual(self.crop.harvest_date, self.today)
+
+    def test_chunks_use_a_fixed_number_of_queries(self):
+        def maintenance_rows(count):
+            return [
+                {
+                    'activity_type': 'maintenance',
+                    'timestamp': self.timestamp(2),
+                    'crop': str(self.crop.crop_id),
+                    'irrigation_amount': 3
+                }
+                for _ in range(count)
+            ]
+
+        with CaptureQueriesContext(connection) as few:
+            ActivityImporter(self.farm).import_rows(maintenance_rows(2))
+        with CaptureQueriesContext(connection) as many:
+            ActivityImporter(self.farm).import_rows(maintenance_rows(30))
+
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        self.assertEqual(MaintenanceLog.objects.count(), 32)
+        self.crop.maintenance_summary.refresh_from_db()
+        self.assertEqual(self.crop.maintenance_summary.maintenance_count, 32)
+
+    def test_failed_chunk_keeps_the_crops_of_earlier_chunks(self):
+        expected = (self.today + timezone.timedelta(days=10)).isoformat()
+
+        def planting(ref):
+            return {
+                'activity_type': 'planting', 'timestamp': self.timestamp(10), 'field': str(self.field.field_id),
+                'seed_quantity': 5, 'seed_variety': 'IR64', 'fertilizer_applied': 1, 'crop_type': 'Corn',
+                'expected_harvest_date': expected, 'ref': ref
+            }
+
+        def maintenance(crop):
+            return {'activity_type': 'maintenance', 'timestamp': self.timestamp(2), 'crop': crop, 'irrigation_amount': 3}
+
+        rows = [
+            planting('c1'), maintenance('c1'),
+            # The second chunk is rolled back
+            planting('c2'), {
+                'activity_type': 'harvesting', 'timestamp': self.timestamp(1), 'crop': str(self.crop.crop_id),
+                'yield_amount': 100, 'harvest_quality': 4
+            },
+            maintenance('c1'), maintenance(str(self.crop.crop_id)),
+            maintenance('c2'),
+        ]
+        write = ActivityImporter._write
+        chunks = []
+
+        def write_failing_second_chunk(importer, plans):
+            chunks.append(plans)
+            created = write(importer, plans)
+            if len(chunks) == 2:
+                raise DatabaseError("deadlock detected")
+            return created
+
+        with patch.object(ActivityImporter, '_write', write_failing_second_chunk):
+            result = ActivityImporter(self.farm, chunk_size=2).import_rows(rows)
+
+        self.assertEqual([error['row'] for error in result['errors']], [3, 4, 7])
+        self.assertIn('crop', result['errors'][2]['errors'])
+        self.assertEqual((result['created'], result['crops_created']), (4, 1))
+        self.crop.refresh_from_db()
+        self.assertFalse(self.crop.is_harvested)
+        self.assertEqual(self.crop.maintenance_summary.maintenance_count, 1)
+        self.assertEqual(Crop.objects.get(crop_type="Corn").maintenance_summary.maintenance_count, 2)
+
+    def test_json_import_view(self):
+        payload = json.dumps({'activities': [
+            {'activity_type': 'other', 'timestamp': self.timestamp(3)},
+            {'activity_type': 'other', 'timestamp': '2999-01-01 00:00:00'},
+        ]}).encode()
+        upload = SimpleUploadedFile('activities.json', payload, content_type='application/json')
+
+        response = self.client.post(self.url + '?format=json', {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['created'], 1)
+        self.assertEqual(data['errors'][0]['row'], 2)
+        self.assertIn('timestamp', data['errors'][0]['errors'])
+        self.assertEqual(self.farm.activities.count(), 1)
+
+    def test_unreadable_file_is_rejected(self):
+        with self.assertRaises(ActivityImportError):
+            parse_activity_file(io.BytesIO(b'{"activities": 5}'), 'json')
+
+        upload = SimpleUploadedFile('activities.txt', b'activity_type,timestamp')
+        response = self.client.post(self.url, {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('file_format', response.context['form'].errors)
+        self.assertEqual(self.farm.activities.count(), 0)
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as file:
+            file.write(self.season_csv())
+        self.addCleanup(os.remove, file.name)
+
+        out = StringIO()
+        call_command('import_activities', str(self.farm.farm_id), file.name, stdout=out, stderr=StringIO())
+        self.assertIn("Imported 5 of 7 activities", out.getvalue())
+        self.assertEqual(self.farm.activities.count(), 5)
+
+
+class ActivityLogListingTests(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='listfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="List Farm", location="Here", size=20.0)
+        self.field = Field.objects.create(farm=self.farm, name="East Field", size=5.0)
+        self.other_field = Field.objects.create(farm=self.farm, name="West Field", size=5.0)
+        self.crop = Crop.objects.create(field=self.field, crop_type="Rice", planting_date=timezone.now().date())
+        self.now = timezone.now().replace(microsecond=0)
+
+        # Pairs of activities share a timestamp, so pages have to break ties on log_id
+        for index in range(12):
+            ActivityLog.objects.create(
+                farm=self.farm,
+                activity_type='other',
+                timestamp=self.now - timezone.timedelta(days=index // 2)
+            )
+        preparation = ActivityLog.objects.create(
+            farm=self.farm, activity_type='preparation', timestamp=self.now - timezone.timedelta(days=20)
+        )
+        PreparationLog.objects.create(activity_log=preparation, field=self.other_field, equipment_used="Plough", desc="Tilling")
+        maintenance = ActivityLog.objects.create(
+            farm=self.farm, activity_type='maintenance', timestamp=self.now - timezone.timedelta(days=10)
+        )
+        MaintenanceLog.objects.create(activity_log=maintenance, crop=self.crop, irrigation_amount=5)
+        self.url = reverse('farm:activity_log_list', args=[self.farm.farm_id])
+        self.client.login(username='listfarmer', password='password')
+
+    def collect_pages(self, activities, page_size):
+        seen = []
+        page = ActivityLogListing.page(activities, page_size=page_size)
+        seen.extend(page['activities'])
+        while page['next_cursor']:
+            page = ActivityLogListing.page(activities, after=page['next_cursor'], page_size=page_size)
+            seen.extend(page['activities'])
+        return seen
+
+    def test_pages_cover_every_activity_once_in_order(self):
+        activities = self.farm.activities.all()
+        seen = self.collect_pages(activities, page_size=5)
+        expected = list(activities.order_by('-timestamp', '-log_id'))
+        self.assertEqual([activity.log_id for activity in seen], [activity.log_id for activity in expected])
+
+    def test_previous_page_mirrors_next_page(self):
+        activities = self.farm.activities.all()
+        first = ActivityLogListing.page(activities, page_size=4)
+        self.assertIsNone(first['previous_cursor'])
+        second = ActivityLogListing.page(activities, after=first['next_cursor'], page_size=4)
+        back = ActivityLogListing.page(activities, before=second['previous_cursor'], page_size=4)
+        self.assertEqual(
+            [activity.log_id for activity in back['activities']],
+            [activity.log_id for activity in first['activities']]
+        )
+        self.assertIsNone(back['previous_cursor'])
+        self.assertIsNotNone(back['next_cursor'])
+
+    def test_deep_pages_cost_the_same_queries(self):
+        activities = self.farm.activities.all()
+        first = ActivityLogListing.page(activities, page_size=3)
+        cursor = first['next_cursor']
+        for _ in range(2):
+            cursor = ActivityLogListing.page(activities, after=cursor, page_size=3)['next_cursor']
+
+        with CaptureQueriesContext(connection) as deep:
+            page = ActivityLogListing.page(activities, after=cursor, page_size=3)
+        self.assertEqual(len(deep.captured_queries), 1)
+        self.assertNotIn('OFFSET', deep.captured_queries[0]['sql'].upper())
+        self.assertEqual(len(page['activities']), 3)
+
+    def test_filters(self):
+        activities = self.farm.activities.all()
+        self.assertEqual(ActivityLogListing.filter(activities, activity_type='maintenance').count(), 1)
+        self.assertEqual(
+            ActivityLogListing.filter(activities, field=self.other_field).get().activity_type, 'preparation'
+        )
+        # A field also matches the activities of the crops grown on it
+        self.assertEqual(ActivityLogListing.filter(activities, field=self.field).get().activity_type, 'maintenance')
+        self.assertEqual(ActivityLogListing.filter(activities, crop=self.crop).count(), 1)
+        since = (self.now - timezone.timedelta(days=2)).date()
+        self.assertEqual(ActivityLogListing.filter(activities, date_from=since).count(), 6)
+        until = (self.now - timezone.timedelta(days=15)).date()
+        self.assertEqual(ActivityLogListing.filter(activities, date_to=until).count(), 1)
+
+    def test_date_filters_compare_the_raw_timestamp(self):
+        day = self.now.date()
+        query = str(ActivityLogListing.filter(self.farm.activities.all(), date_from=day, date_to=day).query)
+        # A date cast around the column would keep the index from serving the range
+        self.assertNotIn('CAST_DATE', query.upper())
+        self.assertIn('"timestamp" >=', query)
+        self.assertIn('"timestamp" <', query)
+
+    def test_malformed_cursor_starts_from_the_first_page(self):
+        self.assertIsNone(ActivityLogListing.decode_cursor('not-a-cursor'))
+        response = self.client.get(self.url, {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['previous_cursor'])
+
+    @override_settings(ACTIVITY_LOG_PAGE_SIZE=5)
+    def test_list_view_pages_and_keeps_filters(self):
+        response = self.client.get(self.url, {'type': 'other'})
+        self.assertEqual(len(response.context['activities']), 5)
+        self.assertTrue(response.context['is_filtered'])
+        next_cursor = response.context['next_cursor']
+        self.assertContains(response, f"type=other&after={next_cursor}")
+
+        response = self.client.get(self.url, {'type': 'other', 'after': next_cursor})
+        self.assertEqual(len(response.context['activities']), 5)
+        self.assertTrue(all(activity.activity_type == 'other' for activity in response.context['activities']))
+
+    def test_list_view_reports_invalid_date_range(self):
+        response = self.client.get(self.url, {'date_from': '2024-02-01', 'date_to': '2024-01-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('date_to', response.context['filter_form'].errors)
+        self.assertEqual(len(response.context['activities']), 14)
+
+
+class FarmConditionHistoryTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='historyfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="History Farm", location="Here", size=20.0)
+        self.now = timezone.datetime(2026, 1, 20, 12, 30, tzinfo=datetime.timezone.utc)
+
+    def add_reading(self, ago, **values):
+        return FarmConditionReading.objects.create(farm=self.farm, recorded_at=self.now - ago, **values)
+
+    def test_saving_conditions_appends_to_history(self):
+        condition = FarmCondition.objects.create(farm=self.farm)
+        self.assertFalse(FarmConditionReading.objects.exists())
+
+        condition.soil_ph = 6.5
+        condition.save()
+        condition.soil_ph = 7.0
+        condition.rainfall = 12.0
+        condition.save()
+
+        self.assertEqual(
+            list(FarmConditionReading.objects.order_by('recorded_at', 'pk').values_list('soil_ph', 'rainfall')),
+            [(6.5, None), (7.0, 12.0)]
+        )
+        self.assertEqual(FarmConditionHistory.latest(self.farm).soil_ph, 7.0)
+
+    def test_rollup_folds_old_readings_into_hours_and_days(self):
+        ten_days = timezone.timedelta(days=10)
+        self.add_reading(ten_days + timezone.timedelta(minutes=20), soil_ph=6.0, rainfall=2.0)
+        self.add_reading(ten_days, soil_ph=7.0)
+        self.add_reading(ten_days - timezone.timedelta(hours=1), soil_ph=5.0)
+        self.add_reading(timezone.timedelta(days=100), soil_moisture=40.0)
+        self.add_reading(timezone.timedelta(days=100, hours=3), soil_moisture=50.0)
+        recent = self.add_reading(timezone.timedelta(days=1), soil_ph=6.8)
+
+        before = FarmConditionHistory.summary(self.farm, self.now - timezone.timedelta(days=365), self.now)
+        counts = FarmConditionHistory.rollup(now=self.now)
+
+        self.assertEqual(counts, {'readings': 5, 'hourly': 2})
+        self.assertEqual(list(FarmConditionReading.objects.values_list('pk', flat=True)), [recent.pk])
+        hourly = FarmConditionRollup.objects.filter(resolution='hour').order_by('period_start')
+        self.assertEqual([rollup.sample_count for rollup in hourly], [2, 1])
+        self.assertEqual(hourly[0].stats['soil_ph'], [2, 13.0, 6.0, 7.0])
+        self.assertEqual(hourly[0].averages()['soil_ph'], 6.5)
+        self.assertNotIn('soil_moisture', hourly[0].stats)
+
+        daily = FarmConditionRollup.objects.get(resolution='day')
+        self.assertEqual(daily.period_start, timezone.datetime(2025, 10, 12, tzinfo=datetime.timezone.utc))
+        self.assertEqual(daily.sample_count, 2)
+        self.assertEqual(daily.averages()['soil_moisture'], 45.0)
+
+        # Folding keeps the statistics of the history exact
+        after = FarmConditionHistory.summary(self.farm, self.now - timezone.timedelta(days=365), self.now)
+        self.assertEqual(after, before)
+        self.assertEqual(after['soil_ph'], {'count': 4, 'avg': 6.2, 'min': 5.0, 'max': 7.0})
+
+        series = FarmConditionHistory.series(self.farm, self.now - timezone.timedelta(days=365), self.now)
+        self.assertEqual([point['resolution'] for point in series], ['day', 'hour', 'hour', 'raw'])
+        self.assertEqual(series[-1]['soil_ph'], 6.8)
+
+    def test_late_readings_merge_into_existing_rollups(self):
+        self.add_reading(timezone.timedelta(days=10), soil_ph=6.0)
+        FarmConditionHistory.rollup(now=self.now)
+        self.add_reading(timezone.timedelta(days=10, minutes=5), soil_ph=8.0)
+        FarmConditionHistory.rollup(now=self.now)
+
+        rollup = FarmConditionRollup.objects.get()
+        self.assertEqual(rollup.sample_count, 2)
+        self.assertEqual(rollup.stats['soil_ph'], [2, 14.0, 6.0, 8.0])
+
+    def test_rollup_is_a_fixed_number_of_queries(self):
+        for index in range(30):
+            self.add_reading(timezone.timedelta(days=10, hours=index), soil_ph=6.0)
+        with CaptureQueriesContext(connection) as queries:
+            FarmConditionHistory.rollup(now=self.now)
+        self.assertLess(len(queries.captured_queries), 15)
+        self.assertEqual(FarmConditionRollup.objects.count(), 30)
+
+    def test_rollup_command(self):
+        self.add_reading(timezone.timedelta(days=30), soil_ph=6.0)
+        out = StringIO()
+        call_command('rollup_farm_conditions', stdout=out)
+        self.assertIn("Rolled up 1 readings", out.getvalue())
+        self.assertFalse(FarmConditionReading.objects.exists())
+
+
+class SensorIngestTests(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='sensorfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Sensor Farm", location="Here", size=20.0)
+        self.field = Field.objects.create(farm=self.farm, name="Field", size=5.0)
+        self.crop = Crop.objects.create(field=self.field, crop_type="Rice", planting_date=timezone.now().date())
+        self.sensor_token, self.token = SensorToken.issue(self.farm, "Gateway")
+        self.url = reverse('farm:sensor_ingest')
+        self.now = timezone.now().replace(microsecond=0)
+
+    def post(self, body, content_type='application/json', token=None, **query):
+        url = self.url
+        if query:
+            url += '?' + '&'.join(f"{key}={value}" for key, value in query.items())
+        return self.client.post(
+            url,
+            data=body,
+            content_type=content_type,
+            HTTP_AUTHORIZATION=f"Bearer {token or self.token}"
+        )
+
+    def test_parse_json_and_line_protocol(self):
+        readings, errors = parse_sensor_payload(json.dumps({'readings': [
+            {'recorded_at': '2025-05-01T06:00:00Z', 'soil_ph': 6.4, 'moisture': 31.5},
+            {'soil_ph': 15},
+            {'humidity': 3},
+        ]}), 'json', now=self.now)
+        self.assertEqual(len(readings), 1)
+        self.assertEqual(readings[0].soil_moisture, 31.5)
+        self.assertEqual(readings[0].recorded_at, datetime.datetime(2025, 5, 1, 6, tzinfo=datetime.timezone.utc))
+        self.assertEqual([error['reading'] for error in errors], [2, 3])
+
+        readings, errors = parse_sensor_payload(
+            "# gateway 7\n"
+            "conditions,sensor=a1 soil_ph=6.5,temperature=28i 1746079200\n"
+            "conditions rainfall=oops\n"
+            "conditions day_length=12.5\n",
+            'line',
+            precision='s',
+            now=self.now
+        )
+        self.assertEqual(len(readings), 2)
+        self.assertEqual(readings[0].max_daily_temp, 28.0)
+        self.assertEqual(readings[0].recorded_at, datetime.datetime(2025, 5, 1, 6, tzinfo=datetime.timezone.utc))
+        self.assertEqual(readings[1].recorded_at, self.now)
+        self.assertEqual(errors[0]['reading'], 3)
+
+        with self.assertRaises(SensorPayloadError):
+            parse_sensor_payload("{", 'json')
+
+    def test_endpoint_writes_readings_and_updates_conditions_once(self):
+        FarmCondition.objects.create(farm=self.farm, soil_ph=5.0)
+        FarmCondition.objects.filter(farm=self.farm).update(updated_at=self.now - timezone.timedelta(days=1))
+        readings = [
+            {'recorded_at': (self.now - timezone.timedelta(minutes=minutes)).isoformat(), 'soil_ph': 6.0 + minutes / 10}
+            for minutes in range(20)
+        ]
+        readings.append({'recorded_at': (self.now - timezone.timedelta(minutes=5)).isoformat(), 'rainfall': 3.0})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(json.dumps(readings))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'accepted': 21, 'rejected': []})
+        condition_updates = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE') and 'farm_farmcondition' in query['sql']
+        ]
+        self.assertEqual(len(condition_updates), 1)
+
+        # The readings, plus the one appended when the conditions were first saved
+        self.assertEqual(self.farm.condition_readings.count(), 22)
+        condition = FarmCondition.objects.get(farm=self.farm)
+        self.assertEqual(condition.soil_ph, 6.0)
+        self.assertEqual(condition.rainfall, 3.0)
+        self.assertEqual(condition.updated_at, self.now)
+        # Bumped through a queryset write, without appending the readings twice
+        self.crop.refresh_from_db()
+        self.assertGreaterEqual(self.crop.inputs_updated_at, self.now)
+
+    def test_older_readings_do_not_overwrite_newer_conditions(self):
+        FarmCondition.objects.create(farm=self.farm, soil_ph=7.0)
+        old = (timezone.now() - timezone.timedelta(hours=2)).isoformat()
+        self.post(json.dumps([{'recorded_at': old, 'soil_ph': 5.5}]))
+        self.assertEqual(FarmCondition.objects.get(farm=self.farm).soil_ph, 7.0)
+        self.assertEqual(self.farm.condition_readings.filter(soil_ph=5.5).count(), 1)
+
+    def test_missing_conditions_are_created(self):
+        response = self.post("conditions soil_ph=6.1", content_type='text/plain')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(FarmCondition.objects.get(farm=self.farm).soil_ph, 6.1)
+
+    def test_failed_write_is_refused_and_stores_nothing(self):
+        # Fails after the readings were inserted, inside the same transaction
+        with patch('farm.sensors.bump_crop_inputs', side_effect=DatabaseError("database is down")):
+            response = self.post("conditions soil_ph=6.1", content_type='text/plain')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(FarmConditionReading.objects.exists())
+        self.assertFalse(FarmCondition.objects.filter(farm=self.farm).exists())
+
+        # The gateway's retry is stored
+        response = self.post("conditions soil_ph=6.1", content_type='text/plain')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(FarmConditionReading.objects.count(), 1)
+
+    def test_requires_valid_token(self):
+        response = self.post("conditions soil_ph=6.1", content_type='text/plain', token='wrong')
+        self.assertEqual(response.status_code, 401)
+
+        self.sensor_token.is_active = False
+        self.sensor_token.save()
+        response = self.post("conditions soil_ph=6.1", content_type='text/plain')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+    def test_malformed_payload_is_rejected(self):
+        response = self.post("[1, 2", content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.post("conditions soil_ph=6.1", content_type='text/plain', precision='minutes')
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_sensor_token_command(self):
+        out = StringIO()
+        call_command('create_sensor_token', str(self.farm.farm_id), '--name', 'East gateway', stdout=out)
+        token = out.getvalue().strip().splitlines()[-1]
+        self.assertEqual(SensorToken.authenticate(token).name, 'East gateway')
+
+
+class CropTypeResolverTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='croptypefarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Crop Type Farm", location="Here", size=20.0)
+        self.field = Field.objects.create(farm=self.farm, name="Field", size=5.0)
+
+    def test_resolves_english_and_indonesian_names(self):
+        cases = {
+            'Rice': 'rice',
+            'Padi Ciherang': 'rice',
+            'Sweetcorn': 'corn',
+            'jagung manis': 'corn',
+            'Kacang  Tanah': 'peanut',
+            'kacang-tanah': 'peanut',
+            'Sugar cane': 'sugarcane',
+            'Cabe rawit': 'chili',
+            'Cabbage': 'cabbage',
+            'Ubi Kayu': 'cassava',
+            'Tomat': 'tomato',
+            'Brokoli': None,
+            'Durian': None,
+            '': None,
+        }
+        for crop_type, expected in cases.items():
+            self.assertEqual(crop_types.resolve(crop_type), expected, crop_type)
+
+    def test_local_names_only_match_whole_words(self):
+        self.assertIsNone(crop_types.resolve('Kolrabi'))
+        self.assertEqual(crop_types.resolve('Kol bunga'), 'cabbage')
+
+    def test_memo_is_bounded(self):
+        self.assertIsNotNone(crop_types.resolve.cache_info().maxsize)
+        crop_types.resolve('Padi Inpari')
+        hits = crop_types.resolve.cache_info().hits
+        crop_types.resolve('Padi Inpari')
+        self.assertEqual(crop_types.resolve.cache_info().hits, hits + 1)
+
+    def test_crop_key_is_persisted_on_save(self):
+        crop = Crop.objects.create(field=self.field, crop_type="Padi", planting_date=timezone.now().date())
+        self.assertEqual(Crop.objects.get(pk=crop.pk).crop_key, 'rice')
+
+        crop.crop_type = "Durian"
+        crop.save(update_fields=['crop_type'])
+        self.assertEqual(Crop.objects.get(pk=crop.pk).crop_key, '')
+        self.assertEqual(Crop.objects.filter(crop_key='rice').count(), 0)
+
+    def test_indonesian_names_get_their_growing_period(self):
+        planting_date = timezone.now().date()
+        padi = Crop.objects.create(field=self.field, crop_type="Padi", planting_date=planting_date)
+        rice = Crop.objects.create(field=self.field, crop_type="Rice", planting_date=planting_date)
+        self.assertEqual(
+            HarvestPredictionSystem.predict_harvest_date(padi),
+            HarvestPredictionSystem.predict_harvest_date(rice)
+        )
+        self.assertEqual(
+            HarvestPredictionSystem.get_confidence_level(padi),
+            HarvestPredictionSystem.get_confidence_level(rice)
+        )
+        batch = {row['crop'].pk: row['predicted_date'] for row in HarvestPredictionSystem.predict_batch(Crop.objects.all())}
+        self.assertEqual(batch[padi.pk], HarvestPredictionSystem.predict_harvest_date(padi))
+
+    def test_normalize_crop_types_command(self):
+        crop = Crop.objects.create(field=self.field, crop_type="Jagung", planting_date=timezone.now().date())
+        Crop.objects.filter(pk=crop.pk).update(crop_key='')
+
+        out = StringIO()
+        call_command('normalize_crop_types', stdout=out)
+        self.assertIn("Updated the crop key of 1 crops", out.getvalue())
+        crop.refresh_from_db()
+        self.assertEqual(crop.crop_key, 'corn')
+
+
+class ScenarioSweepTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='sweepfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Sweep Farm", location="Here", size=50.0)
+        self.condition = FarmCondition.objects.create(
+            farm=self.farm, soil_ph=6.5, soil_moisture=55.0, rainfall=150.0, max_daily_temp=27.0
+        )
+        self.field = Field.objects.create(farm=self.farm, name="Sweep Field", size=20.0)
+        today = timezone.now().date()
+        self.crops = [
+            Crop.objects.create(field=self.field, crop_type="Padi", planting_date=today - timezone.timedelta(days=40)),
+            Crop.objects.create(field=self.field, crop_type="Corn", planting_date=today - timezone.timedelta(days=10)),
+            Crop.objects.create(field=self.field, crop_type="Durian", planting_date=today - timezone.timedelta(days=5)),
+        ]
+        for crop, amounts in ((self.crops[0], (2.0, 150.0, 1.0)), (self.crops[1], (None, 60.0, None))):
+            log = ActivityLog.objects.create(farm=self.farm, activity_type='maintenance', timestamp=timezone.now())
+            MaintenanceLog.objects.create(
+                activity_log=log, crop=crop,
+                fertilizer_applied=amounts[0], irrigation_amount=amounts[1], pesticide_applied=amounts[2]
+            )
+        CropMaintenanceSummary.rebuild()
+        HarvestPredictionSystem.rules()
+        self.client.login(username='sweepfarmer', password='password')
+        self.url = reverse('farm:farm_harvest_scenarios', kwargs={'farm_id': self.farm.farm_id})
+
+    def _batch_dates(self):
+        predictions = HarvestPredictionSystem.predict_batch(Crop.objects.filter(field__farm=self.farm))
+        return {str(p['crop'].crop_id): p['predicted_date'].isoformat() for p in predictions}
+
+    def test_scenarios_match_predictions_on_changed_inputs(self):
+        scenarios = ScenarioSweep.parse({'scenarios': [
+            {'name': 'hot', 'overrides': {'temperature': {'add': 6}}},
+            {'name': 'wet', 'overrides': {'irrigation': {'multiply': 4}, 'day_length': 15}},
+        ]})
+        result = ScenarioSweep.run(Crop.objects.filter(field__farm=self.farm), scenarios)
+        baseline = self._batch_dates()
+        for crop in result['crops']:
+            self.assertEqual(crop['baseline_date'], baseline[crop['crop_id']])
+
+        FarmCondition.objects.filter(pk=self.condition.pk).update(max_daily_temp=33.0)
+        hot = self._batch_dates()
+        FarmCondition.objects.filter(pk=self.condition.pk).update(max_daily_temp=27.0, day_length=15.0)
+        CropMaintenanceSummary.objects.update(total_irrigation=F('total_irrigation') * 4)
+        wet = self._batch_dates()
+
+        for crop, row in zip(result['crops'], result['predicted_dates']):
+            self.assertEqual(row, [hot[crop['crop_id']], wet[crop['crop_id']]])
+        self.assertNotEqual([row[0] for row in result['predicted_dates']], [c['baseline_date'] for c in result['crops']])
+
+    def test_grid_expands_every_combination(self):
+        scenarios = ScenarioSweep.parse({'grid': {
+            'max_daily_temp': [{'add': 0}, {'add': 2}, {'add': 4}],
+            'irrigation': [{'multiply': 1}, {'multiply': 2}],
+        }})
+        self.assertEqual(len(scenarios), 6)
+        self.assertEqual(scenarios[-1]['name'], 'max_daily_temp+4, total_irrigation*2')
+
+        result = ScenarioSweep.run(Crop.objects.filter(field__farm=self.farm), scenarios)
+        self.assertEqual(len(result['predicted_dates']), len(self.crops))
+        self.assertTrue(all(len(row) == 6 for row in result['predicted_dates']))
+        # The first combination changes nothing
+        self.assertTrue(all(row[0] == 0 for row in result['shift_days']))
+
+    def test_unrecorded_readings_stay_unrecorded_unless_set(self):
+        # day_length is not recorded: shifting it changes nothing, setting it does
+        scenarios = ScenarioSweep.parse({'scenarios': [
+            {'overrides': {'day_length': {'add': 5}}},
+            {'overrides': {'day_length': 17}},
+        ]})
+        result = ScenarioSweep.run(Crop.objects.filter(field__farm=self.farm), scenarios)
+        for row in result['shift_days']:
+            self.assertEqual(row, [0, 3])
+
+    def test_invalid_scenarios_are_rejected(self):
+        for payload in (
+            [],
+            {},
+            {'scenarios': [{'overrides': {'wind': 3}}]},
+            {'scenarios': [{'overrides': {'soil_ph': {'divide': 2}}}]},
+            {'scenarios': [{'overrides': {'soil_ph': 'acid'}}]},
+            {'grid': {'soil_ph': []}},
+        ):
+            with self.assertRaises(ScenarioError):
+                ScenarioSweep.parse(payload)
+
+    @override_settings(SCENARIO_SWEEP_MAX_SCENARIOS=10)
+    def test_oversized_grid_is_rejected_before_expanding(self):
+        with self.assertRaises(ScenarioError):
+            ScenarioSweep.parse({'grid': {'soil_ph': list(range(4)), 'rainfall': list(range(4))}})
+
+    def test_sweep_runs_in_constant_queries(self):
+        scenarios = ScenarioSweep.parse({'grid': {'max_daily_temp': [{'add': step} for step in range(50)]}})
+        with self.assertNumQueries(2):
+            ScenarioSweep.run(Crop.objects.filter(field__farm=self.farm), scenarios)
+
+    def test_scenario_view(self):
+        response = self.client.post(
+            self.url,
+            data=json.dumps({'crops': [str(self.crops[0].crop_id)], 'grid': {'temperature': [{'add': 2}]}}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([crop['crop_id'] for crop in data['crops']], [str(self.crops[0].crop_id)])
+        self.assertEqual(data['scenarios'], [{'name': 'max_daily_temp+2', 'overrides': {'max_daily_temp': {'add': 2}}}])
+        self.assertEqual(len(data['predicted_dates'][0]), 1)
+
+        response = self.client.post(self.url, data='{"grid": 3}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+    def test_scenario_view_is_limited_to_own_farms(self):
+        other_user = User.objects.create_user(username='othersweep', password='password')
+        Farmer.objects.create(user=other_user)
+        self.client.login(username='othersweep', password='password')
+        response = self.client.post(self.url, data='{"grid": {"soil_ph": [6]}}', content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+class HarvestBacktestTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='backtestfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Backtest Farm", location="Here", size=50.0)
+        self.field = Field.objects.create(farm=self.farm, name="Backtest Field", size=20.0)
+        self.addCleanup(active_rules.reset)
+        active_rules.reset()
+
+    def harvested(self, crop_type, planted, days):
+        return Crop.objects.create(
+            field=self.field, crop_type=crop_type, planting_date=planted,
+            is_harvested=True, harvest_date=planted + datetime.timedelta(days=days)
+        )
+
+    def maintain(self, crop, day, **amounts):
+        timestamp = timezone.datetime.combine(day, datetime.time(9), tzinfo=datetime.timezone.utc)
+        log = ActivityLog.objects.create(farm=self.farm, activity_type='maintenance', timestamp=timestamp)
+        return MaintenanceLog.objects.create(activity_log=log, crop=crop, **amounts)
+
+    def test_replay_reads_inputs_as_of_harvest(self):
+        planted = datetime.date(2025, 1, 1)
+        crop = self.harvested("Jagung", planted, 80)
+        self.maintain(crop, planted + datetime.timedelta(days=10), fertilizer_applied=4.0, irrigation_amount=50.0)
+        self.maintain(crop, planted + datetime.timedelta(days=80), fertilizer_applied=8.0)
+        # Logged after the harvest, so the replayed prediction could not have known it
+        self.maintain(crop, planted + datetime.timedelta(days=81), pesticide_applied=9.0)
+
+        season = timezone.datetime(2025, 2, 1, tzinfo=datetime.timezone.utc)
+        FarmConditionReading.objects.create(farm=self.farm, recorded_at=season, soil_ph=6.0, max_daily_temp=26.0)
+        FarmConditionReading.objects.create(farm=self.farm, recorded_at=season, soil_ph=7.0)
+        FarmConditionRollup.objects.create(
+            farm=self.farm, resolution=FarmConditionRollup.RESOLUTION_DAY, period_start=season - datetime.timedelta(days=3),
+            sample_count=2, stats={'soil_ph': [2, 10.0, 4.0, 6.0]}
+        )
+        # Outside the season
+        FarmConditionReading.objects.create(farm=self.farm, recorded_at=season + datetime.timedelta(days=200), rainfall=500.0)
+
+        columns = HarvestBacktest.replay(Crop.objects.filter(pk=crop.pk))
+        self.assertEqual(columns['actual_days'].tolist(), [80.0])
+        self.assertEqual(columns['maintenance_count'].tolist(), [2.0])
+        self.assertEqual(columns['total_fertilizer'].tolist(), [12.0])
+        self.assertEqual(columns['total_pesticide'].tolist(), [0.0])
+        self.assertEqual(columns['soil_ph'].tolist(), [23.0 / 4])
+        self.assertEqual(columns['max_daily_temp'].tolist(), [26.0])
+        self.assertTrue(np.isnan(columns['rainfall'][0]))
+
+    def test_backtest_matches_engine_scoring(self):
+        planted = datetime.date(2025, 3, 1)
+        crops = [
+            self.harvested("Padi", planted, 110),
+            self.harvested("Jagung", planted, 95),
+            self.harvested("Durian", planted, 140),
+            self.harvested("Tomat", planted, 70),
+        ]
+        for i, crop in enumerate(crops[:3]):
+            for day in range(0, 60, 10 + i * 10):
+                self.maintain(
+                    crop, planted + datetime.timedelta(days=day),
+                    fertilizer_applied=3.0 * (i + 1), irrigation_amount=120.0 * i, pesticide_applied=float(i)
+                )
+        FarmConditionReading.objects.create(
+            farm=self.farm, recorded_at=timezone.datetime(2025, 4, 1, tzinfo=datetime.timezone.utc),
+            soil_ph=6.4, soil_moisture=55.0, rainfall=150.0, max_daily_temp=29.0, day_length=12.0
+        )
+
+        queryset = Crop.objects.filter(pk__in=[crop.pk for crop in crops])
+        columns = HarvestBacktest.replay(queryset)
+        expected = (
+            np.array([HarvestPredictionSystem._base_growing_period(key or None) for key in np.array(GROWING_PERIOD_KEYS)[columns['key_index']]])
+            + prediction_rules.maintenance_effect(
+                columns['maintenance_count'], columns['total_fertilizer'], columns['total_irrigation'],
+                columns['total_pesticide'], columns['days_since_planting']
+            )
+            + prediction_rules.environment_effect(
+                columns['temperature_profile'],
+                *(columns[metric] for metric in HarvestPredictionSystem.CONDITION_COLUMNS)
+            )
+        )
+        layout = ParameterLayout(prediction_rules.DEFAULT_RULES)
+        self.assertEqual(layout.predict(layout.slots(columns), layout.values).tolist(), expected.tolist())
+
+        report = HarvestBacktest.run(queryset)
+        self.assertEqual(report['samples'], 4)
+        self.assertIsNone(report['rules_version'])
+        self.assertEqual(report['errors']['all']['count'], 4)
+        self.assertEqual(set(report['errors']), {'all', 'rice', 'corn', 'tomato', 'other'})
+        errors = expected - columns['actual_days']
+        self.assertAlmostEqual(report['errors']['all']['bias'], round(float(errors.mean()), 2))
+
+    @override_settings(PREDICTION_BACKTEST_CHUNK_SIZE=1)
+    def test_calibration_fits_stores_and_activates_parameters(self):
+        other_farm = Farm.objects.create(farmer=self.farmer, name="Second Farm", location="There", size=5.0)
+        other_field = Field.objects.create(farm=other_farm, name="Second Field", size=5.0)
+        planted = datetime.date(2025, 1, 1)
+        # Corn here ripens in 60 days, far sooner than the built-in rules expect
+        for i in range(30):
+            self.harvested("Jagung", planted + datetime.timedelta(days=i), 60)
+            Crop.objects.create(
+                field=other_field, crop_type="Corn", planting_date=planted + datetime.timedelta(days=i),
+                is_harvested=True, harvest_date=planted + datetime.timedelta(days=i + 60)
+            )
+
+        parameter_set, report = HarvestBacktest.calibrate(regularization=1.0, activate=True)
+        self.assertEqual(report['samples'], 60)
+        self.assertEqual(parameter_set.version, 1)
+        self.assertTrue(parameter_set.is_active)
+        self.assertLess(report['fitted_errors']['corn']['mae'], report['errors']['corn']['mae'])
+        self.assertLessEqual(report['fitted_errors']['corn']['mae'], 1)
+        self.assertEqual(parameter_set.metrics['samples'], 60)
+
+        active_rules.reset()
+        rules = HarvestPredictionSystem.rules()
+        self.assertEqual(rules.version, 1)
+        crop = Crop.objects.create(field=self.field, crop_type="Corn", planting_date=timezone.now().date())
+        self.assertEqual(
+            HarvestPredictionSystem.predict_harvest_date(crop),
+            HarvestPredictionSystem.predict_batch(Crop.objects.filter(pk=crop.pk))[0]['predicted_date']
+        )
+        self.assertNotEqual(
+            HarvestPredictionSystem._base_growing_period('corn', rules),
+            HarvestPredictionSystem.BASE_GROWING_PERIODS['corn']
+        )
+
+        second, _ = HarvestBacktest.calibrate(regularization=1.0, activate=True)
+        self.assertEqual(second.version, 2)
+        self.assertEqual(list(PredictionParameterSet.objects.filter(is_active=True)), [second])
+        self.assertEqual(second.metrics['fitted_from'], 1)
+
+    def test_create_version_retries_a_version_taken_concurrently(self):
+        PredictionParameterSet.create_version({'scale': {}})
+        first = QuerySet.first
+        reads = []
+
+        def stale_first(queryset):
+            # The first read misses the set another run has just stored
+            reads.append(queryset)
+            return None if len(reads) == 1 else first(queryset)
+
+        with patch('django.db.models.QuerySet.first', stale_first):
+            parameter_set = PredictionParameterSet.create_version({'scale': {}})
+        self.assertEqual(len(reads), 2)
+        self.assertEqual(parameter_set.version, 2)
+        self.assertEqual(list(PredictionParameterSet.objects.values_list('version', flat=True)), [2, 1])
+
+    def test_command_reports_errors(self):
+        self.harvested("Padi", datetime.date(2025, 1, 1), 120)
+        out = StringIO()
+        call_command('backtest_harvest_predictions', stdout=out)
+        self.assertIn("Backtested 1 harvested crops against the built-in rules", out.getvalue())
+        self.assertIn("rice", out.getvalue())
+        self.assertFalse(PredictionParameterSet.objects.exists())
+
+        call_command('backtest_harvest_predictions', '--fit', stdout=out)
+        self.assertIn("Stored prediction parameters v1 (inactive)", out.getvalue())
+        self.assertFalse(PredictionParameterSet.objects.get().is_active)
+
+class DashboardCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        dashboard_cache.reset_stats()
+        self.user = User.objects.create_user(username='dashfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Dash Farm", location="Here", size=20.0)
+        self.field = Field.objects.create(farm=self.farm, name="Dash Field", size=5.0)
+        self.crop = Crop.objects.create(
+            field=self.field, crop_type="Padi", planting_date=timezone.now().date(),
+            predicted_harvest_date=timezone.now().date() + timezone.timedelta(days=10)
+        )
+        ActivityLog.objects.create(farm=self.farm, activity_type='maintenance', timestamp=timezone.now())
+
+    def test_summary_is_served_from_one_cache_read(self):
+        summary = dashboard_cache.get_summary(self.farmer)
+        self.assertEqual(summary['farm_count'], 1)
+        self.assertEqual(summary['total_crops'], 1)
+        self.assertEqual(len(summary['recent_activities']), 1)
+        self.assertEqual(summary['upcoming_harvests'], [self.crop])
+
+        with self.assertNumQueries(0):
+            cached = dashboard_cache.get_summary(self.farmer)
+            self.assertEqual(cached['recent_activities'][0].farm.name, "Dash Farm")
+        self.assertEqual(dashboard_cache.stats()['hits'], 1)
+        self.assertEqual(dashboard_cache.stats()['misses'], 1)
+
+    def test_writes_invalidate_the_farmers_summary(self):
+        dashboard_cache.get_summary(self.farmer)
+        Crop.objects.create(field=self.field, crop_type="Corn", planting_date=timezone.now().date())
+        self.assertEqual(dashboard_cache.get_summary(self.farmer)['total_crops'], 2)
+
+        activity = ActivityLog.objects.create(farm=self.farm, activity_type='preparation', timestamp=timezone.now())
+        self.assertEqual(dashboard_cache.get_summary(self.farmer)['recent_activities'][0], activity)
+
+        ActivityLog.objects.get(pk=activity.pk).delete()
+        self.assertEqual(len(dashboard_cache.get_summary(self.farmer)['recent_activities']), 1)
+
+        self.farm.name = "Renamed Farm"
+        self.farm.save()
+        self.assertEqual(dashboard_cache.get_summary(self.farmer)['farms'][0].name, "Renamed Farm")
+        self.assertEqual(dashboard_cache.stats()['hits'], 0)
+
+    def test_other_farmers_summaries_are_kept(self):
+        other_user = User.objects.create_user(username='otherdash', password='password')
+        other_farmer = Farmer.objects.create(user=other_user)
+        dashboard_cache.get_summary(other_farmer)
+        ActivityLog.objects.create(farm=self.farm, activity_type='preparation', timestamp=timezone.now())
+        with self.assertNumQueries(0):
+            dashboard_cache.get_summary(other_farmer)
+
+    def test_deploy_check_requires_a_shared_cache(self):
+        local = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        with override_settings(CACHES={'default': local}):
+            self.assertEqual([warning.id for warning in check_dashboard_cache(None)], ['farm.W001'])
+
+        shared = {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'dashboard_cache'}
+        with override_settings(CACHES={'default': local, 'shared': shared}, DASHBOARD_CACHE_ALIAS='shared'):
+            self.assertEqual(check_dashboard_cache(None), [])
+
+    @override_settings(DASHBOARD_CACHE_VERIFY_RATE=1)
+    def test_verified_hits_count_stale_summaries(self):
+        dashboard_cache.get_summary(self.farmer)
+        dashboard_cache.get_summary(self.farmer)
+        self.assertEqual(dashboard_cache.stats()['stale'], 0)
+
+        # Queryset updates bypass the invalidation signals
+        Farm.objects.filter(pk=self.farm.pk).update(name="Quietly Renamed")
+        with self.assertLogs('farm.dashboard', level='WARNING'):
+            summary = dashboard_cache.get_summary(self.farmer)
+        self.assertEqual(summary['farms'][0].name, "Quietly Renamed")
+        self.assertEqual(dashboard_cache.stats()['verified'], 2)
+        self.assertEqual(dashboard_cache.stats()['stale_rate'], 0.5)
+
+        # The fresh summary replaced the stale entry
+        with override_settings(DASHBOARD_CACHE_VERIFY_RATE=0):
+            self.assertEqual(dashboard_cache.get_summary(self.farmer)['farms'][0].name, "Quietly Renamed")
+
+    def test_dashboard_lists_upcoming_harvests(self):
+        self.client.login(username='dashfarmer', password='password')
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, "Upcoming Harvests")
+        self.assertEqual(list(response.context['upcoming_harvests']), [self.crop])
+        self.assertContains(response, "Dash Field")
+
+
+class ActivityFormCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='formfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Form Farm", location="Here", size=20.0)
+        self.field = Field.objects.create(farm=self.farm, name="Form Field", size=5.0)
+        self.crop = Crop.objects.create(field=self.field, crop_type="Padi", planting_date=timezone.now().date())
+        self.url = reverse('farm:get_specialized_form', args=[self.farm.farm_id])
+        self.client.login(username='formfarmer', password='password')
+
+    def test_partials_are_rendered_once(self):
+        first = self.client.get(self.url, {'activity_type': 'maintenance'})
+        self.assertIn("Padi at Form Field", first.json()['html'])
+        self.assertTrue(first.has_header('ETag'))
+        self.assertIn('no-cache', first['Cache-Control'])
+
+        with patch.object(activity_form_cache, 'render', wraps=activity_form_cache.render) as render:
+            second = self.client.get(self.url, {'activity_type': 'maintenance'})
+            render.assert_not_called()
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_cached_partials_hold_no_csrf_token(self):
+        response = self.client.get(self.url, {'activity_type': 'planting'})
+        self.assertNotIn('csrfmiddlewaretoken', response.json()['html'])
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.client.get(self.url, {'activity_type': 'planting'})['ETag']
+        response = self.client.get(self.url, {'activity_type': 'planting'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        # Each activity type has its own ETag
+        other = self.client.get(self.url, {'activity_type': 'preparation'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other['ETag'], etag)
+
+    def test_field_and_crop_changes_invalidate_the_farms_partials(self):
+        etag = self.client.get(self.url, {'activity_type': 'preparation'})['ETag']
+        Field.objects.create(farm=self.farm, name="New Field", size=2.0)
+        response = self.client.get(self.url, {'activity_type': 'preparation'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("New Field", response.json()['html'])
+
+        self.client.get(self.url, {'activity_type': 'harvesting'})
+        self.crop.mark_as_harvested()
+        response = self.client.get(self.url, {'activity_type': 'harvesting'})
+        self.assertNotIn("Padi at Form Field", response.json()['html'])
+
+        # Crops are listed with the name of their farm
+        self.client.get(self.url, {'activity_type': 'maintenance'})
+        Crop.objects.create(field=self.field, crop_type="Jagung", planting_date=timezone.now().date())
+        self.farm.name = "Renamed Farm"
+        self.farm.save()
+        self.assertIn("(Renamed Farm)", self.client.get(self.url, {'activity_type': 'maintenance'}).json()['html'])
+
+    def test_other_farms_keep_their_partials(self):
+        other_farm = Farm.objects.create(farmer=self.farmer, name="Other Farm", location="There", size=5.0)
+        other_url = reverse('farm:get_specialized_form', args=[other_farm.farm_id])
+        etag = self.client.get(other_url, {'activity_type': 'preparation'})['ETag']
+        Field.objects.create(farm=self.farm, name="New Field", size=2.0)
+        self.assertEqual(self.client.get(other_url, {'activity_type': 'preparation'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_new_release_or_templates_invalidate_the_partials(self):
+        etag = self.client.get(self.url, {'activity_type': 'planting'})['ETag']
+        with override_settings(ACTIVITY_FORM_CACHE_VERSION='next-release'):
+            with patch.object(activity_form_cache, 'render', wraps=activity_form_cache.render) as render:
+                response = self.client.get(self.url, {'activity_type': 'planting'}, HTTP_IF_NONE_MATCH=etag)
+                render.assert_called_once()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Edited templates are picked up by the next process
+        with patch.object(activity_form_cache, '_templates_digest', 'edited'):
+            response = self.client.get(self.url, {'activity_type': 'planting'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url, {'activity_type': 'planting'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_versions_are_read_from_the_database(self):
+        etag = self.client.get(self.url, {'activity_type': 'maintenance'})['ETag']
+        # What an import in another process leaves behind: rows and a bumped crop list, no cache writes
+        Crop.objects.bulk_create([Crop(field=self.field, crop_type="Jagung", planting_date=timezone.now().date())])
+        FarmCropVersion.bump(self.farm.pk)
+
+        response = self.client.get(self.url, {'activity_type': 'maintenance'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Jagung at Form Field", response.json()['html'])
+
+    def test_imported_crops_invalidate_the_partials(self):
+        self.client.get(self.url, {'activity_type': 'maintenance'})
+        ActivityImporter(self.farm).import_rows([{
+            'activity_type': 'planting', 'timestamp': timezone.now().strftime('%Y-%m-%d %H:%M'),
+            'field': str(self.field.pk), 'crop_type': 'Jagung', 'seed_variety': 'Hybrid',
+            'seed_quantity': '5', 'fertilizer_applied': '1',
+        }])
+        self.assertIn("Jagung at Form Field", self.client.get(self.url, {'activity_type': 'maintenance'}).json()['html'])
+
+
+class ActiveCropsVersionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cropsfarmer', password='password')
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.farm = Farm.objects.create(farmer=self.farmer, name="Crops Farm", location="Here", size=20.0)
+        self.field = Field.objects.create(farm=self.farm, name="North", size=5.0)
+        self.crop = Crop.objects.create(field=self.field, crop_type="Padi", planting_date=timezone.now().date())
+        self.url = reverse('farm:get_active_crops', args=[self.farm.farm_id])
+        self.client.login(username='cropsfarmer', password='password')
+
+    def _get(self, **params):
+        headers = {}
+        if 'etag' in params:
+            headers['HTTP_IF_NONE_MATCH'] = params.pop('etag')
+        return self.client.get(self.url, params, **headers)
+
+    def test_full_list_is_one_joined_query(self):
+        for number in range(3):
+            Crop.objects.create(field=self.field, crop_type=f"Crop {number}", planting_date=timezone.now().date())
+        # Session, user and farmer lookups, the farm with its version, and the crops
+        with self.assertNumQueries(5):
+            response = self._get()
+        data = response.json()
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['crops']), 4)
+        self.assertIn({'id': str(self.crop.crop_id), 'name': "Padi - North"}, data['crops'])
+        self.assertNotIn(b', ', response.content)
+
+    def test_matching_etag_is_not_modified(self):
+        response = self._get()
+        etag = response['ETag']
+        self.assertEqual(self._get(etag=etag).status_code, 304)
+
+        Crop.objects.create(field=self.field, crop_type="Jagung", planting_date=timezone.now().date())
+        response = self._get(etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_incremental_response_holds_changed_crops(self):
+        version = self._get().json()['version']
+        new_crop = Crop.objects.create(field=self.field, crop_type="Jagung", planting_date=timezone.now().date())
+        self.crop.mark_as_harvested()
+
+        data = self._get(since=version).json()
+        self.assertFalse(data['full'])
+        self.assertEqual(data['crops'], [{'id': str(new_crop.crop_id), 'name': "Jagung - North"}])
+        self.assertEqual(data['removed'], [str(self.crop.crop_id)])
+
+        # Nothing changed since the latest version
+        data = self._get(since=data['version']).json()
+        self.assertEqual((data['crops'], data['removed']), ([], []))
+
+    def test_field_rename_restamps_its_crops(self):
+        version = self._get().json()['version']
+        self.field.name = "South"
+        self.field.save()
+        self.assertEqual(self._get(since=version).json()['crops'], [{'id': str(self.crop.crop_id), 'name': "Padi - South"}])
+
+    def test_deletions_and_unknown_versions_get_the_full_list(self):
+        other = Crop.objects.create(field=self.field, crop_type="Jagung", planting_date=timezone.now().date())
+        version = self._get().json()['version']
+        other.delete()
+        data = self._get(since=version).json()
+        self.assertTrue(data['full'])
+        self.assertEqual([crop['id'] for crop in data['crops']], [str(self.crop.crop_id)])
+
+        self.assertTrue(self._get(since=data['version'] + 10).json()['full'])
+        self.assertEqual(self._get(since='latest').status_code, 400)
+
+    def test_imported_crops_are_stamped(self):
+        version = self._get().json()['version']
+        ActivityImporter(self.farm).import_rows([{
+            'activity_type': 'planting', 'timestamp': timezone.now().strftime('%Y-%m-%d %H:%M'),
+            'field': str(self.field.pk), 'crop_type': 'Jagung', 'seed_variety': 'Hybrid',
+            'seed_quantity': '5', 'fertilizer_applied': '1',
+        }])
+        self.assertEqual([crop['name'] for crop in self._get(since=version).json()['crops']], ["Jagung - North"])
+
+    def test_deleting_the_farm_leaves_no_counter(self):
+        self._get()
+        self.farm.delete()
+        self.assertFalse(FarmCropVersion.objects.exists())
@@ -6,6 +6,9 @@ app_name = 'farm'
 urlpatterns = [
     path('farms/', views.farm_list, name='farm_list'),
     path('farms/create/', views.farm_create, name='farm_create'),
+    path('farms/export-portfolio/', views.export_portfolio, name='export_portfolio'),
+    path('farms/export-portfolio/<uuid:job_id>/', views.portfolio_status, name='portfolio_status'),
+    path('farms/export-portfolio/<uuid:job_id>/download/', views.portfolio_download, name='portfolio_download'),
     path('farms/<uuid:farm_id>/', views.farm_detail, name='farm_detail'),
     path('farms/<uuid:farm_id>/update/', views.farm_update, name='farm_update'),
     path('farms/<uuid:farm_id>/delete/', views.farm_delete, name='farm_delete'),
@@ -21,6 +24,7 @@ urlpatterns = [
     
     path('farms/<uuid:farm_id>/activities/', views.activity_log_list, name='activity_log_list'),
     path('farms/<uuid:farm_id>/activities/create/', views.activity_log_create, name='activity_log_create'),
+    path('farms/<uuid:farm_id>/activities/import/', views.activity_log_import, name='activity_log_import'),
     path('farms/<uuid:farm_id>/activities/<uuid:log_id>/', views.activity_log_detail, name='activity_log_detail'),
     path('farms/<uuid:farm_id>/activities/<uuid:log_id>/update/', views.activity_log_update, name='activity_log_update'),
     path('farms/<uuid:farm_id>/activities/<uuid:log_id>/delete/', views.activity_log_delete, name='activity_log_delete'),
@@ -29,6 +33,11 @@ urlpatterns = [
     path('farms/<uuid:farm_id>/get-active-crops/', views.get_active_crops, name='get_active_crops'),
 
     path('farms/<uuid:farm_id>/crops/<uuid:crop_id>/predict-harvest/', views.crop_harvest_prediction, name='crop_harvest_prediction'),
+    path('farms/<uuid:farm_id>/predictions/scenarios/', views.farm_harvest_scenarios, name='farm_harvest_scenarios'),
 
     path('farms/<uuid:farm_id>/export-pdf/', views.export_farm_pdf, name='export_farm_pdf'),
+    path('farms/<uuid:farm_id>/reports/<uuid:job_id>/', views.farm_report_status, name='farm_report_status'),
+    path('farms/<uuid:farm_id>/reports/<uuid:job_id>/download/', views.farm_report_download, name='farm_report_download'),
+
+    path('sensors/ingest/', views.sensor_ingest, name='sensor_ingest'),
 ]
\ No newline at end of file
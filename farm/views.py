@@ -1,25 +1,44 @@
-from django.db.models import Count
+import json
+import logging
+import uuid
+
+from django.db.models import Count, Q
 from authentication.models import Farmer
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from authentication.decorators import farmer_required
 from django.contrib import messages
-from django.db import transaction
+from django.db import DatabaseError, transaction
 from django.utils import timezone
 from django.views.generic import ListView
-from django.http import JsonResponse
+from django.http import FileResponse, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
+from farm.activity_import import ActivityImporter, ActivityImportError, parse_activity_file
+from farm.activity_listing import ActivityLogListing
+from farm.analytics import FarmAnalytics
+from farm.form_cache import activity_form_cache
 from farm.harvest_prediction import HarvestPredictionSystem
+from farm.prediction_cache import get_cached_prediction
+from farm.reports import FarmPortfolioExporter, FarmReportExporter
+from farm.scenarios import ScenarioError, ScenarioSweep
+from farm.sensors import SensorPayloadError, parse_sensor_payload, write_readings
 from .models import (
     Farm, FarmCondition, Field, Crop, ActivityLog, 
-    PreparationLog, PlantingLog, MaintenanceLog, HarvestingLog
+    PreparationLog, PlantingLog, MaintenanceLog, HarvestingLog,
+    CropMaintenanceSummary, FarmCropVersion, FarmPortfolioJob, FarmReportJob, SensorToken
 )
 from .forms import (
     FarmForm, FarmConditionForm, FieldForm, CropForm,
     ActivityLogForm, PreparationLogForm, PlantingLogForm, 
-    MaintenanceLogForm, HarvestingLogForm
+    MaintenanceLogForm, HarvestingLogForm, ActivityImportForm, ActivityLogFilterForm
 )
 
+logger = logging.getLogger(__name__)
+
 @login_required
 @farmer_required
 def farm_list(request):
@@ -74,8 +93,10 @@ def farm_detail(request, farm_id):
     except FarmCondition.DoesNotExist:
         farm_condition = None
     
-    # Get fields for this farm
-    fields = farm.fields.all()
+    # Fields with their active crop counts, for the field cards
+    fields = farm.fields.annotate(
+        active_crop_count=Count('crops', filter=Q(crops__is_harvested=False))
+    ).order_by('created_at')
     
     # Get crops for this farm
     crops = Crop.objects.filter(field__farm=farm)
@@ -85,109 +106,8 @@ def farm_detail(request, farm_id):
     # Get recent activities
     recent_activities = farm.activities.order_by('-timestamp')[:5]
     
-    # Analytics: Activity counts by type
-    from django.db.models import Count
-    activity_counts = farm.activities.values('activity_type').annotate(count=Count('activity_type')).order_by('activity_type')
-    
-    # Create a dictionary with all activity types, setting count to 0 for types with no activities
-    activity_types_dict = {activity_type: 0 for activity_type, _ in ActivityLog.ACTIVITY_CHOICES}
-    for item in activity_counts:
-        activity_types_dict[item['activity_type']] = item['count']
-    
-    # Analytics: Crop type distribution
-    crop_type_counts = crops.values('crop_type').annotate(count=Count('crop_type')).order_by('-count')
-    
-    # Analytics: Yields from harvested crops
-    from django.db.models import Sum, Avg
-    harvest_stats = {}
-    if harvested_crops.exists():
-        harvest_logs = HarvestingLog.objects.filter(crop__in=harvested_crops)
-        total_yield = harvest_logs.aggregate(total=Sum('yield_amount'))['total'] or 0
-        avg_yield = harvest_logs.aggregate(avg=Avg('yield_amount'))['avg'] or 0
-        harvest_stats = {
-            'total_yield': total_yield,
-            'avg_yield': avg_yield,
-            'harvest_count': harvested_crops.count()
-        }
-    
-    # Analytics: Field utilization
-    field_stats = {}
-    if fields.exists():
-        total_field_area = fields.aggregate(total=Sum('size'))['total'] or 0
-        if total_field_area > 0:
-            # Calculate percentage of farm area being used for fields
-            field_utilization = (total_field_area / farm.size) * 100 if farm.size > 0 else 0
-            field_stats = {
-                'total_area': total_field_area,
-                'utilization': field_utilization,
-                'count': fields.count()
-            }
-    
-    # Analytics: Most recent activities per field
-    field_latest_activities = []
-    for field in fields:
-        latest_activities = ActivityLog.objects.filter(
-            farm=farm,
-            preparationlog__field=field
-        ).order_by('-timestamp')[:1]
-        
-        if latest_activities.exists():
-            field_latest_activities.append({
-                'field': field,
-                'activity': latest_activities[0]
-            })
-    
-    # Analytics: Activity trends over time (last 6 months)
-    from django.utils import timezone
-    import datetime
-    
-    end_date = timezone.now().date()
-    start_date = end_date - datetime.timedelta(days=180)  # Last 6 months
-    
-    from django.db.models.functions import TruncMonth
-    
-    monthly_activities = farm.activities.filter(
-        timestamp__date__gte=start_date,
-        timestamp__date__lte=end_date
-    ).annotate(
-        month=TruncMonth('timestamp')
-    ).values('month').annotate(
-        count=Count('log_id')
-    ).order_by('month')
-    
-    # Format for chart
-    months = []
-    counts = []
-    for entry in monthly_activities:
-        months.append(entry['month'].strftime('%b %Y'))
-        counts.append(entry['count'])
-    
-    # Analytics: Calculate days since last maintenance for each active crop
-    maintenance_status = []
-    for crop in active_crops:
-        maintenance_logs = MaintenanceLog.objects.filter(crop=crop).order_by('-activity_log__timestamp')
-        if maintenance_logs.exists():
-            last_maintenance = maintenance_logs[0].activity_log.timestamp.date()
-            days_since_maintenance = (timezone.now().date() - last_maintenance).days
-            maintenance_status.append({
-                'crop': crop,
-                'days_since_maintenance': days_since_maintenance,
-                'last_maintenance_date': last_maintenance
-            })
-    
-    # Organize analytics data
-    analytics = {
-        'activity_counts': activity_types_dict,
-        'crop_type_counts': list(crop_type_counts),
-        'harvest_stats': harvest_stats,
-        'field_stats': field_stats,
-        'field_latest_activities': field_latest_activities,
-        'monthly_activity_data': {
-            'months': months,
-            'counts': counts
-        },
-        'maintenance_status': maintenance_status
-    }
+    # Analytics are read from the farm's snapshot, rebuilt when stale
+    analytics = FarmAnalytics.from_snapshot(farm)
     
     return render(request, 'farm_detail.html', {
         'farm': farm,
@@ -195,6 +115,7 @@ def farm_detail(request, farm_id):
         'crops': crops,
         'active_crops': active_crops,
         'harvested_crops': harvested_crops,
+        'fields': fields,
         'recent_activities': recent_activities,
         'analytics': analytics
     })
@@ -404,22 +325,42 @@ def crop_detail(request, farm_id, crop_id):
 @login_required
 @farmer_required
 def activity_log_list(request, farm_id):
-    """View for listing all activity logs for a specific farm"""
+    """View for listing the activity logs of a farm, filtered and keyset paginated"""
     # Get the farm or raise 404
     farm = get_object_or_404(Farm, farm_id=farm_id, farmer=request.user.farmer)
     
-    # Get all activities for this farm, newest first
-    activities = farm.activities.all().order_by('-timestamp')
+    # Invalid filters are reported on the form and left out of the query
+    filter_form = ActivityLogFilterForm(request.GET, farm=farm)
+    filter_form.is_valid()
+    filters = {
+        'activity_type': filter_form.cleaned_data.get('type'),
+        'date_from': filter_form.cleaned_data.get('date_from'),
+        'date_to': filter_form.cleaned_data.get('date_to'),
+        'field': filter_form.cleaned_data.get('field'),
+        'crop': filter_form.cleaned_data.get('crop')
+    }
+    activities = ActivityLogListing.filter(farm.activities.all(), **filters)
+    
+    page = ActivityLogListing.page(
+        activities,
+        after=request.GET.get('after'),
+        before=request.GET.get('before')
+    )
     
-    # Filter by activity type if specified
-    activity_type = request.GET.get('type')
-    if activity_type:
-        activities = activities.filter(activity_type=activity_type)
+    # Page links keep the filters but not the cursor of the current page
+    query = request.GET.copy()
+    query.pop('after', None)
+    query.pop('before', None)
     
     return render(request, 'activity_log_list.html', {
         'farm': farm,
-        'activities': activities,
-        'activity_type': activity_type
+        'activities': page['activities'],
+        'next_cursor': page['next_cursor'],
+        'previous_cursor': page['previous_cursor'],
+        'filter_form': filter_form,
+        'filter_query': query.urlencode(),
+        'is_filtered': any(filters.values()),
+        'activity_type': filters['activity_type']
     })
 
 @login_required
@@ -487,6 +428,7 @@ def activity_log_create(request, farm_id):
                 maintenance_log = specialized_form.save(commit=False)
                 maintenance_log.activity_log = activity
                 maintenance_log.save()
+                CropMaintenanceSummary.add_maintenance(CropMaintenanceSummary.log_values(maintenance_log))
                 
                 crop = specialized_form.cleaned_data['crop']
                 messages.success(request, f"Maintenance activity for {crop.crop_type} logged successfully!")
@@ -520,6 +462,42 @@ def activity_log_create(request, farm_id):
         'has_active_crops': has_active_crops
     })
     
+@login_required
+@farmer_required
+def activity_log_import(request, farm_id):
+    """View for importing activity logs in bulk from a CSV or JSON file"""
+    farm = get_object_or_404(Farm, farm_id=farm_id, farmer=request.user.farmer)
+    result = None
+    
+    if request.method == 'POST':
+        form = ActivityImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                rows = parse_activity_file(form.cleaned_data['file'], form.cleaned_data['file_format'])
+            except ActivityImportError as e:
+                form.add_error('file', str(e))
+            else:
+                result = ActivityImporter(farm).import_rows(rows)
+        
+        if request.GET.get('format') == 'json':
+            if result is None:
+                return JsonResponse({'errors': form.errors}, status=400)
+            return JsonResponse(result)
+        
+        if result is not None:
+            if result['created']:
+                messages.success(request, f"Imported {result['created']} of {result['rows']} activities.")
+            if result['errors']:
+                messages.warning(request, f"{len(result['errors'])} rows could not be imported.")
+    else:
+        form = ActivityImportForm()
+    
+    return render(request, 'activity_log_import.html', {
+        'farm': farm,
+        'form': form,
+        'result': result
+    })
+
 @login_required
 @farmer_required
 def activity_log_detail(request, farm_id, log_id):
@@ -574,6 +552,7 @@ def activity_log_update(request, farm_id, log_id):
     # Get the specialized log instance if it exists
     specialized_log = None
     specialized_form = None
+    previous_maintenance = None
     
     if activity.activity_type == 'preparation':
         try:
@@ -607,6 +586,8 @@ def activity_log_update(request, farm_id, log_id):
         try:
             specialized_log = activity.maintenancelog
             specialized_form = MaintenanceLogForm(instance=specialized_log, farm=farm)
+            # Remember the current values, binding the POST data overwrites them
+            previous_maintenance = CropMaintenanceSummary.log_values(specialized_log)
         except MaintenanceLog.DoesNotExist:
             pass
     elif activity.activity_type == 'harvesting':
@@ -658,6 +639,11 @@ def activity_log_update(request, farm_id, log_id):
                             seed_variety=specialized_log.seed_variety,
                             planting_activity=specialized_log
                         )
+                
+                # Move the old maintenance values out of the summary and the new ones in
+                if activity.activity_type == 'maintenance' and previous_maintenance:
+                    CropMaintenanceSummary.remove_maintenance(previous_maintenance)
+                    CropMaintenanceSummary.add_maintenance(CropMaintenanceSummary.log_values(specialized_log))
             
             messages.success(request, "Activity log updated successfully!")
             return redirect('farm:activity_log_detail', farm_id=farm.farm_id, log_id=activity.log_id)
@@ -688,6 +674,7 @@ def activity_log_update(request, farm_id, log_id):
     
 @login_required
 @farmer_required
+@transaction.atomic
 def activity_log_delete(request, farm_id, log_id):
     """View for deleting an activity log"""
     # Get the farm or raise 404
@@ -715,6 +702,13 @@ def activity_log_delete(request, farm_id, log_id):
                 # If there's no plantinglog or associated crop, just continue
                 pass
                 
+        elif activity_type == 'maintenance':
+            # Take this maintenance out of the crop's maintenance summary
+            try:
+                CropMaintenanceSummary.remove_maintenance(CropMaintenanceSummary.log_values(activity.maintenancelog))
+            except MaintenanceLog.DoesNotExist:
+                pass
+        
         elif activity_type == 'harvesting':
             # If this is a harvesting activity, we need to un-mark the crop as harvested
             try:
@@ -742,47 +736,105 @@ def activity_log_delete(request, farm_id, log_id):
 @farmer_required
 def get_specialized_form(request, farm_id):
     """AJAX view to get the specialized form based on activity type"""
-    farm = get_object_or_404(Farm, farm_id=farm_id, farmer=request.user.farmer)
+    farm = get_object_or_404(
+        Farm.objects.select_related('crop_version'), farm_id=farm_id, farmer=request.user.farmer
+    )
     activity_type = request.GET.get('activity_type')
     
     if not activity_type:
         return JsonResponse({'error': 'Activity type is required'}, status=400)
     
-    # Render the appropriate form template
-    if activity_type == 'preparation':
-        form = PreparationLogForm(farm=farm)
-        template = 'partials/preparation_form.html'
-    elif activity_type == 'planting':
-        form = PlantingLogForm(farm=farm)
-        template = 'partials/planting_form.html'
-    elif activity_type == 'maintenance':
-        form = MaintenanceLogForm(farm=farm)
-        template = 'partials/maintenance_form.html'
-    elif activity_type == 'harvesting':
-        form = HarvestingLogForm(farm=farm)
-        template = 'partials/harvesting_form.html'
-    else:
-        return JsonResponse({'html': ''})  # No specialized form for this type
-    
-    html = render(request, template, {'form': form, 'farm': farm}).content.decode('utf-8')
-    return JsonResponse({'html': html})
+    # Partials are cached per farm and type; the ETag is known before rendering
+    version = activity_form_cache.version(farm)
+    etag = activity_form_cache.etag(farm, activity_type, version)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        html = activity_form_cache.get_html(farm, activity_type, version)
+        response = JsonResponse({'html': html or ''})  # No specialized form for unknown types
+    
+    # Browsers revalidate with If-None-Match instead of refetching the partial
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 @login_required
 @farmer_required
 def get_active_crops(request, farm_id):
     """AJAX view to get active crops for a farm"""
-    farm = get_object_or_404(Farm, farm_id=farm_id, farmer=request.user.farmer)
+    farm = get_object_or_404(
+        Farm.objects.select_related('crop_version'), farm_id=farm_id, farmer=request.user.farmer
+    )
     field_id = request.GET.get('field_id')
+    version, removed_version = FarmCropVersion.current(farm)
     
-    crops = Crop.objects.filter(field__farm=farm, is_harvested=False)
+    try:
+        since = int(request.GET['since']) if request.GET.get('since') else None
+    except ValueError:
+        return JsonResponse({'error': 'since must be a crop list version'}, status=400)
+    
+    # The response only depends on the URL and the crop list version
+    etag = f'"crops-{version}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        crops = Crop.objects.filter(field__farm=farm)
+        if field_id:
+            crops = crops.filter(field_id=field_id)
+        
+        # Clients up to date with a version only need the crops stamped after it,
+        # unless a crop was deleted since
+        full = since is None or not (0 < since <= version and since >= removed_version)
+        if full:
+            crops = crops.filter(is_harvested=False)
+        else:
+            crops = crops.filter(version__gt=since)
+        
+        crops_data = []
+        removed = []
+        for crop_id, crop_type, field_name, is_harvested in crops.values_list(
+            'crop_id', 'crop_type', 'field__name', 'is_harvested'
+        ):
+            if is_harvested:
+                removed.append(str(crop_id))
+            else:
+                crops_data.append({'id': str(crop_id), 'name': f"{crop_type} - {field_name}"})
+        
+        data = {'version': version, 'full': full, 'crops': crops_data}
+        if not full:
+            data['removed'] = removed
+        response = JsonResponse(data, json_dumps_params={'separators': (',', ':')})
+    
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+@farmer_required
+@require_POST
+def farm_harvest_scenarios(request, farm_id):
+    """View for simulating the harvest dates of a farm's crops under what-if scenarios"""
+    farm = get_object_or_404(Farm, farm_id=farm_id, farmer=request.user.farmer)
+    
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError as e:
+        return JsonResponse({'error': f"Invalid JSON: {e}"}, status=400)
     
-    if field_id:
-        crops = crops.filter(field_id=field_id)
+    crops = Crop.objects.filter(field__farm=farm)
+    crop_ids = payload.get('crops') if isinstance(payload, dict) else None
+    if crop_ids:
+        try:
+            crops = crops.filter(crop_id__in=[uuid.UUID(str(crop_id)) for crop_id in crop_ids])
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'crops must be a list of crop ids'}, status=400)
     
-    crops_data = [{'id': str(crop.crop_id), 'name': f"{crop.crop_type} - {crop.field.name}"} for crop in crops]
+    try:
+        scenarios = ScenarioSweep.parse(payload)
+        result = ScenarioSweep.run(crops, scenarios)
+    except ScenarioError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
-    return JsonResponse({'crops': crops_data})
-
+    return JsonResponse(result)
 
 @login_required
 @farmer_required
@@ -797,9 +849,8 @@ def crop_harvest_prediction(request, farm_id, crop_id):
     except FarmCondition.DoesNotExist:
         farm_condition = None
     
-    # Get the prediction
-    predicted_date = HarvestPredictionSystem.predict_harvest_date(crop, farm_condition)
-    confidence = HarvestPredictionSystem.get_confidence_level(crop, farm_condition)
+    # Get the prediction (cached until the crop's prediction inputs change)
+    predicted_date, confidence = get_cached_prediction(crop, farm_condition)
     
     # Calculate days until harvest
     days_until_harvest = None
@@ -916,29 +967,146 @@ def crop_harvest_prediction(request, farm_id, crop_id):
 @login_required
 @farmer_required
 def export_farm_pdf(request, farm_id):
-    """View for exporting a farm report as PDF"""
+    """View for requesting a farm report PDF, rendered by the report worker"""
     # Get the farm or raise 404
     farm = get_object_or_404(Farm, farm_id=farm_id, farmer=request.user.farmer)
     
-    # Get related data for the report
-    fields = farm.fields.all()
-    crops = Crop.objects.filter(field__farm=farm)
-    active_crops = crops.filter(is_harvested=False)
-    recent_activities = farm.activities.order_by('-timestamp')[:10]  # Last 10 activities
+    # Reuses the cached report when the farm's data has not changed
+    job = FarmReportExporter.request_report(farm)
+    if job.status == FarmReportJob.STATUS_DONE:
+        return redirect('farm:farm_report_download', farm_id=farm.farm_id, job_id=job.job_id)
     
-    # Get farm condition (or None)
-    try:
-        farm_condition = farm.condition
-    except FarmCondition.DoesNotExist:
-        farm_condition = None
+    return redirect('farm:farm_report_status', farm_id=farm.farm_id, job_id=job.job_id)
+
+@login_required
+@farmer_required
+def export_portfolio(request):
+    """View for exporting the reports of all the farmer's farms as one zip archive"""
+    farms = Farm.objects.filter(farmer=request.user.farmer)
+    if not farms.exists():
+        messages.error(request, "You don't have any farms to export.")
+        return redirect('farm:farm_list')
+    
+    # Built by the report worker; reused while none of the farms change
+    job = FarmPortfolioExporter.request_portfolio(request.user.farmer)
+    if job.status == FarmPortfolioJob.STATUS_DONE:
+        return redirect('farm:portfolio_download', job_id=job.job_id)
+    
+    return redirect('farm:portfolio_status', job_id=job.job_id)
+
+@login_required
+@farmer_required
+def portfolio_status(request, job_id):
+    """View for polling the status of a portfolio export job"""
+    job = get_object_or_404(FarmPortfolioJob, job_id=job_id, farmer=request.user.farmer)
+    
+    download_url = None
+    if job.status == FarmPortfolioJob.STATUS_DONE:
+        download_url = reverse('farm:portfolio_download', args=[job.job_id])
+    
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'status': job.status,
+            'download_url': download_url,
+            'error': job.error
+        })
+    
+    return render(request, 'portfolio_status.html', {
+        'job': job,
+        'download_url': download_url
+    })
+
+@login_required
+@farmer_required
+def portfolio_download(request, job_id):
+    """View for downloading a finished portfolio export archive"""
+    job = get_object_or_404(FarmPortfolioJob, job_id=job_id, farmer=request.user.farmer)
+    
+    if job.status != FarmPortfolioJob.STATUS_DONE:
+        return redirect('farm:portfolio_status', job_id=job.job_id)
+    
+    return FileResponse(
+        job.archive.open('rb'),
+        as_attachment=True,
+        filename=job.filename,
+        content_type='application/zip'
+    )
+
+@login_required
+@farmer_required
+def farm_report_status(request, farm_id, job_id):
+    """View for polling the status of a farm report job"""
+    farm = get_object_or_404(Farm, farm_id=farm_id, farmer=request.user.farmer)
+    job = get_object_or_404(FarmReportJob, job_id=job_id, farm=farm)
+    
+    download_url = None
+    if job.status == FarmReportJob.STATUS_DONE:
+        download_url = reverse('farm:farm_report_download', args=[farm.farm_id, job.job_id])
     
-    # Generate and return the PDF report
-    from .pdf_utils import generate_farm_report_pdf
-    return generate_farm_report_pdf(
-        farm=farm,
-        fields=fields,
-        crops=crops,
-        active_crops=active_crops,
-        recent_activities=recent_activities,
-        farm_condition=farm_condition
-    )
\ No newline at end of file
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'status': job.status,
+            'download_url': download_url,
+            'error': job.error
+        })
+    
+    return render(request, 'farm_report_status.html', {
+        'farm': farm,
+        'job': job,
+        'download_url': download_url
+    })
+
+@login_required
+@farmer_required
+def farm_report_download(request, farm_id, job_id):
+    """View for downloading a finished farm report PDF"""
+    farm = get_object_or_404(Farm, farm_id=farm_id, farmer=request.user.farmer)
+    job = get_object_or_404(FarmReportJob, job_id=job_id, farm=farm)
+    
+    if job.status != FarmReportJob.STATUS_DONE:
+        return redirect('farm:farm_report_status', farm_id=farm.farm_id, job_id=job.job_id)
+    
+    return FileResponse(
+        job.pdf.open('rb'),
+        as_attachment=True,
+        filename=job.filename,
+        content_type='application/pdf'
+    )
+
+@csrf_exempt
+@require_POST
+def sensor_ingest(request):
+    """View for sensor gateways posting batches of condition readings for their farm"""
+    # Gateways authenticate with a farm's sensor token instead of a session
+    authorization = request.headers.get('Authorization', '')
+    token = authorization[len('Bearer '):] if authorization.startswith('Bearer ') else None
+    sensor_token = SensorToken.authenticate(token)
+    if sensor_token is None:
+        return JsonResponse({'error': 'Invalid or missing sensor token'}, status=401)
+    
+    payload_format = request.GET.get('format') or ('json' if request.content_type == 'application/json' else 'line')
+    try:
+        readings, errors = parse_sensor_payload(
+            request.body,
+            payload_format,
+            precision=request.GET.get('precision', 'ns')
+        )
+    except SensorPayloadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    for reading in readings:
+        reading.farm_id = sensor_token.farm_id
+    # Readings are stored before they are acknowledged; a gateway retries a batch refused here
+    try:
+        write_readings(readings)
+    except DatabaseError:
+        logger.exception("Storing sensor readings of farm %s failed", sensor_token.farm_id)
+        response = JsonResponse({'error': 'Readings could not be stored, retry later'}, status=503)
+        response['Retry-After'] = '30'
+        return response
+    
+    return JsonResponse({
+        'accepted': len(readings),
+        'rejected': errors
+    }, status=202)
+
@@ -3,7 +3,7 @@ from django.shortcuts import redirect, render
 from django.contrib.auth.decorators import login_required
 
 from authentication.models import Farmer
-from farm.models import ActivityLog, Crop, Farm
+from farm.dashboard import dashboard_cache
 # Create your views here.
 
 def home_view(request):
@@ -14,29 +14,18 @@ def dashboard_view(request):
     """Dashboard view showing farms overview"""
     # Check if user has a farmer profile
     if hasattr(request.user, 'farmer'):    
-        farms = Farm.objects.filter(farmer=request.user.farmer)
-        farm_count = farms.count()
+        # Counts, recent activities and upcoming harvests come from one cache read
+        summary = dashboard_cache.get_summary(request.user.farmer)
         
-        if farm_count == 0:
+        if summary['farm_count'] == 0:
             # If no farms, suggest creating one
             return render(request, 'dashboard.html', {
                 'farm_count': 0,
                 'has_farms': False
             })
         
-        # Get total crops 
-        total_crops = Crop.objects.filter(field__farm__in=farms).count()
-        
-        # Get some recent activities
-        recent_activities = ActivityLog.objects.filter(
-            farm__farmer=request.user.farmer
-        ).order_by('-timestamp')[:5]
-        
         return render(request, 'dashboard.html', {
-            'farms': farms,
-            'farm_count': farm_count,
-            'total_crops': total_crops,
-            'recent_activities': recent_activities,
+            **summary,
             'has_farms': True
         })
     else:
@@ -45,6 +34,7 @@ def dashboard_view(request):
             'farm_count': 0,
             'total_crops': 0,
             'recent_activities': None,
+            'upcoming_harvests': None,
             'has_farms': False
         })
         
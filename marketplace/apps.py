@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import pre_migrate
+
+
+def create_trigram_extension(sender, using='default', **kwargs):
+    """The autocomplete index uses the operator classes of pg_trgm"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
 
 
 class MarketplaceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'marketplace'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa: F401
+        pre_migrate.connect(create_trigram_extension, sender=self)
@@ -0,0 +1,234 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, Value
+from django.urls import reverse
+
+from authentication.models import Seller
+from .models import Category, Product, SearchSuggestion
+
+# What each kind of suggestion names: the model, its label and slug fields
+# and the filters of the objects worth suggesting
+SUGGESTION_SOURCES = {
+    'product': (Product, 'name', 'slug', {'is_active': True}),
+    'shop': (Seller, 'shop_name', None, {}),
+    'category': (Category, 'name', None, {}),
+}
+
+# Typed text is cut to this length, which also bounds the size of a cache key
+MAX_QUERY_LENGTH = 64
+
+class PrefixCache:
+    """
+    Bounded in-process LRU cache of the suggestions of typed prefixes.
+
+    Holds at most `size` prefixes; a hit moves a prefix to the front, so
+    the hottest prefixes stay while the cold ones are evicted. Entries
+    expire after `timeout` seconds. Each entry notes the (kind, object_id)
+    of its suggestions, so the prefixes suggesting a changed object can be
+    dropped on their own, as can the prefixes a new label answers.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, prefix):
+        with self._lock:
+            entry = self._entries.get(prefix)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(prefix)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, prefix, suggestions, objects=()):
+        with self._lock:
+            self._entries[prefix] = (time.monotonic() + self.timeout, suggestions, frozenset(objects))
+            self._entries.move_to_end(prefix)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def discard(self, objects, texts=()):
+        """Drop the prefixes suggesting any of the (kind, object_id) pairs, or that any of the texts starts with"""
+        objects = set(objects)
+        texts = list(texts)
+        with self._lock:
+            for prefix in [
+                prefix for prefix, entry in self._entries.items()
+                if not objects.isdisjoint(entry[2]) or any(text.startswith(prefix) for text in texts)
+            ]:
+                del self._entries[prefix]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class ProductAutocomplete:
+    """
+    Suggestions for the marketplace search box: product, shop and category
+    names matching what has been typed so far.
+
+    On PostgreSQL the names are kept in SearchSuggestion, whose label has a
+    pg_trgm GIN index. A suggestion matches when the typed text is similar
+    enough to a word sequence of its label (pg_trgm's word similarity), so
+    unfinished words and typos both match, and matches are ranked by that
+    similarity. On other databases, or with MARKETPLACE_TRIGRAM_AUTOCOMPLETE
+    off, labels are matched by prefix.
+
+    Each process keeps the suggestions of the hottest prefixes in a bounded
+    LRU cache, so repeated keystrokes don't reach the database. Saves in
+    this process drop the prefixes that suggested the changed object and
+    those its label starts a word with; other prefixes (e.g. typos of the
+    new label), and changes made elsewhere, catch up once they expire.
+    """
+
+    def __init__(self):
+        self.prefixes = PrefixCache(self.cache_size(), self.timeout())
+
+    @classmethod
+    def enabled(cls):
+        return connection.vendor == 'postgresql' and getattr(settings, 'MARKETPLACE_TRIGRAM_AUTOCOMPLETE', True)
+
+    @classmethod
+    def limit(cls):
+        return getattr(settings, 'MARKETPLACE_AUTOCOMPLETE_LIMIT', 8)
+
+    @classmethod
+    def min_length(cls):
+        return getattr(settings, 'MARKETPLACE_AUTOCOMPLETE_MIN_LENGTH', 2)
+
+    @classmethod
+    def cache_size(cls):
+        return getattr(settings, 'MARKETPLACE_AUTOCOMPLETE_CACHE_SIZE', 1024)
+
+    @classmethod
+    def timeout(cls):
+        return getattr(settings, 'MARKETPLACE_AUTOCOMPLETE_CACHE_TIMEOUT', 60)
+
+    def normalize(self, text):
+        """The cache key of typed text: lower case, single spaces, bounded length"""
+        return ' '.join(text.lower().split())[:MAX_QUERY_LENGTH].strip()
+
+    def word_starts(self, label):
+        """The normalized label from each of its words on: the texts typing a prefix of answers the label"""
+        words = label.lower().split()
+        return [' '.join(words[index:]) for index in range(len(words))]
+
+    def suggest(self, text):
+        """
+        Suggestions for typed text, served from the prefix cache when hot.
+
+        Returns: List of dictionaries with the kind, label and url of each
+        suggestion, best match first; empty for text shorter than
+        MARKETPLACE_AUTOCOMPLETE_MIN_LENGTH
+        """
+        prefix = self.normalize(text)
+        if len(prefix) < self.min_length():
+            return []
+
+        suggestions = self.prefixes.get(prefix)
+        if suggestions is None:
+            rows = self.lookup(prefix)
+            suggestions = [self.as_dict(*row) for row in rows]
+            self.prefixes.set(prefix, suggestions, [(kind, object_id) for kind, object_id, _, _ in rows])
+        return suggestions
+
+    def lookup(self, prefix):
+        """The (kind, object_id, label, slug) rows matching a prefix, from the database"""
+        if self.enabled():
+            return list(self.similar(prefix))
+
+        # One prefix query per kind, each bounded by the limit
+        rows = []
+        for kind, (model, label_field, slug_field, active) in SUGGESTION_SOURCES.items():
+            matches = self.source_rows(
+                kind, model.objects.filter(**active, **{f'{label_field}__istartswith': prefix})
+            ).order_by(label_field)[:self.limit()]
+            rows.extend((kind, str(pk), label, slug) for pk, label, slug in matches)
+        return rows[:self.limit()]
+
+    def similar(self, prefix):
+        """The suggestions whose label has a word sequence similar to a prefix, most similar first"""
+        return SearchSuggestion.objects.filter(
+            # label %> prefix, which the trigram index serves
+            TrigramWordSimilar(F('label'), prefix)
+        ).annotate(
+            similarity=TrigramWordSimilarity(prefix, 'label')
+        ).order_by('-similarity', 'label').values_list(
+            'kind', 'object_id', 'label', 'slug'
+        )[:self.limit()]
+
+    def source_rows(self, kind, objects):
+        """The (pk, label, slug) rows of objects of a kind"""
+        model, label_field, slug_field, active = SUGGESTION_SOURCES[kind]
+        return objects.values_list('pk', label_field, slug_field or Value(''))
+
+    def as_dict(self, kind, object_id, label, slug):
+        if kind == 'product':
+            url = reverse('marketplace:product_detail', args=[object_id, slug])
+        elif kind == 'shop':
+            url = f"{reverse('marketplace:product_list')}?seller={object_id}"
+        else:
+            url = f"{reverse('marketplace:product_list')}?category={object_id}"
+        return {'kind': kind, 'label': label, 'url': url}
+
+    def refresh(self, kind, **filters):
+        """
+        Rebuild the suggestions of the objects of a kind matching the
+        filters, dropping those no longer worth suggesting.
+
+        Returns: Number of suggestions created
+        """
+        model, label_field, slug_field, active = SUGGESTION_SOURCES[kind]
+        objects = model.objects.filter(**filters)
+        rows = self.source_rows(kind, objects.filter(**active))
+        stale = SearchSuggestion.objects.filter(kind=kind)
+        if filters:
+            object_ids = [str(pk) for pk in objects.values_list('pk', flat=True)]
+            rows = list(rows)
+            # The prefixes that suggested the objects, and those their labels now answer
+            self.prefixes.discard(
+                [(kind, object_id) for object_id in object_ids],
+                texts=[text for _, label, _ in rows for text in self.word_starts(label)]
+            )
+            stale = stale.filter(object_id__in=object_ids)
+        else:
+            self.prefixes.clear()
+        if not self.enabled():
+            return 0
+        stale.delete()
+
+        suggestions = SearchSuggestion.objects.bulk_create(
+            [
+                SearchSuggestion(kind=kind, object_id=str(pk), label=label, slug=slug)
+                for pk, label, slug in rows
+            ],
+            batch_size=getattr(settings, 'MARKETPLACE_SEARCH_BATCH_SIZE', 1000)
+        )
+        return len(suggestions)
+
+    def remove(self, kind, object_id):
+        """Delete the suggestion of a deleted object"""
+        self.prefixes.discard([(kind, str(object_id))])
+        if self.enabled():
+            SearchSuggestion.objects.filter(kind=kind, object_id=str(object_id)).delete()
+
+    def stats(self):
+        """Return the prefix cache counters of this process"""
+        return {'hits': self.prefixes.hits, 'misses': self.prefixes.misses, 'prefixes': len(self.prefixes)}
+
+product_autocomplete = ProductAutocomplete()
@@ -0,0 +1,219 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.shortcuts import get_object_or_404
+
+from .models import Category, Product, path_ids
+from .search import ProductSearch
+from .sidebar import category_sidebar
+
+# Minimum ratings offered as rating bands ("4 stars & up", ...)
+RATING_BANDS = (4, 3, 2, 1)
+
+# Smallest price step; a price bucket [low, high) is selected as min_price=low, max_price=high - PRICE_STEP
+PRICE_STEP = Decimal('0.01')
+
+class FacetedProductSearch:
+    """
+    Product list search with facet counts, on top of ProductSearchForm.
+
+    The form selects the search text plus one filter per facet: category
+    (with its subcategories), price range, seller, minimum rating and in
+    stock. Each facet is counted over the products matching the search and
+    every other active filter, but not its own, so the buckets of a facet
+    show what picking another option would return.
+
+    The counts take a fixed number of queries, whatever the catalog size:
+    one conditional aggregate for the price, rating and stock buckets, one
+    grouped query per category and seller facet, and one for the names of
+    the categories counted. Without a search text or another filter the
+    category counts are those of the cached category sidebar, so they take
+    no query.
+    """
+
+    def __init__(self, form):
+        self.data = form.cleaned_data if form.is_valid() else {}
+        self.category = None
+        if self.data.get('category'):
+            self.category = get_object_or_404(Category, id=self.data['category'])
+
+    @classmethod
+    def price_edges(cls):
+        return getattr(settings, 'MARKETPLACE_PRICE_FACET_EDGES', (10, 50, 100, 500, 1000))
+
+    @classmethod
+    def seller_facet_size(cls):
+        return getattr(settings, 'MARKETPLACE_SELLER_FACET_SIZE', 10)
+
+    def filters(self):
+        """The active facet filters, by facet"""
+        filters = {}
+        if self.category is not None:
+            # The category and its subcategories share its path prefix
+            filters['category'] = Q(category__path__startswith=self.category.path)
+
+        price = Q()
+        if self.data.get('min_price') is not None:
+            price &= Q(price__gte=self.data['min_price'])
+        if self.data.get('max_price') is not None:
+            price &= Q(price__lte=self.data['max_price'])
+        if price:
+            filters['price'] = price
+
+        if self.data.get('seller'):
+            filters['seller'] = Q(seller_id=self.data['seller'])
+        if self.data.get('min_rating'):
+            filters['rating'] = Q(average_rating__gte=self.data['min_rating'])
+        if self.data.get('in_stock'):
+            filters['in_stock'] = Q(stock__gt=0)
+        return filters
+
+    def excluding(self, facet):
+        """Every active filter but the one of a facet"""
+        condition = Q()
+        for name, facet_filter in self.filters().items():
+            if name != facet:
+                condition &= facet_filter
+        return condition
+
+    def matching(self):
+        """Active products matching the search text, unranked"""
+        products = Product.objects.filter(is_active=True)
+        if self.data.get('query'):
+            products = ProductSearch.match(products, self.data['query'])
+        return products
+
+    def products(self):
+        """The products to list, filtered and sorted"""
+        products = Product.objects.filter(is_active=True).select_related('seller', 'category').prefetch_related('images')
+        if not self.data:
+            return products.order_by('-created_at')
+
+        if self.data.get('query'):
+            # Ranked by relevance unless another order is picked below
+            products = ProductSearch.search(products, self.data['query'])
+        for facet_filter in self.filters().values():
+            products = products.filter(facet_filter)
+
+        sort_by = self.data.get('sort_by')
+        if sort_by == 'price_asc':
+            products = products.order_by('price')
+        elif sort_by == 'price_desc':
+            products = products.order_by('-price')
+        elif sort_by == 'newest':
+            products = products.order_by('-created_at')
+        elif sort_by == 'rating':
+            products = products.order_by('-average_rating')
+        elif not products.ordered:
+            products = products.order_by('-created_at')
+        return products
+
+    def facets(self):
+        """
+        Count the products of every facet bucket.
+
+        Returns: Dictionary with categories, price, sellers, rating and
+        in_stock buckets. Each bucket has its count and whether it is the
+        selected one.
+        """
+        products = self.matching()
+        price_ranges = self.price_ranges()
+
+        aggregates = {'in_stock': Count('pk', filter=self.excluding('in_stock') & Q(stock__gt=0))}
+        for index, (low, high) in enumerate(price_ranges):
+            bucket = Q(price__gte=low) if low is not None else Q()
+            if high is not None:
+                bucket &= Q(price__lt=high)
+            aggregates[f'price_{index}'] = Count('pk', filter=self.excluding('price') & bucket)
+        for band in RATING_BANDS:
+            aggregates[f'rating_{band}'] = Count('pk', filter=self.excluding('rating') & Q(average_rating__gte=band))
+        counts = products.aggregate(**aggregates)
+
+        min_price, max_price = self.data.get('min_price'), self.data.get('max_price')
+        price = []
+        for index, (low, high) in enumerate(price_ranges):
+            bucket_max = high - PRICE_STEP if high is not None else None
+            price.append({
+                'min_price': low,
+                'max_price': bucket_max,
+                'label': f"{low:,}+" if high is None else f"{low or 0:,} - {high:,}",
+                'count': counts[f'price_{index}'],
+                'selected': (min_price, max_price) == (low, bucket_max),
+            })
+
+        return {
+            'categories': self.category_buckets(products),
+            'price': price,
+            'sellers': self.seller_buckets(products),
+            'rating': [
+                {'min_rating': band, 'count': counts[f'rating_{band}'], 'selected': self.data.get('min_rating') == band}
+                for band in RATING_BANDS
+            ],
+            'in_stock': {'count': counts['in_stock'], 'selected': bool(self.data.get('in_stock'))},
+        }
+
+    def price_ranges(self):
+        """Consecutive [low, high) price ranges, open-ended at the top"""
+        edges = [Decimal(str(edge)) for edge in self.price_edges()]
+        lows = [None] + edges
+        highs = edges + [None]
+        return list(zip(lows, highs))
+
+    def category_buckets(self, products):
+        """
+        Product counts of the sidebar categories, each including its
+        subcategories: top-level buckets, each with its children.
+        """
+        if self.data.get('query') or self.excluding('category'):
+            rows = products.filter(self.excluding('category')).exclude(category=None).values(
+                'category__path'
+            ).annotate(count=Count('pk')).order_by()
+
+            totals = {}
+            for row in rows:
+                for ancestor_id in path_ids(row['category__path']):
+                    totals[ancestor_id] = totals.get(ancestor_id, 0) + row['count']
+            if not totals:
+                return []
+
+            counted = [
+                dict(category, count=totals[category['id']])
+                for category in Category.objects.filter(pk__in=totals, depth__lte=category_sidebar.MAX_DEPTH).values(
+                    'id', 'name', 'parent_id'
+                ).order_by('depth', 'pk')
+            ]
+        else:
+            # Every active product counts, as in the cached sidebar
+            counted = [
+                {'id': category.pk, 'name': category.name, 'parent_id': category.parent_id, 'count': category.product_count}
+                for top_level in category_sidebar.get()
+                for category in [top_level, *top_level.sidebar_children]
+            ]
+
+        selected_id = self.category.pk if self.category is not None else None
+        buckets = {}
+        top_level = []
+        for category in counted:
+            bucket = dict(category, selected=category['id'] == selected_id, children=[])
+            buckets[bucket['id']] = bucket
+            if bucket['parent_id'] in buckets:
+                buckets[bucket['parent_id']]['children'].append(bucket)
+            elif bucket['parent_id'] is None:
+                top_level.append(bucket)
+        return top_level
+
+    def seller_buckets(self, products):
+        """The sellers with the most products, with their counts"""
+        rows = products.filter(self.excluding('seller')).values(
+            'seller_id', 'seller__shop_name'
+        ).annotate(count=Count('pk')).order_by('-count', 'seller__shop_name')[:self.seller_facet_size()]
+        return [
+            {
+                'id': row['seller_id'],
+                'name': row['seller__shop_name'],
+                'count': row['count'],
+                'selected': row['seller_id'] == self.data.get('seller'),
+            }
+            for row in rows
+        ]
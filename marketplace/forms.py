@@ -163,9 +163,13 @@ class ProductSearchForm(forms.Form):
     category = forms.IntegerField(required=False, widget=forms.HiddenInput)
     min_price = forms.DecimalField(required=False, min_value=0)
     max_price = forms.DecimalField(required=False, min_value=0)
+    seller = forms.UUIDField(required=False, widget=forms.HiddenInput)
+    min_rating = forms.IntegerField(required=False, min_value=1, max_value=5, widget=forms.HiddenInput)
+    in_stock = forms.BooleanField(required=False, widget=forms.HiddenInput)
     sort_by = forms.ChoiceField(
         required=False,
         choices=(
+            ('relevance', 'Best Match'),
             ('price_asc', 'Price: Low to High'),
             ('price_desc', 'Price: High to Low'),
             ('newest', 'Newest First'),
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from marketplace.models import Category
+from marketplace.sidebar import category_sidebar
+
+class Command(BaseCommand):
+    help = "Recompute the materialized path of every category from the parent links"
+
+    def handle(self, *args, **options):
+        rebuilt = Category.rebuild_paths()
+        category_sidebar.invalidate()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the paths of {rebuilt} categories"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace.search import ProductSearch
+
+class Command(BaseCommand):
+    help = "Build the full-text search documents of all products"
+
+    def handle(self, *args, **options):
+        if not ProductSearch.enabled():
+            raise CommandError("Full-text search needs PostgreSQL and MARKETPLACE_FULL_TEXT_SEARCH enabled")
+
+        rebuilt = ProductSearch.refresh()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the search documents of {rebuilt} products"))
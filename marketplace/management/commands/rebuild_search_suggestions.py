@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace.autocomplete import SUGGESTION_SOURCES, product_autocomplete
+
+class Command(BaseCommand):
+    help = "Build the search box suggestions of all products, shops and categories"
+
+    def handle(self, *args, **options):
+        if not product_autocomplete.enabled():
+            raise CommandError("Trigram autocomplete needs PostgreSQL and MARKETPLACE_TRIGRAM_AUTOCOMPLETE enabled")
+
+        rebuilt = sum(product_autocomplete.refresh(kind) for kind in SUGGESTION_SOURCES)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} search suggestions"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from marketplace.models import Category
+from marketplace.sidebar import category_sidebar
+
+class Command(BaseCommand):
+    help = "Recount the active products of every category and repair drifted counters"
+
+    def handle(self, *args, **options):
+        repaired = Category.reconcile_product_counts()
+        if repaired:
+            category_sidebar.invalidate()
+        self.stdout.write(self.style.SUCCESS(f"Repaired the product counts of {repaired} categories"))
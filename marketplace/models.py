@@ -1,27 +1,185 @@
 import uuid
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Case, Count, F, Func, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Concat, Substr
 from authentication.models import *
 
+def path_ids(path):
+    """The category ids in a materialized path, root first"""
+    return [int(pk) for pk in path.strip('/').split('/') if pk]
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
+    # Materialized path of ids from the root, e.g. "/3/8/", so a subtree is one prefix lookup
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Active products, kept up to date by the product signals
+    active_product_count = models.PositiveIntegerField(default=0, editable=False)
+    total_product_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Active products in this category and its subcategories"
+    )
 
     class Meta:
         verbose_name_plural = 'Categories'
 
     def __str__(self):
         return self.name
-    
+
+    def clean(self):
+        super().clean()
+        if self.pk and self.parent_id and f'/{self.pk}/' in self.parent.path:
+            raise ValidationError({'parent': 'A category cannot be moved under itself or its subcategories'})
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.update_path()
+
+    def update_path(self):
+        """Bring the path of this category, and of its subtree when it moved, in line with its parent"""
+        if self.parent_id:
+            parent_path, parent_depth = Category.objects.filter(pk=self.parent_id).values_list('path', 'depth').get()
+            path, depth = f'{parent_path}{self.pk}/', parent_depth + 1
+        else:
+            path, depth = f'/{self.pk}/', 0
+        if path == self.path and depth == self.depth:
+            return
+
+        old_path, old_depth = self.path, self.depth
+        Category.objects.filter(pk=self.pk).update(path=path, depth=depth)
+        if old_path:
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (depth - old_depth)
+            )
+            # The subtree's products left the old ancestors and joined the new ones
+            moved_ancestors = set(path_ids(old_path)) | set(path_ids(path))
+            moved_ancestors.discard(self.pk)
+            Category.refresh_product_counts(pk__in=moved_ancestors)
+        self.path, self.depth = path, depth
+
+    @classmethod
+    def rebuild_paths(cls, using='default'):
+        """Recompute every path from the parent links, top-down. Returns the number of categories"""
+        categories = list(cls.objects.using(using).only('pk', 'parent_id', 'path', 'depth'))
+        children = {}
+        for category in categories:
+            children.setdefault(category.parent_id, []).append(category)
+
+        changed = []
+        level = [(category, '/', 0) for category in children.get(None, [])]
+        while level:
+            next_level = []
+            for category, parent_path, depth in level:
+                path = f'{parent_path}{category.pk}/'
+                if (category.path, category.depth) != (path, depth):
+                    category.path, category.depth = path, depth
+                    changed.append(category)
+                next_level.extend((child, path, depth + 1) for child in children.get(category.pk, []))
+            level = next_level
+        cls.objects.using(using).bulk_update(changed, ['path', 'depth'], batch_size=500)
+        return len(categories)
+
     def get_descendants(self, include_self=False):
-        descendants = []
-        if include_self:
-            descendants.append(self)
-        children = self.children.all()
-        for child in children:
-            descendants.append(child)
-            descendants.extend(child.get_descendants())
-        return descendants
+        descendants = Category.objects.filter(path__startswith=self.path).order_by('depth', 'pk')
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return list(descendants)
+
+    def get_ancestor_ids(self):
+        """Ids on the path from the root to this category, this one included"""
+        return path_ids(self.path)
+
+    def get_total_product_count(self):
+        """Active products in this category and its subcategories"""
+        return Product.objects.filter(is_active=True, category__path__startswith=self.path).count()
+
+    @classmethod
+    def adjust_product_counts(cls, category_id, delta):
+        """Add delta active products to a category and to the totals of its ancestors"""
+        path = cls.objects.filter(pk=category_id).values_list('path', flat=True).first()
+        if not path:
+            return
+        cls.objects.filter(pk__in=path_ids(path)).update(
+            total_product_count=F('total_product_count') + delta,
+            active_product_count=Case(
+                When(pk=category_id, then=F('active_product_count') + delta),
+                default=F('active_product_count'),
+                output_field=models.PositiveIntegerField()
+            )
+        )
+
+    @classmethod
+    def refresh_product_counts(cls, **filters):
+        """Recount the active products of the matching categories with one UPDATE"""
+        def count(products):
+            return Coalesce(Subquery(
+                products.order_by().annotate(
+                    count=Func(F('pk'), function='COUNT', output_field=models.PositiveIntegerField())
+                ).values('count')
+            ), 0)
+
+        active = Product.objects.filter(is_active=True)
+        cls.objects.filter(**filters).update(
+            active_product_count=count(active.filter(category=OuterRef('pk'))),
+            total_product_count=count(active.filter(category__path__startswith=OuterRef('path')))
+        )
+
+    @classmethod
+    def reconcile_product_counts(cls, using='default'):
+        """
+        Recount the active products of every category from one aggregate
+        query and repair the counters that drifted.
+
+        Returns: Number of categories repaired
+        """
+        categories = list(
+            cls.objects.using(using).annotate(
+                direct_count=Count('products', filter=models.Q(products__is_active=True))
+            )
+        )
+        totals = {}
+        for category in categories:
+            for ancestor_id in category.get_ancestor_ids():
+                totals[ancestor_id] = totals.get(ancestor_id, 0) + category.direct_count
+
+        drifted = []
+        for category in categories:
+            counts = (category.direct_count, totals.get(category.pk, 0))
+            if (category.active_product_count, category.total_product_count) != counts:
+                category.active_product_count, category.total_product_count = counts
+                drifted.append(category)
+        cls.objects.using(using).bulk_update(
+            drifted, ['active_product_count', 'total_product_count'], batch_size=500
+        )
+        return len(drifted)
+
+    @classmethod
+    def sidebar(cls, max_depth=1):
+        """
+        The category tree down to max_depth, with product counts that
+        include subcategories, read from the counters in a single query.
+
+        Returns: List of top-level categories. Every category has a
+        product_count and a sidebar_children list of its subcategories.
+        """
+        by_id = {}
+        top_level = []
+        for category in cls.objects.filter(depth__lte=max_depth).order_by('depth', 'pk'):
+            category.product_count = category.total_product_count
+            category.sidebar_children = []
+            by_id[category.pk] = category
+            if category.parent_id is None:
+                top_level.append(category)
+            elif category.parent_id in by_id:
+                by_id[category.parent_id].sidebar_children.append(category)
+        return top_level
 
 
 class Product(models.Model):
@@ -52,6 +210,63 @@ class Product(models.Model):
         return counts
 
 
+class ProductSearchDocument(models.Model):
+    """
+    Full-text search document of a product: the weighted tsvector of its
+    name, shop name, category and description, built by ProductSearch.
+    Kept out of the Product table since it only exists on PostgreSQL; for
+    the same reason deleting a product doesn't cascade here, the marketplace
+    signals delete its document.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.DO_NOTHING, db_constraint=False, primary_key=True, related_name='search_document'
+    )
+    document = SearchVectorField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        required_db_vendor = 'postgresql'
+        indexes = [
+            GinIndex(fields=['document']),
+        ]
+
+    def __str__(self):
+        return f"Search document of {self.product.name}"
+
+
+class SearchSuggestion(models.Model):
+    """
+    A name the search box autocomplete can suggest: an active product, a
+    shop or a category, with a trigram index on its label. Like the search
+    documents it only exists on PostgreSQL, and ProductAutocomplete keeps
+    it in sync with the objects it names.
+    """
+    KIND_CHOICES = (
+        ('product', 'Product'),
+        ('shop', 'Shop'),
+        ('category', 'Category'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Primary key of the product, seller or category, as text
+    object_id = models.CharField(max_length=36)
+    label = models.CharField(max_length=255)
+    slug = models.SlugField(blank=True, db_index=False)
+
+    class Meta:
+        required_db_vendor = 'postgresql'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_suggestion'),
+        ]
+        indexes = [
+            # Serves the word similarity operator of pg_trgm, for prefixes and typos alike
+            GinIndex(fields=['label'], name='search_suggestion_label_trgm', opclasses=['gin_trgm_ops']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.label}"
+
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='product_images/')
@@ -0,0 +1,122 @@
+import operator
+from functools import reduce
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import Product, ProductSearchDocument
+
+# Product columns in the search document and their weight; matches in the
+# name rank above the shop and category, which rank above the description
+DOCUMENT_FIELDS = (
+    ('name', 'A'),
+    ('seller__shop_name', 'B'),
+    ('category__name', 'B'),
+    ('description', 'C'),
+)
+
+class ProductSearch:
+    """
+    Full-text search over the product catalog.
+
+    Each product has a ProductSearchDocument holding a weighted tsvector of
+    its name, shop name, category and description, indexed with GIN. The
+    text is stemmed with every configuration in MARKETPLACE_SEARCH_CONFIGS
+    (Indonesian and English by default) and a query matches when any of
+    them does, so "tomat" and "tomatoes" both find their listings. Results
+    are ranked by relevance.
+
+    Documents are kept in sync by the marketplace signals; the
+    rebuild_product_search command builds them for existing products. Full-
+    text search needs PostgreSQL; on other databases (and with
+    MARKETPLACE_FULL_TEXT_SEARCH off) search falls back to substring
+    matching.
+    """
+
+    @classmethod
+    def enabled(cls):
+        return connection.vendor == 'postgresql' and getattr(settings, 'MARKETPLACE_FULL_TEXT_SEARCH', True)
+
+    @classmethod
+    def configs(cls):
+        return getattr(settings, 'MARKETPLACE_SEARCH_CONFIGS', ('indonesian', 'english'))
+
+    @classmethod
+    def vector(cls):
+        """The search document of a product, as an expression over Product"""
+        return reduce(operator.add, [
+            SearchVector(field, config=config, weight=weight)
+            for field, weight in DOCUMENT_FIELDS
+            for config in cls.configs()
+        ])
+
+    @classmethod
+    def query(cls, text):
+        """A search query matching text under any of the configurations"""
+        return reduce(operator.or_, [
+            SearchQuery(text, config=config, search_type='websearch')
+            for config in cls.configs()
+        ])
+
+    @classmethod
+    def match(cls, products, text):
+        """Filter a Product queryset by a search text, without ranking (e.g. for counting)"""
+        if not cls.enabled():
+            return products.filter(
+                Q(name__icontains=text) |
+                Q(description__icontains=text) |
+                Q(seller__shop_name__icontains=text)
+            )
+        return products.filter(search_document__document=cls.query(text))
+
+    @classmethod
+    def search(cls, products, text):
+        """
+        Filter a Product queryset by a search text.
+
+        Returns: The matching products. With full-text search they are
+        annotated with their rank and ordered by it, best match first.
+        """
+        products = cls.match(products, text)
+        if not cls.enabled():
+            return products
+
+        return products.annotate(
+            rank=SearchRank(F('search_document__document'), cls.query(text))
+        ).order_by('-rank', '-created_at')
+
+    @classmethod
+    def remove(cls, product_id):
+        """Delete the search document of a deleted product"""
+        if cls.enabled():
+            ProductSearchDocument.objects.filter(product_id=product_id).delete()
+
+    @classmethod
+    def refresh(cls, **filters):
+        """
+        Rebuild the search documents of the products matching the filters,
+        creating the missing ones.
+
+        Returns: Number of documents rebuilt
+        """
+        if not cls.enabled():
+            return 0
+
+        products = Product.objects.filter(**filters)
+        ProductSearchDocument.objects.bulk_create(
+            [ProductSearchDocument(product_id=pk) for pk in products.values_list('pk', flat=True)],
+            batch_size=getattr(settings, 'MARKETPLACE_SEARCH_BATCH_SIZE', 1000),
+            ignore_conflicts=True
+        )
+        # One UPDATE computes every document in the database
+        return ProductSearchDocument.objects.filter(product__in=products).update(
+            document=Subquery(
+                Product.objects.filter(pk=OuterRef('product_id')).annotate(
+                    document=cls.vector()
+                ).values('document')[:1]
+            ),
+            updated_at=timezone.now()
+        )
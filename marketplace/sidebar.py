@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Category
+
+class CategorySidebar:
+    """
+    Cache of the category sidebar of the product list.
+
+    The tree and its product counts are stored as one entry of the
+    MARKETPLACE_SIDEBAR_CACHE_ALIAS cache, so the sidebar is served with a
+    single cache read. The marketplace signals drop the entry whenever a
+    category or a product count changes; it also expires after
+    MARKETPLACE_SIDEBAR_CACHE_TIMEOUT seconds.
+    """
+
+    KEY = 'marketplace:category_sidebar'
+
+    # Top-level categories and their subcategories
+    MAX_DEPTH = 1
+
+    def cache(self):
+        return caches[getattr(settings, 'MARKETPLACE_SIDEBAR_CACHE_ALIAS', 'default')]
+
+    def timeout(self):
+        return getattr(settings, 'MARKETPLACE_SIDEBAR_CACHE_TIMEOUT', 300)
+
+    def get(self):
+        categories = self.cache().get(self.KEY)
+        if categories is None:
+            categories = Category.sidebar(max_depth=self.MAX_DEPTH)
+            self.cache().set(self.KEY, categories, self.timeout())
+        return categories
+
+    def invalidate(self):
+        self.cache().delete(self.KEY)
+
+category_sidebar = CategorySidebar()
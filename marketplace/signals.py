@@ -0,0 +1,99 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from authentication.models import Seller
+from .autocomplete import product_autocomplete
+from .models import Category, Product, path_ids
+from .search import ProductSearch
+from .sidebar import category_sidebar
+
+# The stored columns of each model that its post_save handlers compare a
+# save against
+STORED_FIELDS = {
+    Product: ('name', 'slug', 'description', 'seller_id', 'category_id', 'is_active'),
+    Seller: ('shop_name',),
+    Category: ('name',),
+}
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=Seller)
+@receiver(pre_save, sender=Category)
+def remember_stored(sender, instance, raw=False, **kwargs):
+    """Note the stored values of the compared fields, before the save changes them"""
+    instance._stored = None
+    if not raw and not instance._state.adding:
+        instance._stored = sender.objects.filter(pk=instance.pk).values(*STORED_FIELDS[sender]).first()
+
+def changed(instance, *fields):
+    """Whether the last save created the object or changed any of the fields"""
+    stored = getattr(instance, '_stored', None)
+    return stored is None or any(getattr(instance, field) != stored[field] for field in fields)
+
+@receiver(post_save, sender=Product)
+def product_changed(sender, instance, raw=False, **kwargs):
+    """A product's name, description, shop and category make up its search document, its name and slug its suggestion"""
+    if raw:
+        return
+    # Stock and rating updates leave the document and the suggestion as they are
+    if changed(instance, 'name', 'description', 'seller_id', 'category_id'):
+        ProductSearch.refresh(pk=instance.pk)
+    if changed(instance, 'name', 'slug', 'is_active'):
+        product_autocomplete.refresh('product', pk=instance.pk)
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    ProductSearch.remove(instance.pk)
+    product_autocomplete.remove('product', instance.pk)
+
+@receiver(post_save, sender=Seller)
+def seller_changed(sender, instance, raw=False, **kwargs):
+    """The shop name is part of the search document of every product of the shop"""
+    if not raw and changed(instance, 'shop_name'):
+        ProductSearch.refresh(seller=instance)
+        product_autocomplete.refresh('shop', pk=instance.pk)
+
+@receiver(post_delete, sender=Seller)
+def seller_deleted(sender, instance, **kwargs):
+    product_autocomplete.remove('shop', instance.pk)
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, raw=False, **kwargs):
+    """The category name is part of the search document of its products"""
+    if not raw and changed(instance, 'name'):
+        ProductSearch.refresh(category=instance)
+        product_autocomplete.refresh('category', pk=instance.pk)
+
+@receiver(post_save, sender=Product)
+def product_count_changed(sender, instance, raw=False, **kwargs):
+    """Active products are counted in their category and its ancestors"""
+    if raw:
+        return
+    # The category the stored product was counted in
+    stored = getattr(instance, '_stored', None)
+    counted_category_id = stored['category_id'] if stored and stored['is_active'] else None
+    category_id = instance.category_id if instance.is_active else None
+    if counted_category_id == category_id:
+        return
+    if counted_category_id:
+        Category.adjust_product_counts(counted_category_id, -1)
+    if category_id:
+        Category.adjust_product_counts(category_id, 1)
+    category_sidebar.invalidate()
+
+@receiver(post_delete, sender=Product)
+def product_uncounted(sender, instance, **kwargs):
+    if instance.is_active and instance.category_id:
+        Category.adjust_product_counts(instance.category_id, -1)
+        category_sidebar.invalidate()
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    """Category names and positions are shown in the sidebar"""
+    category_sidebar.invalidate()
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    """The products of a deleted subtree no longer count towards its ancestors"""
+    Category.refresh_product_counts(pk__in=[pk for pk in path_ids(instance.path) if pk != instance.pk])
+    category_sidebar.invalidate()
+    product_autocomplete.remove('category', instance.pk)
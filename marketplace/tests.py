@@ -3,13 +3,19 @@ from django.conf import settings
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.contrib.messages import get_messages
 from django.utils import timezone
 from django.utils.text import slugify
+from unittest import skipIf, skipUnless
 from unittest.mock import patch, MagicMock, PropertyMock
 from decimal import Decimal
 import json
 import requests
+from io import StringIO
 
 # Import models from marketplace and other apps
 from authentication.models import Merchant, Buyer, Seller # Assuming these are in authentication
@@ -24,6 +30,10 @@ from .forms import (
     MerchantForm, BuyerForm
 )
 from marketplace import forms
+from .autocomplete import PrefixCache, product_autocomplete
+from .facets import FacetedProductSearch
+from .search import ProductSearch
+from .sidebar import category_sidebar
 
 User = get_user_model()
 
@@ -1094,4 +1104,489 @@ class ReviewViewsTests(MarketplaceTestBase):
         messages_text = list(get_messages(response_invalid_text.wsgi_request))
         self.assertTrue('at least 10 characters' in str(messages_text[0]))
         review.refresh_from_db()
-        self.assertEqual(review.review_text, "Seller initial review") # Text not changed
\ No newline at end of file
+        self.assertEqual(review.review_text, "Seller initial review") # Text not changed
+
+
+# --- Search Tests ---
+def postgres_sql(queryset):
+    """Compile a queryset for PostgreSQL without connecting to a server"""
+    from django.db import connection
+    from django.db.backends.postgresql.base import DatabaseWrapper
+    settings_dict = dict(connection.settings_dict, ENGINE='django.db.backends.postgresql')
+    return queryset.query.get_compiler(connection=DatabaseWrapper(settings_dict, alias='postgres')).as_sql()
+
+
+class ProductSearchTests(TestCase):
+    """Tests for the product search engine."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='searchseller', password='TestPass123!')
+        merchant = Merchant.objects.create(user=user)
+        cls.seller = Seller.objects.create(merchant=merchant, shop_name="Kebun Segar")
+        cls.category = Category.objects.create(name="Sayuran", slug="sayuran")
+        cls.tomato = Product.objects.create(
+            seller=cls.seller, category=cls.category, name="Tomat Merah", slug="tomat-merah",
+            description="Fresh tomatoes", price=Decimal('12000'), stock=10
+        )
+        cls.rice = Product.objects.create(
+            seller=cls.seller, category=cls.category, name="Beras Pandan", slug="beras-pandan",
+            description="Fragrant rice", price=Decimal('65000'), stock=5
+        )
+
+    @skipIf(connection.vendor == 'postgresql', "Full-text search replaces substring matching on PostgreSQL")
+    def test_search_falls_back_to_substring_matching(self):
+        self.assertFalse(ProductSearch.enabled())
+        self.assertEqual(list(ProductSearch.search(Product.objects.all(), "tomat")), [self.tomato])
+        self.assertEqual(ProductSearch.search(Product.objects.all(), "segar").count(), 2)
+        self.assertEqual(ProductSearch.refresh(), 0)
+
+    @skipUnless(connection.vendor == 'postgresql', "Full-text search needs PostgreSQL")
+    def test_full_text_search_ranks_and_stems_on_postgresql(self):
+        sauce = Product.objects.create(
+            seller=self.seller, category=self.category, name="Sambal Botol", slug="sambal-botol",
+            description="Dibuat dari tomat pilihan", price=Decimal('15000'), stock=3
+        )
+        self.assertEqual(ProductSearch.refresh(), 3)
+        products = Product.objects.all()
+
+        # A match in the name outranks one in the description
+        self.assertEqual(list(ProductSearch.search(products, "tomat")), [self.tomato, sauce])
+        # English stemming finds "Fresh tomatoes"
+        self.assertEqual(list(ProductSearch.search(products, "tomato")), [self.tomato])
+        # Indonesian stemming finds the "Sayuran" category
+        self.assertEqual(ProductSearch.match(products, "sayur").count(), 3)
+        self.assertFalse(ProductSearch.search(products, "jagung").exists())
+
+    def test_only_document_changes_rebuild_documents(self):
+        with patch.object(ProductSearch, 'refresh') as refresh:
+            # What checkout and reviews save
+            self.tomato.stock -= 1
+            self.tomato.average_rating = Decimal('4.50')
+            self.tomato.save()
+            self.seller.rating = Decimal('4.50')
+            self.seller.save()
+            refresh.assert_not_called()
+
+            self.tomato.description = "Ripe tomatoes"
+            self.tomato.save()
+            refresh.assert_called_once_with(pk=self.tomato.pk)
+
+            refresh.reset_mock()
+            self.seller.shop_name = "Kebun Baru"
+            self.seller.save()
+            refresh.assert_called_once_with(seller=self.seller)
+
+    def test_products_can_be_deleted_without_search_documents(self):
+        self.rice.delete()
+        self.assertFalse(Product.objects.filter(pk=self.rice.pk).exists())
+
+    def test_full_text_search_ranks_indexed_documents(self):
+        with patch.object(ProductSearch, 'enabled', return_value=True):
+            sql, params = postgres_sql(ProductSearch.search(Product.objects.all(), "tomat segar"))
+        self.assertIn('"marketplace_productsearchdocument"."document" @@', sql)
+        self.assertIn('websearch_to_tsquery', sql)
+        self.assertIn('ts_rank', sql)
+        self.assertIn('DESC', sql)
+        self.assertEqual(set(params) - {"tomat segar"}, {'indonesian', 'english'})
+
+    def test_document_weights_every_field_under_every_config(self):
+        sql, params = postgres_sql(Product.objects.annotate(document=ProductSearch.vector()).values('document'))
+        self.assertEqual(sql.count('setweight'), 8)
+        self.assertIn('"authentication_seller"."shop_name"', sql)
+        self.assertIn('LEFT OUTER JOIN "marketplace_category"', sql)
+
+
+class CategoryTreeTests(TestCase):
+    """Tests for the materialized category paths."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='treeseller', password='TestPass123!')
+        cls.seller = Seller.objects.create(merchant=Merchant.objects.create(user=user), shop_name="Tree Shop")
+        cls.food = Category.objects.create(name="Food", slug="food")
+        cls.vegetables = Category.objects.create(name="Vegetables", slug="vegetables", parent=cls.food)
+        cls.leafy = Category.objects.create(name="Leafy", slug="leafy", parent=cls.vegetables)
+        cls.tools = Category.objects.create(name="Tools", slug="tools")
+
+    def _product(self, category, slug, is_active=True):
+        return Product.objects.create(
+            seller=self.seller, category=category, name=slug, slug=slug,
+            description="Test", price=Decimal('1000'), stock=1, is_active=is_active
+        )
+
+    def test_paths_follow_the_parents(self):
+        self.assertEqual(self.food.path, f'/{self.food.pk}/')
+        self.assertEqual(self.leafy.path, f'/{self.food.pk}/{self.vegetables.pk}/{self.leafy.pk}/')
+        self.assertEqual(self.leafy.depth, 2)
+        self.assertEqual(self.leafy.get_ancestor_ids(), [self.food.pk, self.vegetables.pk, self.leafy.pk])
+
+    def test_descendants_are_one_query(self):
+        with self.assertNumQueries(1):
+            descendants = self.food.get_descendants(include_self=True)
+        self.assertEqual(descendants, [self.food, self.vegetables, self.leafy])
+        self.assertEqual(self.vegetables.get_descendants(), [self.leafy])
+
+    def test_moving_a_category_moves_its_subtree(self):
+        self.vegetables.parent = self.tools
+        self.vegetables.save()
+        self.leafy.refresh_from_db()
+        self.assertEqual(self.leafy.path, f'/{self.tools.pk}/{self.vegetables.pk}/{self.leafy.pk}/')
+        self.assertEqual(self.food.get_descendants(), [])
+
+        self.vegetables.parent = None
+        self.vegetables.save()
+        self.leafy.refresh_from_db()
+        self.assertEqual((self.leafy.path, self.leafy.depth), (f'/{self.vegetables.pk}/{self.leafy.pk}/', 1))
+
+    def test_category_cannot_move_under_its_subtree(self):
+        self.food.parent = self.leafy
+        with self.assertRaises(ValidationError):
+            self.food.clean()
+
+    def test_sidebar_counts_include_subcategories(self):
+        self._product(self.leafy, 'bayam')
+        self._product(self.vegetables, 'wortel')
+        self._product(self.vegetables, 'layu', is_active=False)
+        self._product(self.tools, 'cangkul')
+
+        with self.assertNumQueries(1):
+            sidebar = Category.sidebar(max_depth=1)
+        self.assertEqual(sidebar, [self.food, self.tools])
+        food, tools = sidebar
+        self.assertEqual((food.product_count, tools.product_count), (2, 1))
+        self.assertEqual(food.sidebar_children, [self.vegetables])
+        self.assertEqual(food.sidebar_children[0].product_count, 2)
+        self.assertEqual(self.vegetables.get_total_product_count(), 2)
+
+    def test_rebuild_paths_repairs_queryset_moves(self):
+        Category.objects.filter(pk=self.vegetables.pk).update(parent=self.tools)
+        out = StringIO()
+        call_command('rebuild_category_paths', stdout=out)
+        self.assertIn("4 categories", out.getvalue())
+        self.leafy.refresh_from_db()
+        self.assertEqual(self.leafy.path, f'/{self.tools.pk}/{self.vegetables.pk}/{self.leafy.pk}/')
+
+
+class CategoryCounterTests(TestCase):
+    """Tests for the denormalized category product counters."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='countseller', password='TestPass123!')
+        cls.seller = Seller.objects.create(merchant=Merchant.objects.create(user=user), shop_name="Count Shop")
+        cls.food = Category.objects.create(name="Food", slug="food")
+        cls.vegetables = Category.objects.create(name="Vegetables", slug="vegetables", parent=cls.food)
+        cls.fruit = Category.objects.create(name="Fruit", slug="fruit", parent=cls.food)
+
+    def setUp(self):
+        cache.clear()
+
+    def _product(self, category, slug, is_active=True):
+        return Product.objects.create(
+            seller=self.seller, category=category, name=slug, slug=slug,
+            description="Test", price=Decimal('1000'), stock=1, is_active=is_active
+        )
+
+    def _counts(self, category):
+        category.refresh_from_db()
+        return category.active_product_count, category.total_product_count
+
+    def test_counters_follow_product_changes(self):
+        product = self._product(self.vegetables, 'wortel')
+        self._product(self.fruit, 'mangga', is_active=False)
+        self.assertEqual(self._counts(self.vegetables), (1, 1))
+        self.assertEqual(self._counts(self.food), (0, 1))
+        self.assertEqual(self._counts(self.fruit), (0, 0))
+
+        product.category = self.fruit
+        product.save()
+        self.assertEqual((self._counts(self.vegetables), self._counts(self.fruit)), ((0, 0), (1, 1)))
+
+        product.is_active = False
+        product.save()
+        self.assertEqual(self._counts(self.food), (0, 0))
+
+        product.is_active = True
+        product.save()
+        product.delete()
+        self.assertEqual((self._counts(self.fruit), self._counts(self.food)), ((0, 0), (0, 0)))
+
+    def test_moving_and_deleting_categories_recount_ancestors(self):
+        self._product(self.vegetables, 'wortel')
+        tools = Category.objects.create(name="Tools", slug="tools")
+        self.vegetables.parent = tools
+        self.vegetables.save()
+        self.assertEqual((self._counts(self.food), self._counts(tools)), ((0, 0), (0, 1)))
+
+        self.vegetables.delete()
+        self.assertEqual(self._counts(tools), (0, 0))
+
+    def test_reconcile_repairs_drift(self):
+        self._product(self.vegetables, 'wortel')
+        Product.objects.update(is_active=False)
+        out = StringIO()
+        call_command('reconcile_category_counts', stdout=out)
+        self.assertIn("2 categories", out.getvalue())
+        self.assertEqual((self._counts(self.vegetables), self._counts(self.food)), ((0, 0), (0, 0)))
+        self.assertEqual(Category.reconcile_product_counts(), 0)
+
+    def test_sidebar_is_one_cache_read(self):
+        self._product(self.vegetables, 'wortel')
+        self.assertEqual(category_sidebar.get()[0].product_count, 1)
+        with self.assertNumQueries(0):
+            food, = category_sidebar.get()
+        self.assertEqual([child.name for child in food.sidebar_children], ["Vegetables", "Fruit"])
+
+        # Count changes drop the cached sidebar
+        self._product(self.fruit, 'mangga')
+        self.assertEqual(category_sidebar.get()[0].product_count, 2)
+
+class FacetSearchTests(TestCase):
+    """Tests for the facet counts of the product list."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='facetseller', password='TestPass123!')
+        cls.seller = Seller.objects.create(merchant=Merchant.objects.create(user=user), shop_name="Facet Shop")
+        other_user = User.objects.create_user(username='facetother', password='TestPass123!')
+        cls.other_seller = Seller.objects.create(merchant=Merchant.objects.create(user=other_user), shop_name="Other Shop")
+        cls.food = Category.objects.create(name="Food", slug="food")
+        cls.vegetables = Category.objects.create(name="Vegetables", slug="vegetables", parent=cls.food)
+        cls.tools = Category.objects.create(name="Tools", slug="tools")
+
+        for slug, seller, category, price, stock, rating in (
+            ('wortel', cls.seller, cls.vegetables, '5', 10, '4.5'),
+            ('tomat', cls.seller, cls.vegetables, '20', 0, '3.2'),
+            ('beras', cls.other_seller, cls.food, '60', 5, '0'),
+            ('cangkul', cls.other_seller, cls.tools, '750', 1, '4.0'),
+        ):
+            Product.objects.create(
+                seller=seller, category=category, name=slug.title(), slug=slug, description="Test",
+                price=Decimal(price), stock=stock, average_rating=Decimal(rating)
+            )
+
+    def _search(self, **params):
+        return FacetedProductSearch(ProductSearchForm(params))
+
+    def test_counts_ignore_their_own_filter_only(self):
+        search = self._search(category=self.food.pk, min_price='10', max_price='49.99')
+        self.assertEqual([product.slug for product in search.products()], ['tomat'])
+
+        facets = search.facets()
+        # Other price buckets are counted within the category
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [1, 1, 1, 0, 0, 0])
+        self.assertEqual([bucket['selected'] for bucket in facets['price']], [False, True, False, False, False, False])
+        # Other categories are counted within the price range
+        food, = facets['categories']
+        self.assertEqual((food['name'], food['count'], food['selected']), ("Food", 1, True))
+        self.assertEqual([(child['name'], child['count'], child['selected']) for child in food['children']], [("Vegetables", 1, False)])
+        self.assertEqual(facets['in_stock']['count'], 0)
+        self.assertEqual([(seller['name'], seller['count']) for seller in facets['sellers']], [("Facet Shop", 1)])
+
+    def _category_counts(self, facets):
+        return [
+            (bucket['name'], bucket['count'], [(child['name'], child['count']) for child in bucket['children']])
+            for bucket in facets['categories']
+        ]
+
+    def test_category_counts_roll_up_to_ancestors(self):
+        facets = self._search(min_rating='4').facets()
+        self.assertEqual(
+            self._category_counts(facets),
+            [("Food", 1, [("Vegetables", 1)]), ("Tools", 1, [])]
+        )
+
+        facets = self._search().facets()
+        self.assertEqual(
+            self._category_counts(facets),
+            [("Food", 3, [("Vegetables", 2)]), ("Tools", 1, [])]
+        )
+        self.assertEqual([band['count'] for band in facets['rating']], [2, 3, 3, 3])
+        self.assertEqual(facets['in_stock']['count'], 3)
+
+    def test_selected_facets_filter_the_products(self):
+        search = self._search(seller=str(self.other_seller.pk), min_rating='4', in_stock='1')
+        self.assertEqual([product.slug for product in search.products()], ['cangkul'])
+        facets = search.facets()
+        self.assertTrue(facets['in_stock']['selected'])
+        self.assertEqual([band['selected'] for band in facets['rating']], [True, False, False, False])
+        self.assertEqual(
+            [(seller['name'], seller['count'], seller['selected']) for seller in facets['sellers']],
+            [("Facet Shop", 1, False), ("Other Shop", 1, True)]
+        )
+
+    def test_facets_take_a_fixed_number_of_queries(self):
+        search = self._search(query='a', category=self.food.pk, min_rating='1')
+        # The bucket aggregate, the categories, their names and the sellers
+        with self.assertNumQueries(4):
+            search.facets()
+
+    def test_unfiltered_category_counts_come_from_the_sidebar(self):
+        category_sidebar.invalidate()
+        category_sidebar.get()
+        search = self._search(category=self.vegetables.pk)
+        # The bucket aggregate and the sellers
+        with self.assertNumQueries(2):
+            facets = search.facets()
+        food, tools = facets['categories']
+        self.assertEqual((food['count'], food['selected'], tools['count']), (3, False, 1))
+        self.assertEqual([(child['name'], child['selected']) for child in food['children']], [("Vegetables", True)])
+
+    def test_product_list_renders_the_filtered_category_counts(self):
+        response = self.client.get(
+            reverse('marketplace:product_list'),
+            {'category': self.tools.pk, 'min_price': '50', 'max_price': '99.99'}
+        )
+        self.assertEqual(self._category_counts(response.context['facets']), [("Food", 1, [])])
+        self.assertContains(response, f'?category={self.food.pk}&amp;min_price=50&amp;max_price=99.99')
+
+
+
+class AutocompleteTests(TestCase):
+    """Tests for the search box autocomplete."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='suggestseller', password='TestPass123!')
+        cls.seller = Seller.objects.create(merchant=Merchant.objects.create(user=user), shop_name="Tomato Farm")
+        cls.category = Category.objects.create(name="Tomatoes", slug="tomatoes")
+        cls.tomato = Product.objects.create(
+            seller=cls.seller, category=cls.category, name="Tomat Merah", slug="tomat-merah",
+            description="Test", price=Decimal('12000'), stock=10
+        )
+        Product.objects.create(
+            seller=cls.seller, category=cls.category, name="Tomat Hijau", slug="tomat-hijau",
+            description="Test", price=Decimal('9000'), stock=10, is_active=False
+        )
+
+    def setUp(self):
+        product_autocomplete.prefixes.clear()
+
+    @skipIf(connection.vendor == 'postgresql', "Trigram matching replaces prefix matching on PostgreSQL")
+    def test_prefix_matches_products_shops_and_categories(self):
+        suggestions = product_autocomplete.suggest("  TOM ")
+        self.assertEqual(
+            [(suggestion['kind'], suggestion['label']) for suggestion in suggestions],
+            [('product', "Tomat Merah"), ('shop', "Tomato Farm"), ('category', "Tomatoes")]
+        )
+        self.assertEqual(suggestions[0]['url'], reverse('marketplace:product_detail', args=[self.tomato.pk, 'tomat-merah']))
+        self.assertEqual(suggestions[1]['url'], f"{reverse('marketplace:product_list')}?seller={self.seller.pk}")
+        self.assertEqual(product_autocomplete.suggest("t"), [])
+
+    @skipIf(connection.vendor == 'postgresql', "Trigram matching replaces prefix matching on PostgreSQL")
+    def test_hot_prefixes_are_served_from_the_cache(self):
+        product_autocomplete.suggest("tomat")
+        product_autocomplete.suggest("tomato")
+        with self.assertNumQueries(0):
+            self.assertEqual(len(product_autocomplete.suggest("Tomat")), 3)
+
+        # Saves in this process drop the prefixes suggesting the product, and only those
+        self.tomato.name = "Tomat Ceri"
+        self.tomato.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(len(product_autocomplete.suggest("tomato")), 2)
+        self.assertEqual(product_autocomplete.suggest("tomat")[0]['label'], "Tomat Ceri")
+
+    def test_new_and_renamed_objects_show_up_in_hot_prefixes(self):
+        self.assertEqual(product_autocomplete.suggest("bayam"), [])
+        product_autocomplete.suggest("cangkul")
+
+        Product.objects.create(
+            seller=self.seller, category=self.category, name="Bayam Hijau", slug="bayam-hijau",
+            description="Test", price=Decimal('5000'), stock=10
+        )
+        self.assertEqual([suggestion['label'] for suggestion in product_autocomplete.suggest("bayam")], ["Bayam Hijau"])
+        # Prefixes the label doesn't answer stay cached
+        with self.assertNumQueries(0):
+            product_autocomplete.suggest("cangkul")
+
+        self.tomato.name = "Bayam Merah"
+        self.tomato.save()
+        self.assertEqual(
+            [suggestion['label'] for suggestion in product_autocomplete.suggest("bayam")],
+            ["Bayam Hijau", "Bayam Merah"]
+        )
+
+    def test_stock_and_rating_saves_keep_the_suggestions(self):
+        with patch.object(product_autocomplete, 'refresh') as refresh:
+            # What checkout and reviews save
+            self.tomato.stock -= 1
+            self.tomato.average_rating = Decimal('4.50')
+            self.tomato.save()
+            self.seller.rating = Decimal('4.50')
+            self.seller.save()
+            refresh.assert_not_called()
+
+            self.tomato.is_active = False
+            self.tomato.save()
+            refresh.assert_called_once_with('product', pk=self.tomato.pk)
+
+    def test_prefix_cache_is_bounded_lru(self):
+        prefixes = PrefixCache(size=2, timeout=60)
+        prefixes.set('to', ['a'])
+        prefixes.set('tom', ['b'])
+        prefixes.get('to')
+        prefixes.set('toma', ['c'])
+        self.assertEqual((prefixes.get('to'), prefixes.get('tom'), prefixes.get('toma')), (['a'], None, ['c']))
+        self.assertEqual(len(prefixes), 2)
+
+        expired = PrefixCache(size=2, timeout=-1)
+        expired.set('to', ['a'])
+        self.assertIsNone(expired.get('to'))
+
+    def test_prefix_cache_drops_the_prefixes_suggesting_an_object(self):
+        prefixes = PrefixCache(size=4, timeout=60)
+        prefixes.set('tom', ['a'], [('product', '1'), ('shop', '2')])
+        prefixes.set('bera', ['b'], [('product', '3')])
+        prefixes.discard([('shop', '2')])
+        self.assertEqual((prefixes.get('tom'), prefixes.get('bera')), (None, ['b']))
+
+        # And the prefixes a new label answers
+        prefixes.set('mer', [])
+        prefixes.set('bay', [])
+        prefixes.discard([], texts=product_autocomplete.word_starts("Beras  Merah"))
+        self.assertEqual((prefixes.get('bera'), prefixes.get('mer'), prefixes.get('bay')), (None, None, []))
+
+    @skipIf(connection.vendor == 'postgresql', "Trigram matching replaces prefix matching on PostgreSQL")
+    def test_endpoint_returns_cacheable_json(self):
+        response = self.client.get(reverse('marketplace:search_autocomplete'), {'q': 'tomato'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['query'], 'tomato')
+        self.assertEqual([suggestion['label'] for suggestion in response.json()['suggestions']], ["Tomato Farm", "Tomatoes"])
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_trigram_lookup_uses_word_similarity(self):
+        sql, params = postgres_sql(product_autocomplete.similar("tomta"))
+        # The operator is escaped for the driver's parameter style
+        self.assertIn('"marketplace_searchsuggestion"."label" %%> %s', sql)
+        self.assertIn('WORD_SIMILARITY(', sql.upper())
+        self.assertIn('DESC', sql)
+
+    @skipIf(connection.vendor == 'postgresql', "Suggestions are stored on PostgreSQL")
+    def test_suggestions_are_not_stored_without_postgresql(self):
+        self.assertEqual(product_autocomplete.refresh('product'), 0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_search_suggestions')
+
+    @skipUnless(connection.vendor == 'postgresql', "Trigram autocomplete needs PostgreSQL")
+    def test_trigram_suggestions_match_typos_by_similarity(self):
+        for name in ("Cangkulan Besi", "Cangkul Baja"):
+            Product.objects.create(
+                seller=self.seller, category=self.category, name=name, slug=slugify(name),
+                description="Test", price=Decimal('50000'), stock=3
+            )
+        out = StringIO()
+        call_command('rebuild_search_suggestions', stdout=out)
+        # Three active products, the shop and the category
+        self.assertIn("Rebuilt 5 search suggestions", out.getvalue())
+
+        # The exact word ranks above a longer word containing it
+        self.assertEqual(
+            [suggestion['label'] for suggestion in product_autocomplete.suggest("cangkul")],
+            ["Cangkul Baja", "Cangkulan Besi"]
+        )
+        # A misspelled word still finds the product
+        self.assertEqual(product_autocomplete.suggest("cangkull")[0]['label'], "Cangkul Baja")
+        # Inactive products are not suggested
+        self.assertNotIn("Tomat Hijau", [suggestion['label'] for suggestion in product_autocomplete.suggest("tomat hijau")])
@@ -21,6 +21,7 @@ urlpatterns = [
     
     # Products and browsing
     path('products/', views.product_list, name='product_list'),
+    path('products/autocomplete/', views.search_autocomplete, name='search_autocomplete'),
     path('product/<uuid:product_id>/<slug:slug>/', views.product_detail, name='product_detail'),
     path('store/<int:seller_id>/', views.store_detail, name='store_detail'),
     
@@ -9,6 +9,7 @@ from django.db.models import Q, Count, Avg
 from django.core.paginator import Paginator
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from datetime import timedelta
 from decimal import Decimal
 from django.db import models
@@ -23,6 +24,8 @@ from .forms import (
     ProductImageFormSet, BuyerForm, MerchantForm, CartAddProductForm,
     ShippingAddressForm, ProductSearchForm
 )
+from .autocomplete import product_autocomplete
+from .facets import FacetedProductSearch
 
 
 from django.contrib.auth.decorators import login_required
@@ -286,76 +289,9 @@ def delete_product(request, product_id):
 
 def product_list(request):
     form = ProductSearchForm(request.GET)
-    products = Product.objects.filter(is_active=True).select_related('seller', 'category').prefetch_related('images')
-    
-    if form.is_valid():
-        query = form.cleaned_data.get('query')
-        category_id = form.cleaned_data.get('category')
-        min_price = form.cleaned_data.get('min_price')
-        max_price = form.cleaned_data.get('max_price')
-        sort_by = form.cleaned_data.get('sort_by')
-        
-        if query:
-            products = products.filter(
-                Q(name__icontains=query) | 
-                Q(description__icontains=query) |
-                Q(seller__shop_name__icontains=query)
-            )
-        
-        if category_id:
-            category = get_object_or_404(Category, id=category_id)
-            # Get all subcategories
-            subcategories = category.get_descendants(include_self=True)
-            products = products.filter(category__in=subcategories)
-        
-        if min_price is not None:
-            products = products.filter(price__gte=min_price)
-            
-        if max_price is not None:
-            products = products.filter(price__lte=max_price)
-            
-        if sort_by == 'price_asc':
-            products = products.order_by('price')
-        elif sort_by == 'price_desc':
-            products = products.order_by('-price')
-        elif sort_by == 'newest':
-            products = products.order_by('-created_at')
-        elif sort_by == 'rating':
-            products = products.order_by('-average_rating')
-    else:
-        # Default sorting
-        products = products.order_by('-created_at')
-    
-    # # Get all categories for the sidebar
-    # categories = Category.objects.filter(parent=None).annotate(product_count=Count('products'))
+    search = FacetedProductSearch(form)
+    products = search.products()
 
-    from collections import defaultdict
-
-    def get_all_descendants(category):
-        descendants = []
-        children = category.children.all()
-        for child in children:
-            descendants.append(child)
-            descendants.extend(get_all_descendants(child))
-        return descendants
-
-
-    def get_total_product_count(category):
-        # Get this category and all its descendants
-        descendant_categories = [category] + get_all_descendants(category)
-        descendant_ids = [cat.id for cat in descendant_categories]
-        return Product.objects.filter(category_id__in=descendant_ids, is_active=True).count()
-
-    # Get top-level categories
-    categories = Category.objects.filter(parent=None).prefetch_related('children__children')
-
-    # Attach total product count manually
-    for cat in categories:
-        cat.product_count = get_total_product_count(cat)
-        for child in cat.children.all():
-            child.product_count = get_total_product_count(child)
-
-    
     # Pagination
     paginator = Paginator(products, 12)  # 12 products per page
     page_number = request.GET.get('page')
@@ -364,12 +300,21 @@ def product_list(request):
     context = {
         'page_obj': page_obj,
         'form': form,
-        'categories': categories,
+        'facets': search.facets(),
     }
     
     return render(request, 'marketplace/product_list.html', context)
 
 
+def search_autocomplete(request):
+    """Search box suggestions for the text typed so far, as JSON"""
+    query = request.GET.get('q', '')
+    response = JsonResponse({'query': query, 'suggestions': product_autocomplete.suggest(query)})
+    # Suggestions are the same for everyone
+    patch_cache_control(response, public=True, max_age=product_autocomplete.timeout())
+    return response
+
+
 def product_detail(request, product_id, slug):
     product = get_object_or_404(
         Product, 